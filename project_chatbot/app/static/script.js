@@ -21,9 +21,21 @@
   if (!form || !win || !input) return;
 
   const sendUrl = form.dataset.sendUrl;
+  const streamUrl = form.dataset.streamUrl;
   const resetUrl = form.dataset.resetUrl;
+  const historyUrl = win.dataset.historyUrl;
   //if (!sendUrl) return; // not chatbot page, so don't run ajax chat here
 
+  // Only the last messages are rendered by the server; ids of the shown messages
+  const knownIds = new Set();
+  let oldestId = null;
+  let newestId = 0;
+  let hasMore = win.dataset.hasMore === 'true';
+  let loadingOlder = false;
+  let sending = false;
+  win.querySelectorAll('.bubble[data-id]').forEach((el) => remember(Number(el.dataset.id)));
+  scrollToBottom();
+
   // 1) Auto focus
   input.focus();
 
@@ -42,36 +54,111 @@
     const text = (input.value || '').trim();
     if (!text) return;
 
-    // show user message immediately
-    addBubble('user', text);
+    // show user message immediately (pending until the server returns its id)
+    const userMsg = addBubble('user', text, true);
 
     input.value = '';
     input.disabled = true;
+    sending = true;
     typing && typing.classList.remove('hidden');
 
     try {
-      const res = await fetch(sendUrl, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: text })
-      });
-
-      const data = await res.json();
-
-      if (!data.ok) {
-        addBubble('bot', 'Error: message could not be sent.');
+      if (streamUrl && window.ReadableStream && window.TextDecoder) {
+        await sendStreaming(text, userMsg);
       } else {
-        addBubble('bot', data.bot.text);
+        await sendJson(text, userMsg);
       }
     } catch (err) {
-      addBubble('bot', 'Network error.');
+      addBubble('bot', 'Network error.', true);
     } finally {
+      sending = false;
       typing && typing.classList.add('hidden');
       input.disabled = false;
       input.focus();
     }
   });
 
+  async function sendJson(text, userMsg) {
+    const res = await fetch(sendUrl, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ message: text })
+    });
+
+    const data = await res.json();
+
+    if (!data.ok) {
+      addBubble('bot', 'Error: message could not be sent.');
+    } else {
+      confirmBubble(userMsg, data.user.id);
+      confirmBubble(addBubble('bot', data.bot.text), data.bot.id);
+    }
+  }
+
+  // Tokens per Server-Sent Events lesen und an die Bot-Blase anhängen
+  async function sendStreaming(text, userMsg) {
+    const res = await fetch(streamUrl, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify({ message: text })
+    });
+
+    if (!res.ok || !res.body) {
+      addBubble('bot', 'Error: message could not be sent.');
+      return;
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let msg = null;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        const evt = parseEvent(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+        if (!evt) continue;
+
+        if (evt.event === 'done') {
+          if (msg) {
+            msg.textContent = evt.data.text;
+          } else {
+            msg = addBubble('bot', evt.data.text);
+          }
+          confirmBubble(userMsg, evt.data.user_id);
+          confirmBubble(msg, evt.data.id);
+        } else if (evt.data.token) {
+          if (!msg) {
+            typing && typing.classList.add('hidden');
+            msg = addBubble('bot', '', true);
+          }
+          msg.textContent += evt.data.token;
+          scrollToBottom();
+        }
+      }
+    }
+  }
+
+  function parseEvent(chunk) {
+    let event = 'message';
+    const data = [];
+    chunk.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+    });
+    if (!data.length) return null;
+    try {
+      return { event, data: JSON.parse(data.join('\n')) };
+    } catch (e) {
+      return null;
+    }
+  }
+
   // 4) Reset button clears session + reloads page
   if (resetBtn) {
     resetBtn.addEventListener('click', async () => {
@@ -84,7 +171,90 @@
     });
   }
 
-  function addBubble(role, text) {
+  // Older messages when scrolled to the top (cursor: id of the oldest shown message)
+  async function loadOlder() {
+    if (!historyUrl || !hasMore || loadingOlder || oldestId === null) return;
+    loadingOlder = true;
+    try {
+      const res = await fetch(`${historyUrl}?before=${oldestId}`);
+      const data = await res.json();
+      if (!data.ok) return;
+      hasMore = data.has_more;
+      const height = win.scrollHeight;
+      win.insertBefore(renderMessages(data.messages), win.querySelector('.bubble[data-id]'));
+      // keep the visible messages in place
+      win.scrollTop += win.scrollHeight - height;
+    } catch (e) {
+      // try again on the next scroll
+    } finally {
+      loadingOlder = false;
+    }
+  }
+
+  // After a reconnect only the messages newer than the last shown one are loaded
+  async function loadTail() {
+    if (!historyUrl || sending) return;
+    try {
+      const res = await fetch(`${historyUrl}?after=${newestId}`);
+      const data = await res.json();
+      if (!data.ok || !data.messages.length) return;
+      // bubbles of an interrupted send are replaced by the stored messages
+      win.querySelectorAll('.bubble.pending').forEach((el) => el.remove());
+      win.appendChild(renderMessages(data.messages));
+      scrollToBottom();
+    } catch (e) {
+      // still offline
+    }
+  }
+
+  win.addEventListener('scroll', () => {
+    if (win.scrollTop < 80) loadOlder();
+  }, { passive: true });
+  window.addEventListener('online', loadTail);
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'visible') loadTail();
+  });
+
+  function remember(id) {
+    knownIds.add(id);
+    oldestId = oldestId === null ? id : Math.min(oldestId, id);
+    newestId = Math.max(newestId, id);
+  }
+
+  // All bubbles in one fragment: a single DOM insert and layout
+  function renderMessages(messages) {
+    const fragment = document.createDocumentFragment();
+    messages.forEach((m) => {
+      if (knownIds.has(m.id)) return;
+      const role = m.role === 'user' ? 'user' : 'bot';
+      const { wrap } = buildBubble(role, m.text, role === 'user' ? 'user' : 'ki');
+      wrap.dataset.id = m.id;
+      remember(m.id);
+      fragment.appendChild(wrap);
+    });
+    return fragment;
+  }
+
+  function confirmBubble(msg, id) {
+    if (!msg || !id) return;
+    const wrap = msg.closest('.bubble');
+    wrap.dataset.id = id;
+    wrap.classList.remove('pending');
+    remember(id);
+  }
+
+  // Scroll at most once per frame instead of forcing a layout for every token
+  let scrollScheduled = false;
+  function scrollToBottom() {
+    if (scrollScheduled) return;
+    scrollScheduled = true;
+    requestAnimationFrame(() => {
+      scrollScheduled = false;
+      win.scrollTop = win.scrollHeight;
+    });
+  }
+
+  function buildBubble(role, text, metaText) {
     const wrap = document.createElement('div');
     wrap.className = role === 'user' ? 'bubble user' : 'bubble bot with-avatar';
 
@@ -106,12 +276,20 @@
 
     const meta = document.createElement('div');
     meta.className = 'meta';
-    meta.textContent = new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    meta.textContent = metaText;
 
     body.appendChild(msg);
     body.appendChild(meta);
     wrap.appendChild(body);
+    return { wrap, msg };
+  }
+
+  function addBubble(role, text, pending) {
+    const time = new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    const { wrap, msg } = buildBubble(role, text, time);
+    if (pending) wrap.classList.add('pending');
     win.appendChild(wrap);
-    win.scrollTop = win.scrollHeight;
+    scrollToBottom();
+    return msg;
   }
 })();
@@ -0,0 +1,122 @@
+"""Benchmark: gleichzeitige Chats über den synchronen (WSGI) und den asynchronen (ASGI) Pfad.
+
+Ein lokaler Mock-Upstream antwortet mit künstlicher Verzögerung. Der synchrone Pfad
+wird mit einer festen Anzahl Worker-Threads gemessen, der asynchrone Pfad in einem
+einzigen Thread (eine Event-Loop).
+
+Start: `python benchmarks/bench_async_chat.py --chats 200 --latency 0.5 --workers 8`
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+def setup(args):
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+    os.environ['OPEN_AI_API_SECRET'] = 'bench'
+    os.environ['OPEN_AI_BASE_URL'] = f'http://127.0.0.1:{args.port}/v1'
+    os.environ['OPEN_AI_POOL_SIZE'] = str(args.workers)
+    os.environ['OPEN_AI_ASYNC_POOL_SIZE'] = str(args.chats)
+    os.environ['CHAT_MAX_PER_USER'] = str(args.chats)
+    os.environ['CHAT_MAX_PER_CHATBOT'] = str(args.chats)
+
+    import mock_llm
+    server = mock_llm.make_server(port=args.port, latency=args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from main import create_app
+    from db import ChatBot, User, create_database, db
+    from utils import hash_password
+
+    app = create_app()
+    with app.app_context():
+        create_database()
+        user = User(username='bench', password=hash_password('bench'))
+        db.session.add(user)
+        db.session.flush()
+        chatbot = ChatBot(user_id=user.id, name='bench', systemprompt='Du bist ein Test-Bot.')
+        db.session.add(chatbot)
+        db.session.commit()
+        chatbot_id = chatbot.id
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+    return app, chatbot_id, cookie
+
+
+def run_sync(app, chatbot_id, cookie, chats, workers):
+    def one(i):
+        client = app.test_client()
+        client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+        r = client.post(f'/cb/{chatbot_id}/send_json', json={'message': f'Frage {i}'})
+        return r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(one, range(chats)))
+    return time.perf_counter() - start, statuses
+
+
+def run_async(chatbot_id, cookie, chats):
+    from asgi import application
+
+    async def one(i):
+        body = json.dumps({'message': f'Frage {i}'}).encode('utf-8')
+        scope = {
+            'type': 'http', 'method': 'POST', 'path': f'/cb/{chatbot_id}/send_json',
+            'headers': [(b'cookie', f'session={cookie}'.encode()), (b'content-type', b'application/json')],
+        }
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        return sent[0]['status']
+
+    async def main():
+        return await asyncio.gather(*(one(i) for i in range(chats)))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(main())
+    return time.perf_counter() - start, statuses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chats', type=int, default=200, help='gleichzeitige Chat-Anfragen')
+    parser.add_argument('--latency', type=float, default=0.5, help='Verzögerung des Mock-Upstreams in Sekunden')
+    parser.add_argument('--workers', type=int, default=8, help='Worker-Threads für den synchronen Pfad')
+    parser.add_argument('--port', type=int, default=8097)
+    args = parser.parse_args()
+
+    app, chatbot_id, cookie = setup(args)
+
+    results = {}
+    for name, run in (
+        ('sync', lambda: run_sync(app, chatbot_id, cookie, args.chats, args.workers)),
+        ('async', lambda: run_async(chatbot_id, cookie, args.chats)),
+    ):
+        seconds, statuses = run()
+        ok = sum(1 for s in statuses if s == 200)
+        results[name] = {
+            'seconds': round(seconds, 3),
+            'ok': ok,
+            'chats_per_second': round(ok / seconds, 1),
+        }
+        print(f"{name:5}: {args.chats} Chats in {seconds:.2f}s ({ok} ok, {ok / seconds:.1f} Chats/s)")
+
+    print(json.dumps({'chats': args.chats, 'latency': args.latency, 'workers': args.workers, 'results': results}))
@@ -0,0 +1,107 @@
+"""Benchmark: gleichzeitiges Schreiben (Chat-Nachrichten) und Lesen (Katalog) auf SQLite.
+
+Vergleicht die Standard-Einstellungen von SQLite mit WAL, `synchronous=NORMAL`,
+Busy-Timeout und mmap (siehe `db.sqlite_pragmas`). Gemessen werden Operationen pro
+Sekunde und Fehler wie "database is locked".
+
+Start: `python benchmarks/bench_db.py --writers 4 --readers 4 --seconds 5`
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from flask import Flask  # noqa: E402
+
+from db import ChatBot, Conversation, Message, User, create_database, db, init_db  # noqa: E402
+
+
+def make_app(tuned: bool, bots: int):
+    tmp = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp}/bench.db'
+    if not tuned:
+        # stock SQLite: rollback journal, the driver's default lock wait of 5 s, no mmap
+        app.config.update(SQLITE_WAL=False, SQLITE_BUSY_TIMEOUT=5000, SQLITE_MMAP_SIZE=0)
+    init_db(app)
+
+    with app.app_context():
+        create_database()
+        admin = User.query.filter_by(username='admin').first()
+        chatbots = [ChatBot(user_id=admin.id, name=f'Bot {i}', systemprompt='x' * 500) for i in range(bots)]
+        db.session.add_all(chatbots)
+        db.session.flush()
+        conversation = Conversation(chatbot_id=chatbots[0].id, user_id=admin.id)
+        db.session.add(conversation)
+        db.session.commit()
+        return app, admin.id, conversation.id
+
+
+def run(app, user_id, conversation_id, writers, readers, seconds):
+    stop = time.perf_counter() + seconds
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    db.session.add(Message(conversation_id=conversation_id, role='user', text='Hallo ' * 20))
+                    db.session.commit()
+                    count('writes')
+                except Exception:
+                    db.session.rollback()
+                    count('errors')
+
+    def reader():
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    (ChatBot.query.filter(ChatBot.user_id == user_id)
+                     .order_by(ChatBot.created.desc(), ChatBot.id.desc()).limit(50).all())
+                    Message.query.filter_by(conversation_id=conversation_id).order_by(Message.id.desc()).limit(50).all()
+                    db.session.rollback()
+                    count('reads')
+                except Exception:
+                    db.session.rollback()
+                    count('errors')
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'writes_per_second': round(counts['writes'] / seconds, 1),
+        'reads_per_second': round(counts['reads'] / seconds, 1),
+        'errors': counts['errors'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--bots', type=int, default=500)
+    args = parser.parse_args()
+
+    results = {}
+    for name, tuned in (('stock', False), ('tuned', True)):
+        app, user_id, conversation_id = make_app(tuned, args.bots)
+        results[name] = run(app, user_id, conversation_id, args.writers, args.readers, args.seconds)
+        with app.app_context():
+            db.engine.dispose()
+        print(f"{name:5}: {results[name]}")
+
+    print(json.dumps({'writers': args.writers, 'readers': args.readers, 'results': results}))
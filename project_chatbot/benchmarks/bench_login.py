@@ -0,0 +1,72 @@
+"""Benchmark: Login-Durchsatz mit dem Passwort-Pool und unter Credential-Stuffing.
+
+Misst erfolgreiche Logins pro Sekunde mit mehreren Request-Threads und, wie schnell
+eine Welle falscher Passwörter für einen Benutzernamen von der Drosselung
+abgewiesen wird (ohne einen Hash zu berechnen).
+
+Start: `python benchmarks/bench_login.py --logins 50 --workers 8`
+Mit `PASSWORD_WORKERS=0` läuft das Hashing zum Vergleich in den Request-Threads.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+def setup():
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+    # the benchmark logs in many times from one address
+    os.environ.setdefault('LOGIN_MAX_PER_IP', '1000000')
+
+    import main
+    from db import User, create_database, db
+    from utils import hash_password
+
+    app = main.create_app()
+    with app.app_context():
+        create_database()
+        db.session.add(User(username='bench', password=hash_password('bench')))
+        db.session.add(User(username='victim', password=hash_password('geheim')))
+        db.session.commit()
+    return main, app
+
+
+def run(app, count, workers, username, password):
+    def one(i):
+        client = app.test_client()
+        return client.post('/login', data={'username': username, 'password': password}).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(one, range(count)))
+    return time.perf_counter() - start, statuses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=50, help='Anzahl erfolgreicher Logins')
+    parser.add_argument('--attacks', type=int, default=500, help='Anzahl falscher Passwörter für einen Benutzer')
+    parser.add_argument('--workers', type=int, default=8, help='gleichzeitige Request-Threads')
+    args = parser.parse_args()
+
+    main, app = setup()
+    results = {'password_workers': main.password_pool.workers}
+
+    seconds, statuses = run(app, args.logins, args.workers, 'bench', 'bench')
+    ok = statuses.count(302)
+    results['login'] = {'seconds': round(seconds, 3), 'ok': ok, 'per_second': round(ok / seconds, 1)}
+    print(f"login : {args.logins} Logins in {seconds:.2f}s ({ok} ok, {ok / seconds:.1f}/s)")
+
+    seconds, statuses = run(app, args.attacks, args.workers, 'victim', 'falsch')
+    refused = statuses.count(429)
+    results['stuffing'] = {'seconds': round(seconds, 3), 'attempts': args.attacks, 'throttled': refused}
+    print(f"attack: {args.attacks} Versuche in {seconds:.2f}s ({refused} gedrosselt)")
+
+    main.password_pool.shutdown()
+    print(json.dumps(results))
@@ -0,0 +1,94 @@
+"""Benchmark: Katalog-Rendering mit vielen Chatbots.
+
+Misst
+- das Kompilieren der Templates in einem frischen Worker ohne und mit Bytecode-Cache,
+- `/catalog` (Admin, alle Chatbots auf einer Seite) ohne und mit Cache der gerenderten Zeilen.
+
+Start: `python benchmarks/bench_render.py --bots 5000 --requests 20`
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+def setup(args):
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp, 'jinja_cache')
+    os.environ['CATALOG_PAGE_SIZE'] = str(args.bots)
+
+    import main
+    from db import ChatBot, User, create_database, db
+
+    app = main.create_app()
+    with app.app_context():
+        create_database()
+        admin = User.query.filter_by(username='admin').first()
+        db.session.add_all(
+            ChatBot(user_id=admin.id, name=f'Bot {i}', systemprompt='Du bist ein hilfreicher Assistent. ' * 10,
+                    welcomemessage='Hallo!')
+            for i in range(args.bots)
+        )
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'hss'})
+    return main, app, client
+
+
+def compile_templates(app, bytecode_cache):
+    from jinja2 import Environment
+
+    env = Environment(loader=app.jinja_loader, bytecode_cache=bytecode_cache)
+    start = time.perf_counter()
+    for name in ('catalog.html', 'catalog_rows.html', 'chat.html', 'chatbot_form.html'):
+        env.get_template(name)
+    return time.perf_counter() - start
+
+
+def timed_requests(client, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get('/catalog')
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bots', type=int, default=5000, help='Anzahl Chatbots im Katalog')
+    parser.add_argument('--requests', type=int, default=20, help='Aufrufe von /catalog pro Messung')
+    args = parser.parse_args()
+
+    main, app, client = setup(args)
+    from jinja2 import FileSystemBytecodeCache
+    from response_cache import make_cache
+
+    results = {'bots': args.bots}
+    bytecode_cache = FileSystemBytecodeCache(os.environ['JINJA_CACHE_DIR'])
+    compile_templates(app, bytecode_cache)  # fill the cache
+    results['compile_ms'] = {
+        'without_bytecode_cache': round(compile_templates(app, None) * 1000, 2),
+        'with_bytecode_cache': round(compile_templates(app, bytecode_cache) * 1000, 2),
+    }
+
+    catalog_cache = main.catalog_cache
+    main.catalog_cache = make_cache('off', ttl=0, max_entries=0)
+    results['catalog_uncached'] = timed_requests(client, args.requests)
+    main.catalog_cache = catalog_cache
+    results['catalog_cached'] = timed_requests(client, args.requests)
+
+    for name, value in results.items():
+        print(f"{name}: {value}")
+    print(json.dumps(results))
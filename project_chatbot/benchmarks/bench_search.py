@@ -0,0 +1,131 @@
+"""Benchmark: Katalogsuche über viele Chatbots.
+
+Befüllt eine frische Datenbank mit `--bots` Chatbots (Namen, Prompts, Willkommens-
+Nachrichten aus einem künstlichen Wortschatz) und Text-Abschnitten für einen Teil
+davon. Die Volltext-Indizes füllen sich dabei über die Trigger. Gemessen wird die
+Suche für seltene und häufige Wörter, Präfixe, mehrere Wörter, mit Filter und auf
+der zweiten Seite; zum Vergleich dieselben Suchen ohne Index (LIKE).
+
+Start: `python benchmarks/bench_search.py --bots 100000`
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from bench_suite import vocabulary, words  # noqa: E402
+
+# in the prompt of every second chatbot / in the name of every 10000th
+COMMON_WORD = 'assistent'
+RARE_WORD = 'zebrafisch'
+
+
+def setup(args):
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp, 'jinja_cache')
+    os.environ['JOB_WORKERS'] = '0'
+
+    from sqlalchemy import insert
+
+    import main
+    from db import ChatBot, ChatBotTextChunk, ChatBotTextFile, User, create_database, db, display_fields
+    from utils import generate_id, hash_password, utcnow
+
+    rng = random.Random(args.seed)
+    vocab = vocabulary(rng)
+    app = main.create_app()
+    start = time.perf_counter()
+    with app.app_context():
+        create_database()
+        password = hash_password('bench')
+        users = [{'id': generate_id(), 'username': f'bench{i}', 'password': password} for i in range(args.users)]
+        db.session.execute(insert(User), users)
+
+        for offset in range(0, args.bots, 5000):
+            chatbots, files, chunks = [], [], []
+            for i in range(offset, min(offset + 5000, args.bots)):
+                created = utcnow()
+                systemprompt = words(rng, vocab, 40) + (f' {COMMON_WORD}' if i % 2 == 0 else '')
+                name = words(rng, vocab, 2) + (f' {RARE_WORD}' if i % 10000 == 0 else '')
+                chatbots.append({
+                    'id': generate_id(), 'user_id': users[i % len(users)]['id'], 'name': name,
+                    'systemprompt': systemprompt, 'welcomemessage': words(rng, vocab, 8), 'version': 1,
+                    'created': created, **display_fields(systemprompt, created),
+                })
+                if i % args.file_every == 0:
+                    files.append({'id': generate_id(), 'chatbot_id': chatbots[-1]['id'], 'filename': 'doc.txt',
+                                  'content': '', 'created': created})
+                    chunks += [{'textfile_id': files[-1]['id'], 'chatbot_id': chatbots[-1]['id'], 'position': p,
+                                'content': words(rng, vocab, 150), 'length': 150} for p in range(args.chunks)]
+            db.session.execute(insert(ChatBot), chatbots)
+            db.session.execute(insert(ChatBotTextFile), files)
+            db.session.execute(insert(ChatBotTextChunk), chunks)
+            db.session.commit()
+    print(f"{args.bots} Chatbots angelegt in {time.perf_counter() - start:.1f} s")
+    return app, users, vocab
+
+
+def timed(fn, number: int) -> dict:
+    fn()  # warm up caches
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(times), 2), 'max_ms': round(max(times), 2)}
+
+
+def run(app, users, vocab, number: int) -> dict:
+    import catalog_search
+    from catalog_search import search_chatbots
+    from db import User, db
+
+    with app.app_context():
+        common, rare, typical = COMMON_WORD, RARE_WORD, vocab[0]  # typical: ~1/60 of the chatbots
+        owner_id = db.session.query(User.id).filter_by(username=users[0]['username']).scalar()
+        cursor = search_chatbots(common, limit=50)[1]
+
+        queries = {
+            'rare_word': lambda: search_chatbots(rare),
+            'typical_word': lambda: search_chatbots(typical),
+            'common_word': lambda: search_chatbots(common),
+            'prefix': lambda: search_chatbots(common[:4]),
+            'two_words': lambda: search_chatbots(f'{typical} {common}'),
+            'owner_filter': lambda: search_chatbots(common, owner_id=owner_id),
+            'second_page': lambda: search_chatbots(common, cursor=cursor),
+        }
+        results = {'indexed': {name: timed(query, number) for name, query in queries.items()}}
+        results['hits'] = {name: len(query()[0]) for name, query in queries.items()}
+
+        # the same searches without the full-text index
+        del catalog_search._HITS['sqlite']
+        try:
+            results['like'] = {name: timed(queries[name], max(number // 5, 1)) for name in ('rare_word', 'typical_word', 'common_word')}
+        finally:
+            catalog_search._HITS['sqlite'] = catalog_search._sqlite_hits
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bots', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--file-every', type=int, default=10, help='jeder n-te Chatbot bekommt eine Text-Datei')
+    parser.add_argument('--chunks', type=int, default=5, help='Abschnitte pro Text-Datei')
+    parser.add_argument('--number', type=int, default=20, help='Wiederholungen pro Suche')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app, users, vocab = setup(args)
+    results = run(app, users, vocab, args.number)
+    for group in ('indexed', 'like'):
+        for name, result in results[group].items():
+            print(f"{group:8} {name:13} {result}  ({results['hits'][name]} auf Seite 1)")
+    print(json.dumps({'bots': args.bots, **results}))
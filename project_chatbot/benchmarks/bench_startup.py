@@ -0,0 +1,132 @@
+"""Benchmark: Start eines Worker-Prozesses bis zur ersten Antwort.
+
+Jeder Lauf ist ein frischer Python-Prozess wie ein Worker von gunicorn/uwsgi:
+gemessen werden `import main`, `create_app()`, die erste Anfrage ohne Datenbank
+(`/login`) und die erste Anfrage mit Datenbank (`/catalog`, angemeldet). Außerdem
+wird geprüft, dass beim Start keine Datenbankverbindung geöffnet wird. Mit
+`--workers` starten mehrere Prozesse gleichzeitig (Pre-Fork ohne `--preload`).
+
+Start: `python benchmarks/bench_startup.py --runs 10 --workers 8`
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def child():
+    """One worker start; prints the timings in ms as JSON."""
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    app = main.create_app()
+    created = time.perf_counter()
+
+    from db import User, db
+
+    with app.app_context():
+        connections = db.engine.pool.checkedin() + db.engine.pool.checkedout()
+
+    client = app.test_client()
+    before = time.perf_counter()
+    assert client.get('/login').status_code == 200
+    first_request = time.perf_counter()
+
+    with app.app_context():
+        user_id = User.query.filter_by(username='admin').one().id
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    before_db = time.perf_counter()
+    assert client.get('/catalog').status_code == 200
+    first_db_request = time.perf_counter()
+
+    print(json.dumps({
+        'import_ms': round((imported - start) * 1000, 2),
+        'create_app_ms': round((created - imported) * 1000, 2),
+        'first_request_ms': round((first_request - before) * 1000, 2),
+        'first_db_request_ms': round((first_db_request - before_db) * 1000, 2),
+        'ready_ms': round((first_request - start) * 1000, 2),
+        'db_connections_at_startup': connections,
+    }))
+
+
+def setup(bots: int) -> dict:
+    """A database created like `flask db init`, filled with chatbots for the catalog."""
+    tmp = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{tmp}/bench.db',
+        'JINJA_CACHE_DIR': os.path.join(tmp, 'jinja_cache'),
+        'PASSWORD_WORKERS': '0',
+        'JOB_WORKERS': '0',
+    }
+    code = (
+        'import main\n'
+        'from db import ChatBot, User, create_database, db\n'
+        'app = main.create_app()\n'
+        'with app.app_context():\n'
+        '    create_database()\n'
+        '    admin = User.query.filter_by(username="admin").one()\n'
+        f'    db.session.add_all(ChatBot(user_id=admin.id, name=f"Bot {{i}}", systemprompt="x" * 200) for i in range({bots}))\n'
+        '    db.session.commit()\n'
+    )
+    subprocess.run([sys.executable, '-c', code], env=env, cwd=SCRIPTS_DIR, check=True)
+    return env
+
+
+def start_workers(env: dict, count: int) -> list:
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child'], env=env, stdout=subprocess.PIPE)
+        for _ in range(count)
+    ]
+    results = []
+    for process in processes:
+        out, _ = process.communicate()
+        if process.returncode != 0:
+            raise SystemExit(f'worker failed with exit code {process.returncode}')
+        results.append(json.loads(out))
+    return results
+
+
+def summarize(results: list) -> dict:
+    return {key: round(statistics.median(r[key] for r in results), 2) for key in results[0]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10, help='Prozessstarts nacheinander')
+    parser.add_argument('--workers', type=int, default=8, help='gleichzeitig startende Prozesse')
+    parser.add_argument('--bots', type=int, default=200, help='Chatbots im Katalog')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit(0)
+
+    env = setup(args.bots)
+    start_workers(env, 1)  # fill the template bytecode cache like an earlier deploy would
+
+    sequential = [start_workers(env, 1)[0] for _ in range(args.runs)]
+    start = time.perf_counter()
+    parallel = start_workers(env, args.workers)
+    wall = time.perf_counter() - start
+
+    results = {
+        'sequential': summarize(sequential),
+        'parallel': {
+            'workers': args.workers,
+            'all_ready_ms': round(wall * 1000, 2),
+            **summarize(parallel),
+        },
+    }
+    for name, result in results.items():
+        print(f"{name:10}: {result}")
+    print(json.dumps(results))
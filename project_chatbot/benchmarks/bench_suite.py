@@ -0,0 +1,354 @@
+"""Benchmark-Suite: Lasttest mit Mock-Upstream und Micro-Benchmarks, Ergebnis als JSON.
+
+1. Legt eine frische SQLite-Datenbank an und befüllt sie reproduzierbar (`--seed`) mit
+   Benutzern, Chatbots und Text-Dateien (Blob-Store und Retrieval-Index wie bei Uploads).
+2. Startet den Mock-Upstream (`scripts/mock_llm.py`) mit `--latency` und `--token-delay`.
+3. `--clients` Threads führen gleichzeitig die Abläufe Login, Katalog, Chat-Seite,
+   `send_json` und Stream aus. Pro Ablauf werden p50/p95/p99 und der Durchsatz gemessen.
+4. Micro-Benchmarks: `hash_password`, Prompt-Aufbau (nur `PromptBuilder` und mit
+   Datenbank/Retrieval) und Template-Rendering.
+
+Mit `--output` werden die Ergebnisse gespeichert, `--compare` zeigt die Veränderung
+gegenüber einem früheren Lauf (z.B. vom vorherigen Commit).
+
+Start: `python benchmarks/bench_suite.py --seconds 20 --output bench.json`
+       `python benchmarks/bench_suite.py --seconds 20 --compare bench.json`
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+PASSWORD = 'bench-passwort'
+SYLLABLES = ('ba', 'be', 'chi', 'da', 'der', 'en', 'fa', 'ge', 'hal', 'in', 'ko', 'lu', 'ma', 'ne', 'or',
+             'pra', 'que', 'ri', 'sa', 'schu', 'te', 'un', 've', 'wo', 'zei')
+# share of each flow in the load mix
+FLOWS = {'login': 5, 'catalog': 25, 'chat_page': 20, 'send_json': 40, 'stream': 10}
+
+
+def setup_env(args):
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+    os.environ['BLOB_DIR'] = os.path.join(tmp, 'blobs')
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp, 'jinja_cache')
+    os.environ['OPEN_AI_API_SECRET'] = 'bench'
+    os.environ['OPEN_AI_BASE_URL'] = f'http://127.0.0.1:{args.port}/v1'
+    os.environ['OPEN_AI_POOL_SIZE'] = str(args.clients)
+    # all virtual users log in from one address, and every answer should go to the upstream
+    os.environ['LOGIN_MAX_PER_IP'] = '1000000'
+    os.environ['LOGIN_MAX_PER_USERNAME'] = '1000000'
+    os.environ['RESPONSE_CACHE_BACKEND'] = 'off'
+
+    import mock_llm
+    server = mock_llm.make_server(port=args.port, token_delay=args.token_delay, latency=args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def vocabulary(rng, size: int = 3000):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def words(rng, vocab, count: int) -> str:
+    return ' '.join(rng.choices(vocab, k=count))
+
+
+def seed(app, args):
+    """Users, chatbots, text files and one long conversation; returns users and chatbots per user."""
+    from sqlalchemy import insert
+
+    from db import ChatBot, ChatBotTextFile, Conversation, Message, User, create_database, db, display_fields
+    from retrieval import index_file
+    from uploads import BlobWriter
+    from utils import generate_id, hash_password, utcnow
+
+    rng = random.Random(args.seed)
+    vocab = vocabulary(rng)
+    start = time.perf_counter()
+    with app.app_context():
+        create_database()
+        # one hash for everyone, hashing itself is a micro-benchmark
+        password = hash_password(PASSWORD)
+        users = [{'id': generate_id(), 'username': f'bench{i}', 'password': password} for i in range(args.users)]
+        db.session.execute(insert(User), users)
+
+        now = utcnow()
+        chatbots = []
+        for i in range(args.bots):
+            prompt = words(rng, vocab, 80)
+            chatbots.append({
+                'id': generate_id(),
+                'user_id': users[i % len(users)]['id'],
+                'name': f'Bot {i}',
+                'systemprompt': prompt,
+                'welcomemessage': 'Hallo!',
+                'created': now,
+                **display_fields(prompt, now),
+            })
+        db.session.execute(insert(ChatBot), chatbots)
+
+        files = 0
+        for chatbot in chatbots[:args.bots_with_files]:
+            for j in range(args.files_per_bot):
+                writer = BlobWriter(f'doc{j}.txt')
+                for _ in range(args.file_kb):
+                    writer.write((words(rng, vocab, 140) + '\n').encode('utf-8')[:1024])
+                blob = writer.close()
+                row = {
+                    'id': generate_id(), 'chatbot_id': chatbot['id'], 'filename': f'doc{j}.txt', 'content': '',
+                    'blob_hash': blob.hash, 'size': blob.size, 'encoding': blob.encoding, 'created': now,
+                }
+                db.session.execute(insert(ChatBotTextFile), [row])
+                index_file(ChatBotTextFile(**row))
+                files += 1
+            db.session.commit()
+
+        conversation = Conversation(chatbot_id=chatbots[0]['id'], user_id=users[0]['id'])
+        db.session.add(conversation)
+        db.session.flush()
+        db.session.execute(insert(Message), [
+            {'conversation_id': conversation.id, 'role': 'user' if i % 2 == 0 else 'assistant',
+             'text': words(rng, vocab, 40)}
+            for i in range(args.history)
+        ])
+        db.session.commit()
+        conversation_id = conversation.id
+
+    by_user = {}
+    for chatbot in chatbots:
+        by_user.setdefault(chatbot['user_id'], []).append(chatbot['id'])
+    print(f"seed: {len(users)} Benutzer, {len(chatbots)} Chatbots, {files} Text-Dateien "
+          f"in {time.perf_counter() - start:.1f}s")
+    return users, by_user, conversation_id, vocab
+
+
+# -- load test ---------------------------------------------------------
+
+def percentiles(timings) -> dict:
+    if not timings:
+        return {}
+    if len(timings) == 1:
+        p50 = p95 = p99 = timings[0]
+    else:
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {'p50_ms': round(p50 * 1000, 2), 'p95_ms': round(p95 * 1000, 2), 'p99_ms': round(p99 * 1000, 2)}
+
+
+class VirtualUser:
+    def __init__(self, app, user, chatbot_ids, rng):
+        self.app = app
+        self.user = user
+        self.chatbot_ids = chatbot_ids
+        self.rng = rng
+        self.client = None
+        self.login()
+
+    def login(self) -> bool:
+        # a new client: the login is measured without an existing session
+        self.client = self.app.test_client()
+        r = self.client.post('/login', data={'username': self.user['username'], 'password': PASSWORD})
+        return r.status_code == 302
+
+    def catalog(self) -> bool:
+        return self.client.get('/catalog').status_code == 200
+
+    def chat_page(self) -> bool:
+        return self.client.get(f'/cb/{self.rng.choice(self.chatbot_ids)}').status_code == 200
+
+    def send_json(self) -> bool:
+        r = self.client.post(f'/cb/{self.rng.choice(self.chatbot_ids)}/send_json',
+                             json={'message': f'Frage {self.rng.random()}'})
+        return r.status_code == 200 and r.get_json().get('ok')
+
+    def stream(self) -> bool:
+        r = self.client.post(f'/cb/{self.rng.choice(self.chatbot_ids)}/stream',
+                             json={'message': f'Frage {self.rng.random()}'})
+        ok = r.status_code == 200 and b'event: done' in r.get_data()
+        r.close()
+        return ok
+
+
+def run_load(app, users, by_user, args):
+    names, weights = list(FLOWS), list(FLOWS.values())
+    results = {name: {'timings': [], 'errors': 0} for name in names}
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(args.seed + index)
+        user = users[index % len(users)]
+        virtual_user = VirtualUser(app, user, by_user[user['id']], rng)
+        warmup_end = time.perf_counter() + args.warmup
+        end = warmup_end + args.seconds
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            flow = rng.choices(names, weights)[0]
+            try:
+                ok = getattr(virtual_user, flow)()
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - now
+            if now < warmup_end:
+                continue
+            with lock:
+                results[flow]['timings'].append(elapsed)
+                if not ok:
+                    results[flow]['errors'] += 1
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(client, range(args.clients)))
+
+    report = {}
+    for name, data in results.items():
+        timings = data['timings']
+        report[name] = {
+            'requests': len(timings),
+            'errors': data['errors'],
+            'per_second': round(len(timings) / args.seconds, 1),
+            **percentiles(timings),
+        }
+    return report
+
+
+# -- micro-benchmarks --------------------------------------------------
+
+def micro(fn, repeat: int = 5, number: int = 20) -> dict:
+    """Median and best time per call over `repeat` rounds of `number` calls."""
+    fn()  # warm caches
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return {'median_ms': round(statistics.median(rounds) * 1000, 3), 'min_ms': round(min(rounds) * 1000, 3)}
+
+
+def run_micro(main, app, conversation_id, vocab, args):
+    from flask import render_template
+
+    from db import ChatBot, Conversation, Message, db
+    from utils import hash_password
+
+    rng = random.Random(args.seed)
+    results = {
+        'hash_password_scrypt': micro(lambda: hash_password(PASSWORD, 'scrypt'), number=3),
+        'hash_password_pbkdf2': micro(lambda: hash_password(PASSWORD, 'pbkdf2-sha256'), number=3),
+    }
+
+    history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'text': words(rng, vocab, 40)} for i in range(args.history)]
+    files = [(f'doc{i}.txt', words(rng, vocab, 180)) for i in range(4)]
+    system_prompt = words(rng, vocab, 300)
+    results['prompt_builder'] = micro(lambda: main.prompt_builder.build(system_prompt, files, history))
+
+    with app.app_context():
+        conversation = db.session.get(Conversation, conversation_id)
+        chatbot = db.session.get(ChatBot, conversation.chatbot_id)
+        results['build_prompt_db'] = micro(lambda: main.build_prompt(chatbot, conversation_id))
+
+        chatbots = ChatBot.query.order_by(ChatBot.created.desc(), ChatBot.id.desc()).limit(50).all()
+        messages = [m.to_dict() for m in Message.query.filter_by(conversation_id=conversation_id).limit(50)]
+        with app.test_request_context():
+            results['render_catalog_rows'] = micro(
+                lambda: render_template('catalog_rows.html', chatbots=chatbots, is_admin=True))
+            results['render_chat_page'] = micro(lambda: render_template(
+                'chat.html', title=chatbot.name, username='bench', chatbot=chatbot, css_url=None,
+                history=messages, has_more=True,
+            ))
+    return results
+
+
+# -- report ------------------------------------------------------------
+
+def metadata(args) -> dict:
+    from utils import get_git_info
+
+    commit_id, git_tag = get_git_info(cwd=os.path.dirname(os.path.abspath(__file__)))
+    return {
+        'commit': commit_id,
+        'tag': git_tag,
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+    }
+
+
+def change(old, new) -> str:
+    if not old:
+        return ''
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(previous: dict, current: dict):
+    print(f"\nVergleich mit {previous['meta'].get('commit') or '?'} ({previous['meta'].get('time')}):")
+    for name, flow in current['load'].items():
+        old = previous.get('load', {}).get(name)
+        if not old or 'p50_ms' not in flow or 'p50_ms' not in old:
+            continue
+        print(f"  {name:12} p50 {old['p50_ms']:>9} -> {flow['p50_ms']:>9} ms {change(old['p50_ms'], flow['p50_ms']):>8}"
+              f"   p95 {old['p95_ms']:>9} -> {flow['p95_ms']:>9} ms {change(old['p95_ms'], flow['p95_ms']):>8}"
+              f"   {old['per_second']:>7} -> {flow['per_second']:>7}/s")
+    for name, result in current['micro'].items():
+        old = previous.get('micro', {}).get(name)
+        if old:
+            print(f"  {name:22} {old['median_ms']:>9} -> {result['median_ms']:>9} ms "
+                  f"{change(old['median_ms'], result['median_ms']):>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=1, help='Startwert für die Testdaten')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--bots', type=int, default=200)
+    parser.add_argument('--bots-with-files', type=int, default=20, help='Chatbots mit Text-Dateien')
+    parser.add_argument('--files-per-bot', type=int, default=5)
+    parser.add_argument('--file-kb', type=int, default=64, help='Größe einer Text-Datei in KB')
+    parser.add_argument('--history', type=int, default=40, help='Nachrichten im Verlauf (Prompt-Benchmarks)')
+    parser.add_argument('--clients', type=int, default=8, help='gleichzeitige virtuelle Benutzer')
+    parser.add_argument('--seconds', type=float, default=10, help='Dauer der Messung')
+    parser.add_argument('--warmup', type=float, default=2, help='Sekunden vor der Messung (nicht gezählt)')
+    parser.add_argument('--port', type=int, default=8299, help='Port des Mock-Upstreams')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock-Upstream: Sekunden bis zur Antwort')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Mock-Upstream: Sekunden pro Token (Stream)')
+    parser.add_argument('--skip-load', action='store_true', help='nur Micro-Benchmarks')
+    parser.add_argument('--output', help='Ergebnisse als JSON in diese Datei schreiben')
+    parser.add_argument('--compare', help='JSON eines früheren Laufs zum Vergleich')
+    args = parser.parse_args()
+    if args.bots < args.users:
+        parser.error('--bots muss mindestens --users sein (jeder Benutzer chattet mit eigenen Chatbots)')
+
+    setup_env(args)
+    import main
+
+    app = main.create_app()
+    users, by_user, conversation_id, vocab = seed(app, args)
+    results = {'meta': metadata(args), 'load': {}, 'micro': {}}
+    if not args.skip_load:
+        results['load'] = run_load(app, users, by_user, args)
+        for name, flow in results['load'].items():
+            print(f"{name:12} {flow}")
+    results['micro'] = run_micro(main, app, conversation_id, vocab, args)
+    for name, result in results['micro'].items():
+        print(f"{name:22} {result}")
+    main.password_pool.shutdown()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nErgebnisse gespeichert: {args.output}")
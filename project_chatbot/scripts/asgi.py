@@ -0,0 +1,327 @@
+"""ASGI-Einstiegspunkt mit asynchronem Chat-Pfad.
+
+`POST /cb/<id>/send_json` und `POST /cb/<id>/stream` laufen hier nativ mit asyncio:
+während auf das LLM gewartet wird, ist kein Worker-Thread belegt, viele Chats
+teilen sich einen Prozess. Alle anderen Anfragen gehen unverändert an die
+Flask-App (WSGI).
+
+Start: `uvicorn asgi:application --app-dir scripts --port 5050`
+"""
+import asyncio
+import json
+import os
+import re
+from collections import Counter
+from http.cookies import SimpleCookie
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import dump_cookie
+
+from auth import can_chat, get_chatbot_config
+from db import User
+from instrumentation import observe_upstream, track_request
+from main import (
+    _conversation_key,
+    append_message,
+    build_prompt,
+    completion_payload,
+    create_app,
+    create_conversation,
+    fallback_answer,
+    open_ai_api_secret,
+    open_ai_base_url,
+    response_cache,
+    token_from_sse_line,
+)
+from upstream import AsyncUpstreamClient, CircuitBreaker
+
+CHAT_PATH = re.compile(r'^/cb/(?P<chatbot_id>[^/]+)/(?P<action>send_json|stream)$')
+
+# Maximum size of a chat request body
+MAX_CHAT_BODY = 64 * 1024
+
+
+class TenantLimiter:
+    """Limits the chats in flight per user and per chatbot (one tenant can't take all capacity)."""
+
+    def __init__(self, per_user: int, per_chatbot: int):
+        self.per_user = per_user
+        self.per_chatbot = per_chatbot
+        self._active = Counter()
+
+    def acquire(self, user_id: str, chatbot_id: str) -> bool:
+        user_key, bot_key = ('user', user_id), ('chatbot', chatbot_id)
+        if self._active[user_key] >= self.per_user or self._active[bot_key] >= self.per_chatbot:
+            return False
+        self._active[user_key] += 1
+        self._active[bot_key] += 1
+        return True
+
+    def release(self, user_id: str, chatbot_id: str):
+        for key in (('user', user_id), ('chatbot', chatbot_id)):
+            self._active[key] -= 1
+            if self._active[key] <= 0:
+                del self._active[key]
+
+
+class ChatRejected(Exception):
+    def __init__(self, status: int, error: str):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+
+class AsyncChatApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.limiter = TenantLimiter(
+            per_user=int(os.environ.get('CHAT_MAX_PER_USER', '4')),
+            per_chatbot=int(os.environ.get('CHAT_MAX_PER_CHATBOT', '16')),
+        )
+        self.client = None  # created inside the event loop, see `_client`
+
+    def _client(self) -> AsyncUpstreamClient:
+        if self.client is None:
+            self.client = AsyncUpstreamClient(
+                open_ai_base_url,
+                open_ai_api_secret,
+                pool_size=int(os.environ.get('OPEN_AI_ASYNC_POOL_SIZE', '64')),
+                timeout=float(os.environ.get('OPEN_AI_TIMEOUT', '15')),
+                max_retries=int(os.environ.get('OPEN_AI_MAX_RETRIES', '3')),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.environ.get('OPEN_AI_BREAKER_THRESHOLD', '5')),
+                    reset_timeout=float(os.environ.get('OPEN_AI_BREAKER_RESET', '30')),
+                ),
+                observer=observe_upstream,
+            )
+        return self.client
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        match = CHAT_PATH.match(scope.get('path', '')) if scope['type'] == 'http' else None
+        if match and scope['method'] == 'POST':
+            # same route label as the Flask view
+            with track_request('POST', f"/cb/<string:chatbot_id>/{match['action']}") as stats:
+                async def send_tracked(message):
+                    if message['type'] == 'http.response.start':
+                        stats.status = message['status']
+                    await send(message)
+
+                await self.chat(scope, receive, send_tracked, match['chatbot_id'], match['action'] == 'stream')
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client:
+                    await self.client.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # -- session cookie (same format as Flask's) ------------------------
+
+    def _load_session(self, scope) -> dict:
+        cookies = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookies.load(value.decode('latin-1'))
+        morsel = cookies.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if not morsel:
+            return {}
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return serializer.loads(morsel.value, max_age=max_age)
+        except Exception:
+            return {}
+
+    def _session_cookie(self, session: dict) -> tuple:
+        config = self.flask_app.config
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds()) if session.get('_permanent') else None
+        cookie = dump_cookie(
+            config['SESSION_COOKIE_NAME'],
+            serializer.dumps(session),
+            max_age=max_age,
+            path=config['SESSION_COOKIE_PATH'] or config['APPLICATION_ROOT'],
+            domain=config['SESSION_COOKIE_DOMAIN'],
+            secure=config['SESSION_COOKIE_SECURE'],
+            httponly=config['SESSION_COOKIE_HTTPONLY'],
+            samesite=config['SESSION_COOKIE_SAMESITE'],
+        )
+        return (b'set-cookie', cookie.encode('latin-1'))
+
+    # -- chat ------------------------------------------------------------
+
+    async def _read_json(self, receive) -> dict:
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_CHAT_BODY:
+                raise ChatRejected(413, 'too_large')
+            if not message.get('more_body'):
+                break
+        try:
+            return json.loads(body or b'{}')
+        except ValueError:
+            return {}
+
+    def _prepare(self, session: dict, chatbot_id: str, msg: str):
+        """Database work before the upstream call (runs in a thread)."""
+        with self.flask_app.app_context():
+            user = User.query.get(session['user_id']) if session.get('user_id') else None
+            if not user:
+                raise ChatRejected(401, 'not_logged_in')
+            chatbot = get_chatbot_config(chatbot_id)
+            if not chatbot:
+                raise ChatRejected(404, 'not_found')
+            if not can_chat(user, chatbot):
+                raise ChatRejected(403, 'forbidden')
+
+            conversation_id = session.get(_conversation_key(chatbot_id))
+            new_conversation = not conversation_id
+            if new_conversation:
+                conversation_id = create_conversation(chatbot_id, user.id)
+            user_message_id = append_message(conversation_id, 'user', msg)
+            prompt = build_prompt(chatbot, conversation_id)
+            return user_message_id, conversation_id, new_conversation, prompt
+
+    def _save_answer(self, conversation_id: str, text: str) -> int:
+        with self.flask_app.app_context():
+            return append_message(conversation_id, 'assistant', text)
+
+    async def _answer(self, messages):
+        if not open_ai_api_secret:
+            return None
+        try:
+            resp_json = await self._client().post_json('/chat/completions', completion_payload(messages))
+            return resp_json['choices'][0]['message']['content'].strip()
+        except Exception:
+            self.flask_app.logger.exception('Error calling OpenAI')
+            return None
+
+    async def _tokens(self, messages):
+        if not open_ai_api_secret:
+            return
+        try:
+            async for line in self._client().stream_lines('/chat/completions', completion_payload(messages, stream=True)):
+                token = token_from_sse_line(line)
+                if token:
+                    yield token
+        except Exception:
+            self.flask_app.logger.exception('Error streaming from OpenAI')
+
+    async def chat(self, scope, receive, send, chatbot_id: str, stream: bool):
+        try:
+            data = await self._read_json(receive)
+            msg = (data.get('message') or '').strip()
+            if not msg:
+                raise ChatRejected(400, 'empty_message')
+
+            session = self._load_session(scope)
+            if not session.get('user_id'):
+                raise ChatRejected(401, 'not_logged_in')
+            if not self.limiter.acquire(session['user_id'], chatbot_id):
+                raise ChatRejected(429, 'too_many_requests')
+        except ChatRejected as e:
+            await self._send_json(send, e.status, {"ok": False, "error": e.error})
+            return
+
+        try:
+            try:
+                user_message_id, conversation_id, new_conversation, prompt = await asyncio.to_thread(
+                    self._prepare, session, chatbot_id, msg
+                )
+            except ChatRejected as e:
+                await self._send_json(send, e.status, {"ok": False, "error": e.error})
+                return
+
+            headers = []
+            if new_conversation:
+                session[_conversation_key(chatbot_id)] = conversation_id
+                headers.append(self._session_cookie(session))
+
+            if stream:
+                await self._stream(send, headers, chatbot_id, conversation_id, prompt, msg, user_message_id)
+                return
+
+            bot_answer = await asyncio.to_thread(response_cache.get, prompt.cache_key)
+            if not bot_answer:
+                bot_answer = await self._answer(prompt.messages)
+                if bot_answer:
+                    await asyncio.to_thread(response_cache.set, prompt.cache_key, chatbot_id, bot_answer)
+            bot_answer = bot_answer or fallback_answer(msg)
+            bot_message_id = await asyncio.to_thread(self._save_answer, conversation_id, bot_answer)
+            await self._send_json(send, 200, {
+                "ok": True,
+                "user": {"id": user_message_id, "role": "user", "text": msg},
+                "bot": {"id": bot_message_id, "role": "assistant", "text": bot_answer},
+                "prompt_usage": prompt.usage,
+            }, headers)
+        finally:
+            self.limiter.release(session['user_id'], chatbot_id)
+
+    async def _stream(self, send, headers, chatbot_id, conversation_id, prompt, msg, user_message_id):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': headers + [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+
+        async def event(data: dict, name: str | None = None):
+            prefix = f"event: {name}\n" if name else ''
+            body = f"{prefix}data: {json.dumps(data)}\n\n".encode('utf-8')
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+        parts = []
+        cached = await asyncio.to_thread(response_cache.get, prompt.cache_key)
+        if cached:
+            parts.append(cached)
+            await event({"token": cached})
+        else:
+            async for token in self._tokens(prompt.messages):
+                parts.append(token)
+                await event({"token": token})
+
+        bot_answer = ''.join(parts).strip()
+        if bot_answer and not cached:
+            await asyncio.to_thread(response_cache.set, prompt.cache_key, chatbot_id, bot_answer)
+        if not bot_answer:
+            bot_answer = fallback_answer(msg)
+            await event({"token": bot_answer})
+
+        bot_message_id = await asyncio.to_thread(self._save_answer, conversation_id, bot_answer)
+        await event({
+            "id": bot_message_id,
+            "user_id": user_message_id,
+            "text": bot_answer,
+            "prompt_usage": prompt.usage,
+        }, 'done')
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def _send_json(self, send, status: int, data: dict, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': (headers or []) + [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = AsyncChatApp(create_app())
@@ -0,0 +1,201 @@
+"""Aufbereitung von CSS und statischen Dateien für die Auslieferung.
+
+Das CSS eines Chatbots wird beim Hochladen einmal minifiziert und unter einer URL
+mit Inhalts-Hash ausgeliefert (`/cb/<id>/style-<hash>.css`), damit Browser und
+CDNs es dauerhaft cachen können.
+
+Für `app/static` erzeugt `flask build-assets` minifizierte Kopien mit Inhalts-Hash im
+Namen sowie vorkomprimierte `.gz`- und (falls das Paket `brotli` installiert ist)
+`.br`-Varianten unter `app/static/dist`, dazu `manifest.json`. `init_assets(app)`
+lässt `url_for('static', ...)` auf diese Kopien zeigen und liefert je nach
+`Accept-Encoding` die passende Variante aus.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import request, send_file
+from flask.sessions import SecureCookieSessionInterface
+
+try:
+    import brotli
+except ImportError:  # optional, without it only gzip variants are built
+    brotli = None
+
+# strings | comments | whitespace | punctuation | anything else
+_CSS_TOKEN = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)|([{}:;,>])|([^"'\s{}:;,>/]+|/)''',
+    re.S,
+)
+# no space needed before or after these characters
+_TIGHT = '{};,>'
+
+# length of the content hash in asset URLs
+FINGERPRINT_LENGTH = 16
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and unneeded whitespace (strings are kept as they are)."""
+    tokens = _CSS_TOKEN.findall(css or '')
+    declaration_colons = _declaration_colons(tokens)
+    out = []
+    for i, (string, comment, space, punct, other) in enumerate(tokens):
+        if comment:
+            # a comment separates tokens like whitespace does
+            space = ' '
+        if space:
+            if out and out[-1] != ' ' and out[-1][-1] not in _TIGHT + ':':
+                out.append(' ')
+            continue
+        token = string or punct or other
+        if punct and (punct in _TIGHT or i in declaration_colons):
+            if out and out[-1] == ' ':
+                out.pop()
+            if punct == '}' and out and out[-1] == ';':
+                out.pop()
+        out.append(token)
+    if out and out[-1] == ' ':
+        out.pop()
+    return ''.join(out)
+
+
+def _declaration_colons(tokens) -> set:
+    """Indexes of the colons between a property and its value.
+
+    A space before the colon of a selector matters (`div :hover` is not `div:hover`); a declaration colon is
+    followed by `;` or `}` before the next `{`.
+    """
+    colons, ends_declaration = set(), True
+    for i in range(len(tokens) - 1, -1, -1):
+        punct = tokens[i][3]
+        if punct in ('{', ';', '}'):
+            ends_declaration = punct != '{'
+        elif punct == ':' and ends_declaration:
+            colons.add(i)
+    return colons
+
+
+def fingerprint(content_hash: str) -> str:
+    return content_hash[:FINGERPRINT_LENGTH]
+
+
+# -- static files ------------------------------------------------------
+
+DIST_DIR = 'dist'
+# endpoints that serve files: no user, no session cookie
+STATIC_ENDPOINTS = ('static', 'main.cb_style')
+MANIFEST = 'manifest.json'
+# hashed files never change, browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def minify_svg(svg: str) -> str:
+    return re.sub(r'>\s+<', '><', svg.strip())
+
+
+_MINIFIERS = {'.css': minify_css, '.svg': minify_svg}
+
+
+def build_assets(static_dir: str) -> dict:
+    """Write hashed, minified and precompressed copies of the static files, return the manifest.
+
+    JavaScript is copied unchanged (no minifier without an extra dependency), compression does most of the work.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path):
+            continue
+        base, ext = os.path.splitext(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if ext in _MINIFIERS:
+            data = _MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+
+        hashed = f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        target = os.path.join(dist_dir, hashed)
+        with open(target, 'wb') as f:
+            f.write(data)
+        with open(target + '.gz', 'wb') as f:
+            # mtime=0: same input, same bytes
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(data))
+        manifest[name] = f"{DIST_DIR}/{hashed}"
+
+    with open(os.path.join(dist_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir: str) -> dict:
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _accepted_encodings() -> list:
+    """Precompressed variants the client accepts, best first."""
+    return [
+        (encoding, suffix) for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+        if request.accept_encodings[encoding]
+    ]
+
+
+class AssetSessionInterface(SecureCookieSessionInterface):
+    """Doesn't refresh the session cookie on file responses (a Set-Cookie makes them uncacheable)."""
+
+    def should_set_cookie(self, app, session):
+        if request.endpoint in STATIC_ENDPOINTS:
+            return False
+        return super().should_set_cookie(app, session)
+
+
+def init_assets(app):
+    """Use the built static files (if `flask build-assets` was run) for `url_for` and serving."""
+    manifest = load_manifest(app.static_folder)
+    hashed_files = set(manifest.values())
+    app.extensions['static_manifest'] = manifest
+    app.session_interface = AssetSessionInterface()
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    send_static_file = app.view_functions['static']
+
+    def static(filename):
+        if filename not in hashed_files:
+            return send_static_file(filename=filename)
+
+        path = os.path.join(app.static_folder, filename)
+        for encoding, suffix in _accepted_encodings():
+            if os.path.exists(path + suffix):
+                response = send_file(
+                    path + suffix, mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE_MAX_AGE
+                )
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_file(path, max_age=IMMUTABLE_MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Build hashed and precompressed static files (restart the app afterwards)."""
+        built = build_assets(app.static_folder)
+        for name, hashed in built.items():
+            print(f"{name} -> {hashed}")
@@ -0,0 +1,189 @@
+"""Anmeldung und Berechtigungen als Decorator.
+
+`login_required` prüft die Anmeldung, `chatbot_required` lädt zusätzlich den
+Chatbot genau einmal pro Anfrage (nach `g.chatbot`) und prüft die Berechtigung.
+Für die Chat-Endpunkte reicht eine unveränderliche Momentaufnahme der
+Chatbot-Konfiguration (`ChatBotConfig`), die pro Prozess zwischengespeichert und
+über `ChatBot.version` ungültig gemacht wird (höchstens `CHATBOT_CONFIG_CACHE_SIZE`
+Chatbots, die am längsten nicht benutzten fallen heraus). `LoginThrottle` begrenzt fehlgeschlagene
+Logins pro IP und pro Benutzername, bevor ein Passwort-Hash berechnet wird.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+
+from flask import flash, g, jsonify, redirect, url_for
+
+from db import ChatBot, db
+
+
+def can_chat(user, chatbot) -> bool:
+    # Berechtigung: Admin darf alle, sonst nur eigene
+    return user.username == 'admin' or chatbot.user_id == user.id
+
+
+class ChatBotConfig:
+    """Read-only snapshot of the chatbot fields the chat endpoints need."""
+
+    def __init__(self, chatbot):
+        self.id = chatbot.id
+        self.user_id = chatbot.user_id
+        self.name = chatbot.name
+        self.systemprompt = chatbot.systemprompt
+        self.welcomemessage = chatbot.welcomemessage
+        self.token_budget = chatbot.token_budget
+        self.version = chatbot.version
+        self._prompt_prefix = None
+
+    def prompt_prefix(self, prompt_builder):
+        """System prompt part of the prompt, rendered once per chatbot version."""
+        if self._prompt_prefix is None:
+            self._prompt_prefix = prompt_builder.system_part(self.systemprompt, self.token_budget)
+        return self._prompt_prefix
+
+    def __repr__(self):
+        return f"<ChatBotConfig id={self.id} version={self.version}>"
+
+
+# Config snapshots per process, least recently used first (CHATBOT_CONFIG_CACHE_SIZE=0: off)
+CONFIG_CACHE_SIZE = int(os.environ.get('CHATBOT_CONFIG_CACHE_SIZE', '1000'))
+_configs = OrderedDict()
+_configs_lock = threading.Lock()
+
+
+def get_chatbot_config(chatbot_id: str):
+    """Config snapshot of a chatbot; only a small version query if the cached one is current."""
+    row = db.session.query(ChatBot.version).filter(ChatBot.id == chatbot_id).first()
+    if row is None:
+        invalidate_chatbot_config(chatbot_id)
+        return None
+    with _configs_lock:
+        config = _configs.get(chatbot_id)
+        if config is not None:
+            _configs.move_to_end(chatbot_id)
+    if config is None or config.version != row.version:
+        chatbot = ChatBot.query.get(chatbot_id)
+        config = ChatBotConfig(chatbot)
+        with _configs_lock:
+            _configs[chatbot_id] = config
+            _configs.move_to_end(chatbot_id)
+            while len(_configs) > CONFIG_CACHE_SIZE:
+                _configs.popitem(last=False)
+    return config
+
+
+def invalidate_chatbot_config(chatbot_id: str):
+    with _configs_lock:
+        _configs.pop(chatbot_id, None)
+
+
+def _unauthorized(api: bool):
+    if api:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+    return redirect(url_for('main.login'))
+
+
+def login_required(api: bool = False):
+    """Require a logged in user (`g.user`); JSON error for `api` endpoints, else redirect to login."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not g.get('user'):
+                return _unauthorized(api)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def chatbot_required(api: bool = False, owner_only: bool = False, config: bool = False):
+    """Load the chatbot of the `chatbot_id` route argument into `g.chatbot` and check access.
+
+    `owner_only`: only the owner (e.g. editing), otherwise owner or admin.
+    `config`: `g.chatbot` is a cached `ChatBotConfig` instead of the ORM object.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(chatbot_id, *args, **kwargs):
+            user = g.get('user')
+            if not user:
+                return _unauthorized(api)
+
+            chatbot = get_chatbot_config(chatbot_id) if config else ChatBot.query.get(chatbot_id)
+            allowed = chatbot is not None and (
+                chatbot.user_id == user.id if owner_only else can_chat(user, chatbot)
+            )
+
+            if not allowed:
+                if api:
+                    if chatbot is None:
+                        return jsonify({"ok": False, "error": "not_found"}), 404
+                    return jsonify({"ok": False, "error": "forbidden"}), 403
+                if owner_only:
+                    flash('Chatbot nicht gefunden oder keine Berechtigung.', 'error')
+                elif chatbot is None:
+                    flash('Chatbot nicht gefunden.', 'error')
+                else:
+                    flash('Keine Berechtigung für diesen Chatbot.', 'error')
+                return redirect(url_for('main.catalog'))
+
+            g.chatbot = chatbot
+            return view(chatbot_id, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoginThrottle:
+    """Sliding window of failed logins per IP and per username (in memory, per process).
+
+    Keys are kept in order of their last failure, so expired keys are dropped from the front on every
+    failure; beyond `max_keys` (e.g. credential stuffing with ever new names) the oldest go first.
+    """
+
+    def __init__(self, per_ip: int, per_username: int, window: float, max_keys: int = 100000):
+        self.limits = {'ip': per_ip, 'username': per_username}
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        return failures
+
+    def blocked(self, ip: str, username: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            blocked = False
+            for key in (('ip', ip), ('username', username.lower())):
+                failures = self._recent(key, now)
+                if not failures:
+                    self._failures.pop(key, None)
+                elif len(failures) >= self.limits[key[0]]:
+                    blocked = True
+            return blocked
+
+    def failed(self, ip: str, username: str):
+        now = time.monotonic()
+        with self._lock:
+            for key in (('ip', ip), ('username', username.lower())):
+                failures = self._recent(key, now)
+                if failures is None:
+                    failures = self._failures[key] = deque()
+                failures.append(now)
+                self._failures.move_to_end(key)
+            self._prune(now)
+
+    def _prune(self, now):
+        while self._failures:
+            key, failures = next(iter(self._failures.items()))
+            if len(self._failures) <= self.max_keys and failures and failures[-1] > now - self.window:
+                break
+            del self._failures[key]
+
+    def succeeded(self, username: str):
+        with self._lock:
+            self._failures.pop(('username', username.lower()), None)
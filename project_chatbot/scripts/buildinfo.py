@@ -0,0 +1,62 @@
+import json
+import os
+
+from utils import get_git_info
+
+# Generated at build time (e.g. `flask write-version` in the Dockerfile)
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSION_FILE = os.path.join(SCRIPTS_DIR, '_version.json')
+
+# Resolved once per process, see `load_build_info`
+_build_info = None
+
+
+def _from_env():
+    commit_id = os.environ.get('GIT_COMMIT') or None
+    git_tag = os.environ.get('GIT_TAG') or None
+    if commit_id or git_tag:
+        return commit_id, git_tag
+    return None
+
+
+def _from_file(path: str = VERSION_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data.get('commit') or None, data.get('tag') or None
+
+
+def resolve_build_info():
+    """Determine commit and tag: env vars first, then the version file, then git."""
+    for source in (_from_env, _from_file):
+        info = source()
+        if info:
+            return info
+    return get_git_info(cwd=SCRIPTS_DIR)
+
+
+def load_build_info(force: bool = False) -> dict:
+    """Resolve the build info once and keep it in memory."""
+    global _build_info
+    if _build_info is None or force:
+        commit_id, git_tag = resolve_build_info()
+        _build_info = {
+            'version': git_tag or (commit_id[:7] if commit_id else 'dev'),
+            'git_tag': git_tag,
+            'git_commit': commit_id,
+        }
+    return _build_info
+
+
+def write_version_file(path: str = VERSION_FILE) -> dict:
+    """Write the current git info into the version file (used during image builds)."""
+    commit_id, git_tag = get_git_info(cwd=SCRIPTS_DIR)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'commit': commit_id, 'tag': git_tag}, f)
+    return load_build_info(force=True)
+
+
+if __name__ == '__main__':
+    print(json.dumps(write_version_file()))
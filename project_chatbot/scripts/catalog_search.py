@@ -0,0 +1,164 @@
+"""Volltextsuche im Chatbot-Katalog.
+
+Durchsucht werden Name, Willkommens-Nachricht und System-Prompt der Chatbots sowie
+der Inhalt ihrer Text-Dateien (die Abschnitte des Retrieval-Index, siehe
+retrieval.py; eine Datei ist also auffindbar, sobald sie indexiert ist).
+
+- SQLite: FTS5-Tabellen, die Trigger bei jedem Einfügen, Ändern und Löschen
+  aktualisieren (siehe `db.create_search_index`).
+- PostgreSQL: GIN-Indizes auf den tsvector-Ausdrücken.
+- Andere Datenbanken suchen ohne Index mit LIKE.
+
+Die Treffer sind nach Relevanz sortiert (BM25 bzw. ts_rank; Treffer im Namen zählen
+mehr als im Prompt, Treffer in Text-Dateien weniger). Geblättert wird mit einem
+Cursor aus Rang und ID, wie im Katalog ohne Suche.
+"""
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, Float, String, bindparam, text
+from sqlalchemy.orm import defer, joinedload
+
+from db import PG_CHATBOT_DOCUMENT, PG_TEXTCHUNK_DOCUMENT, ChatBot, db
+
+# bm25 weights of name, welcome message and system prompt (SQLite)
+FIELD_WEIGHTS = (10.0, 2.0, 1.0)
+# factor for the rank of the best matching text file section of a chatbot
+FILE_WEIGHT = 0.5
+# words of a query beyond this are ignored
+MAX_TERMS = 8
+
+_TERM = re.compile(r'\w+')
+
+
+class SearchError(ValueError):
+    """A filter value that can't be used (e.g. a malformed date)."""
+
+
+def query_terms(query: str | None) -> list:
+    """The words of a search query; quotes and FTS operators typed by the user are dropped."""
+    return _TERM.findall((query or '').lower())[:MAX_TERMS]
+
+
+def date_range(created_from: str | None, created_to: str | None):
+    """Parse `YYYY-MM-DD` bounds into datetimes, the end date is included."""
+    try:
+        start = datetime.strptime(created_from, '%Y-%m-%d') if created_from else None
+        end = datetime.strptime(created_to, '%Y-%m-%d') + timedelta(days=1) if created_to else None
+    except ValueError:
+        raise SearchError('invalid_date')
+    return start, end
+
+
+def encode_cursor(rank: float, chatbot_id: str) -> str:
+    return f"{rank!r}~{chatbot_id}"
+
+
+def decode_cursor(cursor: str | None):
+    try:
+        rank, chatbot_id = cursor.split('~', 1)
+        return float(rank), chatbot_id
+    except (AttributeError, ValueError):
+        return None
+
+
+# -- matching chatbots per database: (chatbot_id, rank), lower rank is better --------
+# `filters` are conditions on the chatbot `c` (owner, dates), they apply before ranking and paging.
+
+def _sqlite_hits(terms: list, filters: str):
+    match = ' '.join(f'"{term}"*' for term in terms)  # all words, each as a prefix
+    weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+    # CROSS JOIN: start from the full-text match, not from an index on chatbots (e.g. the owner's chatbots)
+    # bm25() can't be used inside an aggregate, the CTEs are materialized so SQLite keeps them apart
+    sql = f"""
+        WITH field_hits AS MATERIALIZED (
+            SELECT c.id AS chatbot_id, bm25(chatbot_search, {weights}) AS rank
+            FROM chatbot_search CROSS JOIN chatbots c ON c.rowid = chatbot_search.rowid
+            WHERE chatbot_search MATCH :match{filters}
+        ), file_hits AS MATERIALIZED (
+            SELECT t.chatbot_id, bm25(chatbot_textchunk_search) AS rank
+            FROM chatbot_textchunk_search
+            CROSS JOIN chatbot_textchunks t ON t.id = chatbot_textchunk_search.rowid
+            CROSS JOIN chatbots c ON c.id = t.chatbot_id
+            WHERE chatbot_textchunk_search MATCH :match{filters}
+        )
+        SELECT chatbot_id, SUM(rank) AS rank FROM (
+            SELECT chatbot_id, rank FROM field_hits
+            UNION ALL
+            SELECT chatbot_id, MIN(rank) * {FILE_WEIGHT} FROM file_hits GROUP BY chatbot_id
+        ) GROUP BY chatbot_id"""
+    return sql, {'match': match}
+
+
+def _postgresql_hits(terms: list, filters: str):
+    tsquery = ' & '.join(f"'{term}':*" for term in terms)
+    sql = f"""
+        SELECT chatbot_id, SUM(rank) AS rank FROM (
+            SELECT c.id AS chatbot_id, -ts_rank({PG_CHATBOT_DOCUMENT}, q) AS rank
+            FROM chatbots c, to_tsquery('simple', :tsquery) q
+            WHERE {PG_CHATBOT_DOCUMENT} @@ q{filters}
+            UNION ALL
+            SELECT t.chatbot_id, MIN(-ts_rank({PG_TEXTCHUNK_DOCUMENT}, q)) * {FILE_WEIGHT} AS rank
+            FROM chatbot_textchunks t JOIN chatbots c ON c.id = t.chatbot_id, to_tsquery('simple', :tsquery) q
+            WHERE {PG_TEXTCHUNK_DOCUMENT} @@ q{filters}
+            GROUP BY t.chatbot_id
+        ) hits GROUP BY chatbot_id"""
+    return sql, {'tsquery': tsquery}
+
+
+def _like_hits(terms: list, filters: str):
+    conditions = ' AND '.join(
+        f"(c.name LIKE :term{i} OR c.welcomemessage LIKE :term{i} OR c.systemprompt LIKE :term{i})"
+        for i in range(len(terms))
+    )
+    sql = f"SELECT c.id AS chatbot_id, 0.0 AS rank FROM chatbots c WHERE {conditions}{filters}"
+    return sql, {f'term{i}': f'%{term}%' for i, term in enumerate(terms)}
+
+
+_HITS = {'sqlite': _sqlite_hits, 'postgresql': _postgresql_hits}
+
+
+def search_chatbots(query: str, owner_id: str | None = None, created_from: datetime | None = None,
+                    created_to: datetime | None = None, cursor: str | None = None, limit: int = 50):
+    """Chatbots matching all words of `query`, best first.
+
+    Returns a list of (chatbot, rank) and the cursor of the next page (None on the last page).
+    `owner_id` restricts the search to one user's chatbots, the dates to `created_from <= created < created_to`.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+
+    params = [bindparam('limit', limit + 1)]
+    filters = ''
+    if owner_id is not None:
+        filters += ' AND c.user_id = :owner_id'
+        params.append(bindparam('owner_id', owner_id))
+    if created_from is not None:
+        filters += ' AND c.created >= :created_from'
+        params.append(bindparam('created_from', created_from, type_=DateTime))
+    if created_to is not None:
+        filters += ' AND c.created < :created_to'
+        params.append(bindparam('created_to', created_to, type_=DateTime))
+    sql, values = _HITS.get(db.engine.dialect.name, _like_hits)(terms, filters)
+    params += [bindparam(name, value) for name, value in values.items()]
+
+    # page in the database: only the chatbots of this page are loaded below
+    after = ''
+    position = decode_cursor(cursor)
+    if position:
+        after = 'WHERE rank > :after_rank OR (rank = :after_rank AND chatbot_id > :after_id)'
+        params += [bindparam('after_rank', position[0], type_=Float), bindparam('after_id', position[1])]
+    page = text(f"SELECT chatbot_id, rank FROM ({sql}) ranked {after} ORDER BY rank, chatbot_id LIMIT :limit")
+    hits = page.bindparams(*params).columns(chatbot_id=String, rank=Float).subquery('hits')
+
+    # the catalog only shows the precomputed prompt preview
+    rows = (
+        db.session.query(ChatBot, hits.c.rank)
+        .join(hits, hits.c.chatbot_id == ChatBot.id)
+        .options(defer(ChatBot.systemprompt), joinedload(ChatBot.user))
+        .order_by(hits.c.rank, ChatBot.id)
+        .all()
+    )
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0].id) if len(rows) > limit else None
+    return [tuple(row) for row in rows[:limit]], next_cursor
@@ -1,39 +1,281 @@
-from datetime import datetime, timezone
+import click
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
-from utils import hash_password, generate_id6, generate_id8
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import make_url
+from utils import ID_LENGTH, generate_id, hash_password, utcnow
 
 # Flask-SQLAlchemy instance (call `init_db(app)` in your application factory)
 db = SQLAlchemy()
 
+# Password of the admin user created by `flask db init` (change it after the first login)
+DEFAULT_ADMIN_PASSWORD = 'hss'
 
-def init_db(app, create_tables: bool = False):
+
+def engine_options(config) -> dict:
+    """SQLAlchemy engine options from the app config (pool settings only apply to server databases)."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        # seconds the driver waits for a lock, the busy_timeout pragma is set on top (see sqlite_pragmas)
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def sqlite_pragmas(config):
+    """Connect listener that tunes every new SQLite connection.
+
+    WAL lets the catalog read while a chat writes, synchronous=NORMAL is safe with WAL and saves an
+    fsync per commit, busy_timeout waits for a lock instead of failing with "database is locked".
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+    if config['SQLITE_WAL']:
+        pragmas[:0] = ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL']
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+
+def sqlite_begin(conn, name):
+    """Savepoint listener: open the transaction before the first SAVEPOINT.
+
+    pysqlite only emits BEGIN in front of INSERT/UPDATE/DELETE; a SAVEPOINT outside a transaction
+    starts its own, and its RELEASE would commit everything up to there.
+    """
+    if not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql('BEGIN')
+
+
+def init_db(app):
+    """Configure the database for `app`; connects only on first use (see `create_database` for the schema)."""
+    for key, value in (
+        ('DB_POOL_SIZE', 10), ('DB_MAX_OVERFLOW', 20), ('DB_POOL_TIMEOUT', 30), ('DB_POOL_RECYCLE', 1800),
+        ('DB_POOL_PRE_PING', True), ('SQLITE_WAL', True), ('SQLITE_BUSY_TIMEOUT', 5000),
+        ('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    ):
+        app.config.setdefault(key, value)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     db.init_app(app)
-    if create_tables:
-        with app.app_context():
-            # db.drop_all()
-            db.create_all()
-
-    # Ensure default admin exists (username: 'admin', password: 'hss')
-    try:
-        with app.app_context():
-            if not User.query.filter_by(username='admin').first():
-                pwd_hash, pwd_salt = hash_password('hss')
-                admin = User(username='admin', password=pwd_hash, salt=pwd_salt)
-                db.session.add(admin)
-                db.session.commit()
-    except Exception:
-        # If creation fails, skip silently (don't crash startup)
-        pass
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', sqlite_pragmas(app.config))
+            event.listen(db.engine, 'savepoint', sqlite_begin)
+    app.cli.add_command(db_cli)
+
+
+def create_database(admin_password: str = DEFAULT_ADMIN_PASSWORD):
+    """Create missing tables, bring existing ones up to date and add the admin user if there is none."""
+    upgrade_database()
+    if not User.query.filter_by(username='admin').first():
+        db.session.add(User(username='admin', password=hash_password(admin_password)))
+        db.session.commit()
+
+
+def upgrade_database():
+    """Create the tables added since an older version and bring existing ones up to date.
+
+    There are no migration scripts: new tables come from `create_all`, new columns and indexes
+    from `upgrade_schema`.
+    """
+    db.create_all()
+    upgrade_schema()
+    backfill_display_fields()
+    create_search_index()
+
+
+db_cli = AppGroup('db', help='Create and upgrade the database.')
+
+
+@db_cli.command('init')
+@click.option('--admin-password', envvar='ADMIN_PASSWORD', default=DEFAULT_ADMIN_PASSWORD,
+              help='Password of the admin user, if it is created.')
+def init_command(admin_password):
+    """Create the tables and the admin user (safe to run again)."""
+    create_database(admin_password)
+    print(f"Datenbank eingerichtet: {db.engine.url.render_as_string(hide_password=True)}")
+
+
+@db_cli.command('migrate')
+def migrate_command():
+    """Add the tables, columns and indexes of this version to an existing database."""
+    upgrade_database()
+    print("Datenbank aktualisiert")
+
+
+def upgrade_schema():
+    """Add nullable columns and indexes that were introduced after a table was created, widen shorter columns.
+
+    `create_all` only creates missing tables, see `upgrade_database`.
+    """
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name']: c for c in inspector.get_columns(table.name)}
+        widen = widen_columns(table, existing, dialect)
+        if widen and dialect.name in ('mysql', 'mariadb'):
+            # a widened key and its foreign keys differ in length until all tables are altered
+            widen = ['SET FOREIGN_KEY_CHECKS=0', *widen, 'SET FOREIGN_KEY_CHECKS=1']
+        for statement in widen:
+            db.session.execute(text(statement))
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        db.session.commit()
+        existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
+
+
+def widen_columns(table, existing: dict, dialect) -> list:
+    """ALTER statements for string columns that are shorter in the database than in the model.
+
+    Ids and their foreign keys were 6/8 characters in older versions, now `ID_LENGTH`. SQLite doesn't enforce
+    the length (and can't alter a column), so nothing is needed there.
+    """
+    if dialect.name == 'sqlite':
+        return []
+    statements = []
+    for column in table.columns:
+        length = getattr(column.type, 'length', None)
+        old_length = getattr(existing[column.name]['type'], 'length', None) if column.name in existing else None
+        if not (length and old_length and old_length < length):
+            continue
+        column_type = column.type.compile(dialect=dialect)
+        if dialect.name == 'postgresql':
+            statements.append(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type}')
+        elif dialect.name in ('mysql', 'mariadb'):
+            null = 'NULL' if column.nullable else 'NOT NULL'
+            statements.append(f'ALTER TABLE {table.name} MODIFY {column.name} {column_type} {null}')
+        else:
+            raise click.ClickException(
+                f'{table.name}.{column.name} is {old_length} characters long, {length} are needed: '
+                f'widen it to {column_type} by hand ({dialect.name} is not upgraded automatically)'
+            )
+    return statements
+
+
+def backfill_display_fields():
+    """Fill the precomputed catalog fields of chatbots saved before they existed."""
+    chatbots = ChatBot.query.filter(ChatBot.created_display.is_(None)).all()
+    for chatbot in chatbots:
+        chatbot.update_display_fields()
+    if chatbots:
+        db.session.commit()
+
+
+# Catalog search (see catalog_search.py). SQLite: FTS5 tables over chatbots and text chunks that read the
+# text from the tables themselves (external content); triggers keep them in sync, also for bulk inserts
+# and deletes that bypass the ORM. Only the searched columns of chatbots fire the update trigger.
+SEARCH_TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+SQLITE_SEARCH_TABLES = {
+    'chatbot_search': f"""
+        CREATE VIRTUAL TABLE chatbot_search USING fts5(
+            name, welcomemessage, systemprompt, content='chatbots', content_rowid='rowid', {SEARCH_TOKENIZE})""",
+    'chatbot_textchunk_search': f"""
+        CREATE VIRTUAL TABLE chatbot_textchunk_search USING fts5(
+            content, content='chatbot_textchunks', content_rowid='id', {SEARCH_TOKENIZE})""",
+}
+SQLITE_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS chatbots_search_insert AFTER INSERT ON chatbots BEGIN
+        INSERT INTO chatbot_search (rowid, name, welcomemessage, systemprompt)
+        VALUES (new.rowid, new.name, new.welcomemessage, new.systemprompt);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbots_search_delete AFTER DELETE ON chatbots BEGIN
+        INSERT INTO chatbot_search (chatbot_search, rowid, name, welcomemessage, systemprompt)
+        VALUES ('delete', old.rowid, old.name, old.welcomemessage, old.systemprompt);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbots_search_update AFTER UPDATE OF name, welcomemessage, systemprompt ON chatbots BEGIN
+        INSERT INTO chatbot_search (chatbot_search, rowid, name, welcomemessage, systemprompt)
+        VALUES ('delete', old.rowid, old.name, old.welcomemessage, old.systemprompt);
+        INSERT INTO chatbot_search (rowid, name, welcomemessage, systemprompt)
+        VALUES (new.rowid, new.name, new.welcomemessage, new.systemprompt);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_textchunks_search_insert AFTER INSERT ON chatbot_textchunks BEGIN
+        INSERT INTO chatbot_textchunk_search (rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_textchunks_search_delete AFTER DELETE ON chatbot_textchunks BEGIN
+        INSERT INTO chatbot_textchunk_search (chatbot_textchunk_search, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_textchunks_search_update AFTER UPDATE OF content ON chatbot_textchunks BEGIN
+        INSERT INTO chatbot_textchunk_search (chatbot_textchunk_search, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO chatbot_textchunk_search (rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+# PostgreSQL: GIN indexes on the tsvector expressions the search uses (maintained by the database)
+PG_CHATBOT_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(welcomemessage, '') || ' ' || coalesce(systemprompt, ''))"
+)
+PG_TEXTCHUNK_DOCUMENT = "to_tsvector('simple', content)"
+PG_SEARCH_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS ix_chatbots_search ON chatbots USING gin ({PG_CHATBOT_DOCUMENT})",
+    f"CREATE INDEX IF NOT EXISTS ix_chatbot_textchunks_search ON chatbot_textchunks USING gin ({PG_TEXTCHUNK_DOCUMENT})",
+]
+
+
+def create_search_index():
+    """Create the full-text index of the catalog; a new FTS5 table is filled from the existing rows."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        inspector = inspect(db.engine)
+        for name, ddl in SQLITE_SEARCH_TABLES.items():
+            if not inspector.has_table(name):
+                db.session.execute(text(ddl))
+                db.session.execute(text(f"INSERT INTO {name} ({name}) VALUES ('rebuild')"))
+        for ddl in SQLITE_SEARCH_TRIGGERS:
+            db.session.execute(text(ddl))
+    elif dialect == 'postgresql':
+        for ddl in PG_SEARCH_INDEXES:
+            db.session.execute(text(ddl))
+    db.session.commit()
+
+
+def add_unique(obj, attempts: int = 3):
+    """Add and flush `obj`; if its id is already taken it gets a new one and is tried again.
+
+    Ids are time-ordered with a random part, a collision needs two processes in the same millisecond
+    drawing the same 30 random bits, but it must not lose the insert.
+    """
+    for attempt in range(attempts):
+        try:
+            with db.session.begin_nested():
+                db.session.add(obj)
+            return obj
+        except IntegrityError:
+            taken = db.session.get(type(obj), obj.id) is not None
+            if not taken or attempt == attempts - 1:
+                raise
+            obj.id = generate_id()
 
 
 class User(db.Model):
     __tablename__ = 'users'
 
-    id = db.Column(db.String(6), primary_key=True, default=generate_id6, unique=True)
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
     username = db.Column(db.String(150), unique=True, nullable=False, index=True)
     password = db.Column(db.String(255), nullable=False)
-    salt = db.Column(db.String(255), nullable=True)
-    created = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    salt = db.Column(db.String(255), nullable=True)  # only for hashes in the old format, see utils.verify_password
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
+    # counts the writes to the chatbots in the user's catalog (the admin's: all), see main.catalog_changed
+    catalog_version = db.Column(db.Integer, nullable=True)
 
     # Relationship: one user -> many chatbots
     chatbots = db.relationship('ChatBot', back_populates='user', cascade='all, delete-orphan')
@@ -42,47 +284,134 @@ class User(db.Model):
         return f"<User id={self.id} username={self.username}>"
 
 
+PROMPT_PREVIEW_LENGTH = 120
+
+
+def display_fields(systemprompt: str | None, created) -> dict:
+    """Precomputed catalog columns of a chatbot (also for bulk inserts, which skip the ORM events)."""
+    prompt = systemprompt or ''
+    return {
+        'prompt_preview': prompt[:PROMPT_PREVIEW_LENGTH] + '...' if len(prompt) > PROMPT_PREVIEW_LENGTH else prompt,
+        'created_display': created.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
 class ChatBot(db.Model):
     __tablename__ = 'chatbots'
+    __table_args__ = (
+        # keyset pagination of the catalog (all bots / bots of one user), newest first
+        db.Index('ix_chatbots_created_id', 'created', 'id'),
+        db.Index('ix_chatbots_user_created', 'user_id', 'created', 'id'),
+    )
 
-    id = db.Column(db.String(8), primary_key=True, default=generate_id8, unique=True)
-    user_id = db.Column(db.String(6), db.ForeignKey('users.id'), nullable=True)
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
+    user_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('users.id'), nullable=True)
     name = db.Column(db.String(255), nullable=True)
     systemprompt = db.Column(db.Text, nullable=True)
     welcomemessage = db.Column(db.Text, nullable=True)
-    created = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    token_budget = db.Column(db.Integer, nullable=True)  # max prompt tokens, None = default
+    version = db.Column(db.Integer, nullable=True, default=1)  # increased on every change (cache invalidation)
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
+    # display fields for the catalog, computed when the chatbot is saved (see update_display_fields)
+    prompt_preview = db.Column(db.String(PROMPT_PREVIEW_LENGTH + 3), nullable=True)
+    created_display = db.Column(db.String(16), nullable=True)
 
     user = db.relationship('User', back_populates='chatbots')
     text_files = db.relationship('ChatBotTextFile', back_populates='chatbot', cascade='all, delete-orphan')
     css_file = db.relationship('ChatBotCssFile', back_populates='chatbot', cascade='all, delete-orphan', uselist=False)
+    conversations = db.relationship('Conversation', back_populates='chatbot', cascade='all, delete-orphan')
+
+    def update_display_fields(self):
+        if self.created is None:
+            self.created = utcnow()
+        for name, value in display_fields(self.systemprompt, self.created).items():
+            setattr(self, name, value)
 
     def __repr__(self):
         return f"<ChatBot id={self.id} name={self.name} username={self.username}>"
 
 
+@event.listens_for(ChatBot, 'before_insert')
+def _chatbot_display_fields_insert(mapper, connection, chatbot):
+    chatbot.update_display_fields()
+
+
+@event.listens_for(ChatBot, 'before_update')
+def _chatbot_display_fields_update(mapper, connection, chatbot):
+    # only if the prompt changed (it may be deferred and not loaded otherwise)
+    if inspect(chatbot).attrs.systemprompt.history.has_changes():
+        chatbot.update_display_fields()
+
+
 class ChatBotTextFile(db.Model):
     __tablename__ = 'chatbot_textfiles'
 
-    id = db.Column(db.String(8), primary_key=True, default=generate_id8, unique=True)
-    chatbot_id = db.Column(db.String(8), db.ForeignKey('chatbots.id'), nullable=False)
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
+    chatbot_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('chatbots.id'), nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    created = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    # deferred: file bodies are only loaded for prompts/indexing and downloads
+    content = db.deferred(db.Column(db.Text, nullable=False))  # only older uploads, new ones live in the blob store
+    blob_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the raw upload
+    size = db.Column(db.Integer, nullable=True)  # bytes
+    encoding = db.Column(db.String(32), nullable=True)
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
 
     chatbot = db.relationship('ChatBot', back_populates='text_files')
+    # passive: the index rows are removed in bulk (retrieval.remove_file/remove_chatbot), never loaded for a delete
+    chunks = db.relationship('ChatBotTextChunk', back_populates='text_file', cascade='all, delete-orphan',
+                             passive_deletes=True)
 
     def __repr__(self):
         return f"<ChatBotTextFile id={self.id} chatbot_id={self.chatbot_id} filename={self.filename}>"
 
 
+class ChatBotTextChunk(db.Model):
+    """A section of a text file, the unit the retrieval index works on."""
+    __tablename__ = 'chatbot_textchunks'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    textfile_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('chatbot_textfiles.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    chatbot_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('chatbots.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    length = db.Column(db.Integer, nullable=False)  # number of index terms
+
+    text_file = db.relationship('ChatBotTextFile', back_populates='chunks')
+    terms = db.relationship('ChatBotTerm', back_populates='chunk', cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f"<ChatBotTextChunk id={self.id} textfile_id={self.textfile_id} position={self.position}>"
+
+
+class ChatBotTerm(db.Model):
+    """Inverted index: how often a term occurs in a chunk."""
+    __tablename__ = 'chatbot_terms'
+    __table_args__ = (db.Index('ix_chatbot_terms_chatbot_term', 'chatbot_id', 'term'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    chatbot_id = db.Column(db.String(ID_LENGTH), nullable=False)
+    term = db.Column(db.String(64), nullable=False)
+    chunk_id = db.Column(db.Integer, db.ForeignKey('chatbot_textchunks.id', ondelete='CASCADE'), nullable=False, index=True)
+    tf = db.Column(db.Integer, nullable=False)
+
+    chunk = db.relationship('ChatBotTextChunk', back_populates='terms')
+
+    def __repr__(self):
+        return f"<ChatBotTerm term={self.term} chunk_id={self.chunk_id} tf={self.tf}>"
+
+
 class ChatBotCssFile(db.Model):
     __tablename__ = 'chatbot_cssfiles'
 
-    id = db.Column(db.String(8), primary_key=True, default=generate_id8, unique=True)
-    chatbot_id = db.Column(db.String(8), db.ForeignKey('chatbots.id'), nullable=False, unique=True)
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
+    chatbot_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('chatbots.id'), nullable=False, unique=True)
     filename = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    created = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    minified = db.deferred(db.Column(db.Text, nullable=True))  # served version, see assets.minify_css
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the content, part of the URL
+    size = db.Column(db.Integer, nullable=True)  # bytes
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
 
     chatbot = db.relationship('ChatBot', back_populates='css_file')
 
@@ -90,3 +419,59 @@ class ChatBotCssFile(db.Model):
         return f"<ChatBotCssFile id={self.id} chatbot_id={self.chatbot_id} filename={self.filename}>"
 
 
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
+    chatbot_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('chatbots.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('users.id'), nullable=True)
+    summary = db.Column(db.Text, nullable=True)  # running summary of turns outside the prompt window
+    summary_upto = db.Column(db.Integer, nullable=True)  # id of the last message in the summary
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
+
+    chatbot = db.relationship('ChatBot', back_populates='conversations')
+    messages = db.relationship('Message', back_populates='conversation', cascade='all, delete-orphan', order_by='Message.id')
+
+    def __repr__(self):
+        return f"<Conversation id={self.id} chatbot_id={self.chatbot_id} user_id={self.user_id}>"
+
+
+class Message(db.Model):
+    __tablename__ = 'messages'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    conversation_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('conversations.id'), nullable=False, index=True)
+    role = db.Column(db.String(16), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
+
+    conversation = db.relationship('Conversation', back_populates='messages')
+
+    def to_dict(self):
+        return {"id": self.id, "role": self.role, "text": self.text}
+
+    def __repr__(self):
+        return f"<Message id={self.id} conversation_id={self.conversation_id} role={self.role}>"
+
+
+class Job(db.Model):
+    """Background work (see jobs.py); the row is the queue entry and the status shown to the user."""
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+
+    id = db.Column(db.String(ID_LENGTH), primary_key=True, default=generate_id, unique=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    key = db.Column(db.String(255), nullable=True, unique=True)  # idempotency key: one job per key
+    chatbot_id = db.Column(db.String(ID_LENGTH), nullable=True, index=True)  # for the status on the edit page
+    target_id = db.Column(db.String(ID_LENGTH), nullable=True)  # object the job works on, e.g. a text file
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)  # last error
+    run_after = db.Column(db.DateTime, nullable=False, default=utcnow)  # not before (retry backoff)
+    started = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+    created = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=func.now())
+
+    def __repr__(self):
+        return f"<Job id={self.id} kind={self.kind} status={self.status} attempts={self.attempts}>"
@@ -0,0 +1,376 @@
+"""Messhilfen und Metriken der App.
+
+- `count_queries` / `assert_max_queries`: Anzahl der SQL-Abfragen in einem
+  Codeabschnitt, für Tests und Benchmarks:
+
+      with assert_max_queries(db.engine, 3):
+          client.get('/catalog')
+
+- `init_metrics(app)`: Metriken im Prometheus-Textformat unter `/metrics`. Erfasst
+  werden die Latenz pro Route, Anzahl und Dauer der SQL-Abfragen pro Anfrage, die
+  Zeiten des LLM-Upstreams (Verbindungsaufbau, erstes Byte, gesamt) und die Größe
+  der Prompts in Tokens und Bytes. Die Werte gelten pro Prozess. Ohne
+  `METRICS_TOKEN` ist der Endpunkt gesperrt.
+
+- Sampling-Profiler pro Anfrage: mit `PROFILE_REQUESTS=1` wird eine Anfrage mit
+  `?_profile=1` alle paar Millisekunden abgetastet, das Ergebnis landet im
+  Collapsed-Stack-Format (für Flame Graphs) in `PROFILE_DIR`.
+"""
+import collections
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    """Count the SQL statements executed on `engine` inside the block."""
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_max_queries(engine, maximum: int):
+    """Fail if the block executes more than `maximum` SQL statements (catches N+1 regressions)."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > maximum:
+        statements = '\n'.join(counter.statements)
+        raise AssertionError(f'{counter.count} queries executed, expected at most {maximum}:\n{statements}')
+
+
+# -- metrics -----------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_INF = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+
+
+class Histogram:
+    """Observations counted into buckets per label combination (Prometheus histogram)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [count per bucket ..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            count = cumulative + series[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'chatbot_http_request_duration_seconds', 'Request latency until the response is sent completely.',
+    ('method', 'route', 'status'),
+)
+REQUEST_QUERIES = registry.histogram(
+    'chatbot_http_request_db_queries', 'SQL statements per request.',
+    ('route',), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_TIME = registry.histogram(
+    'chatbot_http_request_db_seconds', 'Time spent in SQL statements per request.', ('route',),
+)
+UPSTREAM_CONNECT = registry.histogram(
+    'chatbot_upstream_connect_seconds', 'Connection setup to the LLM upstream (0 for a reused connection).',
+    ('client', 'stream'),
+)
+UPSTREAM_TTFB = registry.histogram(
+    'chatbot_upstream_ttfb_seconds', 'From sending the request to the response headers of the LLM upstream.',
+    ('client', 'stream'),
+)
+UPSTREAM_TOTAL = registry.histogram(
+    'chatbot_upstream_total_seconds', 'Whole LLM upstream call including retries, until the body is read.',
+    ('client', 'stream', 'outcome'),
+)
+UPSTREAM_CALLS = registry.counter(
+    'chatbot_upstream_calls_total', 'LLM upstream calls by outcome.', ('client', 'stream', 'outcome'),
+)
+PROMPT_TOKENS = registry.histogram(
+    'chatbot_prompt_tokens', 'Estimated tokens of the assembled prompt.',
+    buckets=(100, 250, 500, 1000, 2000, 3000, 4000, 8000, 16000),
+)
+PROMPT_BYTES = registry.histogram(
+    'chatbot_prompt_bytes', 'Size of the prompt messages as JSON.',
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576),
+)
+
+
+class RequestStats:
+    """SQL statements and their time within one request, filled by the engine event hooks."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.status = 500  # until a response is started
+
+    def finish(self, method: str, route: str):
+        REQUEST_LATENCY.observe(time.perf_counter() - self.started, method=method, route=route, status=self.status)
+        REQUEST_QUERIES.observe(self.queries, route=route)
+        REQUEST_DB_TIME.observe(self.db_seconds, route=route)
+
+
+_current_request = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def track_request(method: str, route: str):
+    """Record latency and SQL statements of a request that doesn't go through Flask (see asgi.py)."""
+    stats = RequestStats()
+    token = _current_request.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_request.reset(token)
+        stats.finish(method, route)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def observe_upstream(timing):
+    """Observer for `upstream.UpstreamClient` / `AsyncUpstreamClient`."""
+    labels = {'client': timing.client, 'stream': str(timing.stream).lower()}
+    UPSTREAM_CALLS.inc(outcome=timing.outcome, **labels)
+    UPSTREAM_TOTAL.observe(timing.total, outcome=timing.outcome, **labels)
+    if timing.ttfb is not None:
+        UPSTREAM_CONNECT.observe(timing.connect, **labels)
+        UPSTREAM_TTFB.observe(timing.ttfb, **labels)
+
+
+def observe_prompt(messages, usage: dict):
+    PROMPT_TOKENS.observe(sum(usage.get(part, 0) for part in ('system', 'summary', 'history', 'files')))
+    PROMPT_BYTES.observe(len(json.dumps(messages, ensure_ascii=False).encode('utf-8')))
+
+
+# -- profiler ----------------------------------------------------------
+
+class SamplingProfiler:
+    """Samples the stack of one thread every `interval` seconds from a background thread.
+
+    Cheap enough for single requests; the result is in the collapsed stack format
+    (`frame;frame;frame count`) that flame graph tools read.
+    """
+
+    def __init__(self, thread_id: int | None = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> collections.Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def folded(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# -- Flask -------------------------------------------------------------
+
+def _route() -> str:
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_metrics(app):
+    """Record request, SQL and profile data for every request and serve `/metrics`.
+
+    Config: `METRICS_TOKEN` (`/metrics` needs `Authorization: Bearer <token>`, without a token it is off),
+    `PROFILE_REQUESTS`, `PROFILE_INTERVAL` (seconds between samples) and `PROFILE_DIR` (see module docstring).
+    """
+    app.config.setdefault('METRICS_TOKEN', '')
+    app.config.setdefault('PROFILE_REQUESTS', False)
+    app.config.setdefault('PROFILE_INTERVAL', 0.005)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_stats = RequestStats()
+        _current_request.set(g.request_stats)
+        g.profiler = None
+        if app.config['PROFILE_REQUESTS'] and request.args.get('_profile') == '1':
+            g.profiler = SamplingProfiler(interval=app.config['PROFILE_INTERVAL']).start()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        stats.status = response.status_code
+        method, route, profiler = request.method, _route(), g.get('profiler')
+        if profiler is not None:
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{os.getpid()}.folded"
+            response.headers['X-Profile'] = filename
+
+        def on_close():
+            # after the body is sent: streamed responses are measured completely
+            _current_request.set(None)
+            stats.finish(method, route)
+            if profiler is not None:
+                profiler.stop()
+                os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+                with open(os.path.join(app.config['PROFILE_DIR'], filename), 'w', encoding='utf-8') as f:
+                    f.write(profiler.folded())
+
+        response.call_on_close(on_close)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        # without a token nobody gets in: behind a proxy every request would look local
+        if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,240 @@
+"""Hintergrund-Jobs für aufwendige Arbeit nach dem Hochladen (z.B. Indexieren).
+
+Die Warteschlange ist die Tabelle `jobs` in der App-Datenbank: ein Job wird in
+derselben Transaktion eingetragen wie die Daten, die er verarbeitet, und ist damit
+genau dann sichtbar, wenn sie committet sind. Jeder Prozess startet beim ersten
+Request `JOB_WORKERS` Worker-Threads; alternativ verarbeitet `flask jobs work`
+die Jobs in einem eigenen Prozess (dann `JOB_WORKERS=0` für die Web-Prozesse).
+
+- Ein Job wird mit einem bedingten UPDATE übernommen, so bekommt ihn auch bei
+  mehreren Prozessen nur ein Worker.
+- Fehlgeschlagene Jobs werden mit exponentiellem Backoff erneut versucht, nach
+  `JOB_MAX_ATTEMPTS` Versuchen bleiben sie mit Fehlermeldung auf `failed`.
+- Ein Idempotenz-Schlüssel (`key`) verhindert doppelte Jobs für dieselbe Arbeit.
+- Jobs, die länger als `JOB_STALE_AFTER` Sekunden laufen (Prozess abgestürzt),
+  werden erneut vergeben. Handler müssen daher wiederholbar sein.
+"""
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from db import Job, add_unique, db
+from utils import utcnow
+
+
+class JobQueue:
+    def __init__(self, workers: int = 2, poll_interval: float = 1.0, max_attempts: int = 5,
+                 backoff: float = 2.0, max_backoff: float = 300.0, stale_after: float = 600.0,
+                 retention: float = 7 * 24 * 3600):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stale_after = stale_after
+        self.retention = retention  # seconds finished jobs are kept
+        self.app = None
+        self._handlers = {}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def handler(self, kind: str):
+        """Register the function that runs jobs of `kind`; it gets the payload dict."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    # -- enqueue ---------------------------------------------------------
+
+    def enqueue(self, kind: str, payload: dict | None = None, key: str | None = None,
+                chatbot_id: str | None = None, target_id: str | None = None) -> Job:
+        """Add a job to the current transaction (it runs once the caller commits, then call `notify`).
+
+        With a `key` that already has a job, that job is returned instead; a failed one is queued again.
+        """
+        if key is not None:
+            existing = Job.query.filter_by(key=key).first()
+            if existing is not None:
+                return self._requeue(existing)
+        job = Job(kind=kind, payload=json.dumps(payload or {}), key=key, chatbot_id=chatbot_id, target_id=target_id)
+        try:
+            return add_unique(job)
+        except IntegrityError:
+            # another request enqueued the same key in the meantime
+            existing = Job.query.filter_by(key=key).first()
+            if key is None or existing is None:
+                raise
+            return self._requeue(existing)
+
+    def _requeue(self, job: Job) -> Job:
+        if job.status == 'failed':
+            job.status, job.attempts, job.error, job.run_after = 'queued', 0, None, utcnow()
+        return job
+
+    def notify(self):
+        """Wake the local workers (after the commit that made new jobs visible)."""
+        self.start()
+        self._wakeup.set()
+
+    # -- processing ------------------------------------------------------
+
+    def _claim(self):
+        now = utcnow()
+        claimable = or_(
+            and_(Job.status == 'queued', Job.run_after <= now),
+            and_(Job.status == 'running', Job.started < now - timedelta(seconds=self.stale_after)),
+        )
+        job_id = db.session.execute(
+            select(Job.id).where(claimable).order_by(Job.run_after, Job.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        # only one worker wins: the row must still be claimable when it is updated
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, claimable)
+            .values(status='running', attempts=Job.attempts + 1, started=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return db.session.get(Job, job_id) if claimed else None
+
+    def _delay(self, attempts: int) -> float:
+        delay = min(self.backoff * (2 ** (attempts - 1)), self.max_backoff)
+        return delay * (0.5 + random.random() / 2)
+
+    def run_next(self) -> bool:
+        """Claim and run one job (needs an app context). Returns False if no job was due."""
+        job = self._claim()
+        if job is None:
+            return False
+        job_id, attempts = job.id, job.attempts
+        handler = self._handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f'no handler for job kind {job.kind!r}')
+            handler(json.loads(job.payload or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.error = f'{type(e).__name__}: {e}'
+            if handler is not None and attempts < self.max_attempts:
+                job.status = 'queued'
+                job.run_after = utcnow() + timedelta(seconds=self._delay(attempts))
+            else:
+                job.status = 'failed'
+                job.finished = utcnow()
+            db.session.commit()
+            if self.app is not None:
+                self.app.logger.warning('Job %s (%s) failed, attempt %s: %s', job_id, job.kind, attempts, job.error)
+            return True
+
+        # committed together with whatever the handler left uncommitted
+        db.session.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status='done', error=None, finished=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return True
+
+    def purge(self) -> int:
+        """Delete finished jobs older than `retention`."""
+        cutoff = utcnow() - timedelta(seconds=self.retention)
+        deleted = db.session.execute(delete(Job).where(Job.status == 'done', Job.finished < cutoff)).rowcount
+        db.session.commit()
+        return deleted
+
+    def _work(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_next()
+                    if not ran and time.monotonic() - last_purge > 3600:
+                        self.purge()
+                        last_purge = time.monotonic()
+            except Exception:
+                # e.g. database locked: try again later, the job stays claimable
+                self.app.logger.exception('Job worker error')
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start(self):
+        """Start the worker threads of this process (once)."""
+        if not self.workers or self._threads or self.app is None:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    # -- Flask -----------------------------------------------------------
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.before_request
+        def start_job_workers():
+            # started per process on first use, not at import (a pre-forking server would lose the threads)
+            if not self._threads:
+                self.start()
+
+        jobs_cli = AppGroup('jobs', help='Background jobs.')
+        app.cli.add_command(jobs_cli)
+
+        @jobs_cli.command('work')
+        @click.option('--once', is_flag=True, help='Run the due jobs and exit.')
+        def work_command(once):
+            """Process jobs in this process (use with JOB_WORKERS=0 for the web processes)."""
+            if once:
+                count = 0
+                while self.run_next():
+                    count += 1
+                print(f"{count} Jobs verarbeitet")
+                return
+            print(f"Verarbeite Jobs ({self.workers or 1} Threads), Strg+C beendet")
+            self.workers = self.workers or 1
+            self.start()
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                self.stop()
+
+        @jobs_cli.command('status')
+        def status_command():
+            """Number of jobs per kind and status."""
+            rows = db.session.execute(
+                select(Job.kind, Job.status, db.func.count()).group_by(Job.kind, Job.status).order_by(Job.kind)
+            ).all()
+            for kind, status, count in rows:
+                print(f"{kind:24} {status:8} {count}")
+
+
+def pending_jobs(chatbot_id: str) -> dict:
+    """Unfinished and failed jobs of a chatbot by target id (latest job per target)."""
+    jobs = Job.query.filter(Job.chatbot_id == chatbot_id, Job.status != 'done').order_by(Job.created).all()
+    return {job.target_id: job for job in jobs}
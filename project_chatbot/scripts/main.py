@@ -1,111 +1,429 @@
 import json
 import os
-import urllib.request
+from datetime import datetime
+
+import click
+from flask import Blueprint, Flask, Response, current_app, flash, g, jsonify, redirect, render_template, request, session, stream_with_context, url_for
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from sqlalchemy import func, or_, tuple_, update
+from sqlalchemy.orm import defer, joinedload, undefer
+
+from assets import STATIC_ENDPOINTS, fingerprint, init_assets, minify_css
+from auth import ChatBotConfig, LoginThrottle, chatbot_required, invalidate_chatbot_config, login_required
+from buildinfo import load_build_info, write_version_file
+from catalog_search import SearchError, date_range, search_chatbots
+from db import ChatBot, ChatBotCssFile, ChatBotTextFile, Conversation, Message, User, add_unique, create_database, db, init_db
+from instrumentation import init_metrics, observe_prompt, observe_upstream
+from jobs import JobQueue, pending_jobs
+from passwords import PasswordBusy, make_pool
+from prompt import MAX_ANSWER_TOKENS, PromptBuilder, parse_token_budget
+from response_cache import cache_key, make_cache
+from retrieval import ensure_indexed, index_file, remove_chatbot, remove_file, search
+from transfer import IMPORT_BATCH, TransferError, export_records, gzip_stream, import_archive
+from uploads import RELEASE_JOB, UploadError, check_bot_quota, content_hash, delete_unused_blobs, iter_file_text, read_upload_text, release_blobs, store_upload
+from upstream import CircuitBreaker, UpstreamClient
+from utils import needs_rehash
 
-from flask import Flask, flash, g, jsonify, redirect, render_template, request, session, url_for
+open_ai_api_secret = os.environ.get('OPEN_AI_API_SECRET', '')
+open_ai_base_url = os.environ.get('OPEN_AI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+
+# Shared keep-alive client for the LLM upstream (pool, retries, circuit breaker)
+llm_client = UpstreamClient(
+    open_ai_base_url,
+    open_ai_api_secret,
+    pool_size=int(os.environ.get('OPEN_AI_POOL_SIZE', '4')),
+    timeout=float(os.environ.get('OPEN_AI_TIMEOUT', '15')),
+    max_retries=int(os.environ.get('OPEN_AI_MAX_RETRIES', '3')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('OPEN_AI_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('OPEN_AI_BREAKER_RESET', '30')),
+    ),
+    observer=observe_upstream,
+)
 
-from db import ChatBot, ChatBotCssFile, ChatBotTextFile, User, db, init_db
-from utils import get_git_info, hash_password, verify_password
+# Per-process instance data (caches, compiled templates, profiles); the app uses the same directory
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
 
-open_ai_api_secret = os.environ.get('OPEN_AI_API_SECRET', '')
+# Background jobs (indexing of uploads), see jobs.py; JOB_WORKERS=0 if `flask jobs work` runs them
+job_queue = JobQueue(
+    workers=int(os.environ.get('JOB_WORKERS', '2')),
+    poll_interval=float(os.environ.get('JOB_POLL_INTERVAL', '1')),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', '5')),
+    backoff=float(os.environ.get('JOB_BACKOFF', '2')),
+    stale_after=float(os.environ.get('JOB_STALE_AFTER', '600')),
+)
 
-app = Flask(
-    __name__,
-    template_folder="../app/templates",
-    static_folder="../app/static",
+# Prompt assembly within a token budget (per chatbot, see ChatBot.token_budget)
+prompt_builder = PromptBuilder(
+    budget=int(os.environ.get('PROMPT_TOKEN_BUDGET', '3000')),
+    reserve=MAX_ANSWER_TOKENS,
 )
 
-# Secret key for session and flashing; prefer environment variable.
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret')
+# Number of text file sections passed to the model per turn
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '4'))
 
-# Database configuration (can be overridden by environment variable)
-app.config.setdefault(
-    'SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///chatbot.db')
+# Cache for answers to identical requests (backend: memory, sqlite or off)
+response_cache = make_cache(
+    os.environ.get('RESPONSE_CACHE_BACKEND', 'memory'),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '3600')),
+    max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', '1000')),
+    path=os.environ.get('RESPONSE_CACHE_PATH', os.path.join(INSTANCE_DIR, 'response_cache.db')),
 )
-app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
 
-# Initialize the database
-init_db(app, create_tables=True)
+# Password hashing in a bounded process pool (PASSWORD_WORKERS, PASSWORD_MAX_PENDING)
+password_pool = make_pool()
 
-def _chat_key(chatbot_id: str) -> str:
-    return f"chat_history_{chatbot_id}"
+# Failed logins per IP / per username within LOGIN_WINDOW seconds before logins are refused
+# (at most LOGIN_MAX_KEYS IPs and usernames are tracked, the oldest are dropped first)
+login_throttle = LoginThrottle(
+    per_ip=int(os.environ.get('LOGIN_MAX_PER_IP', '20')),
+    per_username=int(os.environ.get('LOGIN_MAX_PER_USERNAME', '5')),
+    window=float(os.environ.get('LOGIN_WINDOW', '300')),
+    max_keys=int(os.environ.get('LOGIN_MAX_KEYS', '100000')),
+)
 
-def get_chat_history(chatbot_id: str):
-    return session.get(_chat_key(chatbot_id), [])
+# Messages rendered with the chat page and per page of older messages
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', '50'))
 
-def append_chat(chatbot_id: str, role: str, text: str):
-    key = _chat_key(chatbot_id)
-    history = session.get(key, [])
-    history.append({"role": role, "text": text})
-    session[key] = history
-    session.modified = True
+# Chatbots per catalog page
+CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', '50'))
 
-# Try calling OpenAI Chat Completions to generate the bot answer.
-def call_openai(chatbot, history):
-    if not open_ai_api_secret:
-        return None
+# Rendered catalog rows per user and page, dropped on chatbot writes (CATALOG_CACHE_SIZE=0: off)
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '500'))
+catalog_cache = make_cache(
+    'memory' if CATALOG_CACHE_SIZE else 'off',
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', '600')),
+    max_entries=CATALOG_CACHE_SIZE,
+)
+CATALOG_ADMIN_GROUP = '*admin*'
 
-    messages = []
-    if getattr(chatbot, 'systemprompt', None):
-        messages.append({
-            'role': 'system',
-            'content': chatbot.systemprompt
-        })
+# Routes and CLI commands of the app, registered by `create_app`
+bp = Blueprint('main', __name__, cli_group=None)
 
-    try:
-        for tf in getattr(chatbot, 'text_files', []) or []:
-            filename = getattr(tf, 'filename', None)
-            content = getattr(tf, 'content', None)
-            if content:
-                file_header = f"Reference file: {filename}\n" if filename else "Reference file:\n"
-                messages.append({'role': 'system', 'content': file_header + content})
-    except Exception:
-        pass
 
-    for item in history:
-        role = item.get('role')
-        content = item.get('text')
-        if role and content is not None:
-            messages.append({'role': role, 'content': content})
+def create_app(config: dict | None = None) -> Flask:
+    """Create the app: settings from the environment, overridden by `config`.
 
+    Nothing here touches the database, connections are opened on first use. Tables and the
+    admin user are created by `flask db init`, later schema changes applied by `flask db migrate`.
+    """
+    app = Flask(
+        __name__,
+        template_folder="../app/templates",
+        static_folder="../app/static",
+        instance_path=INSTANCE_DIR,
+    )
+
+    # Secret key for session and flashing; prefer environment variable.
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret')
+
+    # Database configuration (can be overridden by environment variable)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///chatbot.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Connection pool for server databases (PostgreSQL, MySQL), see db.engine_options
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '10'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    # SQLite: WAL journal, lock wait in ms and memory-mapped I/O in bytes, see db.sqlite_pragmas
+    app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+    # Upload limits in bytes: whole request, single text file, all text files of a chatbot, CSS file
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+    app.config['MAX_UPLOAD_FILE_SIZE'] = int(os.environ.get('MAX_UPLOAD_FILE_SIZE', 10 * 1024 * 1024))
+    app.config['MAX_BOT_UPLOAD_SIZE'] = int(os.environ.get('MAX_BOT_UPLOAD_SIZE', 50 * 1024 * 1024))
+    app.config['MAX_CSS_FILE_SIZE'] = int(os.environ.get('MAX_CSS_FILE_SIZE', 256 * 1024))
+    # Upload limit for chatbot archives (`/chatbots/import`), they are spooled to disk while parsing
+    app.config['MAX_IMPORT_SIZE'] = int(os.environ.get('MAX_IMPORT_SIZE', 1024 * 1024 * 1024))
+    # Directory for uploaded text files (content-addressed, gzip), default: instance/blobs
+    app.config['BLOB_DIR'] = os.environ.get('BLOB_DIR')
+    # Seconds an unused blob is kept, a concurrent upload of the same content may still be committing
+    app.config['BLOB_GRACE_PERIOD'] = float(os.environ.get('BLOB_GRACE_PERIOD', '3600'))
+
+    # Compiled templates are cached on disk, a new worker doesn't compile them again
+    app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+
+    # Prometheus metrics on /metrics (only with a token) and the per-request sampling profiler (`?_profile=1`)
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+    app.config['PROFILE_REQUESTS'] = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+    app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL', '0.005'))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    app.config.update(config or {})
+
+    os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])}
+
+    init_db(app)
+    # Hashed, precompressed static files from `flask build-assets` (if built)
+    init_assets(app)
+    init_metrics(app)
+    job_queue.init_app(app)
+    app.register_blueprint(bp)
+
+    # Resolve version info once at startup instead of on every render
+    load_build_info()
+    return app
+
+
+# Chat history lives in the database, the session only holds the conversation id
+def _conversation_key(chatbot_id: str) -> str:
+    return f"conversation_{chatbot_id}"
+
+def create_conversation(chatbot_id: str, user_id: str | None) -> str:
+    conversation = add_unique(Conversation(chatbot_id=chatbot_id, user_id=user_id))
+    db.session.commit()
+    return conversation.id
+
+def append_message(conversation_id: str, role: str, text: str) -> int:
+    message = Message(conversation_id=conversation_id, role=role, text=text)
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+def _conversation_id(chatbot_id: str, create: bool = False):
+    conversation_id = session.get(_conversation_key(chatbot_id))
+    if conversation_id or not create:
+        return conversation_id
+
+    user = g.get('user')
+    conversation_id = create_conversation(chatbot_id, user.id if user else None)
+    session[_conversation_key(chatbot_id)] = conversation_id
+    return conversation_id
+
+def get_chat_history(chatbot_id: str, before: int | None = None, after: int | None = None,
+                     limit: int | None = None):
+    """Messages of the current conversation, oldest first, and whether there are more.
+
+    Default: the last `limit` messages. `before`: the `limit` messages older than that id
+    (scrolling up). `after`: all messages newer than that id (tail after a reconnect).
+    """
+    limit = limit or CHAT_HISTORY_PAGE_SIZE
+    conversation_id = _conversation_id(chatbot_id)
+    if not conversation_id:
+        return [], False
+    query = Message.query.filter(Message.conversation_id == conversation_id)
+    if after is not None:
+        messages = query.filter(Message.id > after).order_by(Message.id).all()
+        return [m.to_dict() for m in messages], False
+    if before is not None:
+        query = query.filter(Message.id < before)
+    messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    return [m.to_dict() for m in reversed(messages[:limit])], has_more
+
+def append_chat(chatbot_id: str, role: str, text: str) -> int:
+    return append_message(_conversation_id(chatbot_id, create=True), role, text)
+
+def fallback_answer(msg: str) -> str:
+    return f"Antwort: Ich habe verstanden: {msg}"
+
+def build_prompt(chatbot, conversation_id: str | None = None):
+    """Assemble the prompt for a conversation (default: the current one) and cache the updated summary.
+
+    `chatbot` is a `ChatBot` or a cached `ChatBotConfig` (system prompt part rendered once per version).
+    """
+    conversation_id = conversation_id or _conversation_id(chatbot.id)
+    conversation = Conversation.query.get(conversation_id) if conversation_id else None
+    summary_upto = (conversation.summary_upto or 0) if conversation else 0
+
+    # messages already folded into the summary don't need to be loaded again
+    history = []
+    if conversation:
+        history = [
+            m.to_dict() for m in Message.query
+            .filter(Message.conversation_id == conversation.id, Message.id > summary_upto)
+            .order_by(Message.id)
+        ]
+
+    # only the text file sections that match the current question
+    question = next((m['text'] for m in reversed(history) if m['role'] == 'user'), '')
+    ensure_indexed(chatbot.id)
+    files = search(chatbot.id, question, top_k=RETRIEVAL_TOP_K)
+    built = prompt_builder.build(
+        chatbot.systemprompt,
+        files,
+        history,
+        summary=conversation.summary if conversation else '',
+        summary_upto=summary_upto,
+        budget=chatbot.token_budget,
+        system_part=chatbot.prompt_prefix(prompt_builder) if isinstance(chatbot, ChatBotConfig) else None,
+    )
+    observe_prompt(built.messages, built.usage)
+
+    if conversation and built.summary_upto != summary_upto:
+        conversation.summary = built.summary
+        conversation.summary_upto = built.summary_upto
+        db.session.commit()
+
+    built.cache_key = cache_key(chatbot.id, chatbot.version, completion_payload(built.messages))
+    return built
+
+def chatbot_changed(chatbot):
+    """Call on every change of a chatbot or its files: new version, cached answers are dropped."""
+    chatbot.version = (chatbot.version or 0) + 1
+    response_cache.invalidate(chatbot.id)
+    invalidate_chatbot_config(chatbot.id)
+    catalog_changed(chatbot.user_id)
+
+def catalog_changed(user_id: str | None):
+    """Drop the cached catalog pages that show chatbots of `user_id` (own pages and the admin's).
+
+    Also counts up the catalog version of the user and the admin in the current transaction (the caller commits),
+    pages cached by other worker processes have the old version in their key.
+    """
+    catalog_cache.invalidate(user_id)
+    catalog_cache.invalidate(CATALOG_ADMIN_GROUP)
+    if not CATALOG_CACHE_SIZE:
+        return
+    db.session.execute(
+        update(User)
+        .where(or_(User.id == user_id, User.username == 'admin'))
+        .values(catalog_version=func.coalesce(User.catalog_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def completion_payload(messages, stream: bool = False):
     payload = {
         'model': 'gpt-3.5-turbo',
         'messages': messages,
         'temperature': 0.7,
-        'max_tokens': 300,
+        'max_tokens': MAX_ANSWER_TOKENS,
     }
+    if stream:
+        payload['stream'] = True
+    return payload
+
+def cached_answer(chatbot_id: str, prompt):
+    """Answer from the response cache or from OpenAI (None if both fail)."""
+    bot_answer = response_cache.get(prompt.cache_key)
+    if not bot_answer:
+        bot_answer = call_openai(prompt.messages)
+        if bot_answer:
+            response_cache.set(prompt.cache_key, chatbot_id, bot_answer)
+    return bot_answer
+
+# Try calling OpenAI Chat Completions to generate the bot answer.
+def call_openai(messages):
+    if not open_ai_api_secret:
+        return None
 
     try:
-        req = urllib.request.Request(
-            'https://api.openai.com/v1/chat/completions',
-            data=json.dumps(payload).encode('utf-8'),
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {open_ai_api_secret}'
-            }
-        )
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            resp_text = resp.read().decode('utf-8')
-            resp_json = json.loads(resp_text)
-            return resp_json['choices'][0]['message']['content'].strip()
-    except Exception as e:
-        print(f"Error calling OpenAI: {e}")
+        resp_json = llm_client.post_json('/chat/completions', completion_payload(messages))
+        return resp_json['choices'][0]['message']['content'].strip()
+    except Exception:
+        current_app.logger.exception('Error calling OpenAI')
         return None
 
-@app.context_processor
+def stream_openai(messages):
+    """Yield answer tokens as the upstream produces them (OpenAI SSE format)."""
+    if not open_ai_api_secret:
+        return
+
+    try:
+        for line in llm_client.stream_lines('/chat/completions', completion_payload(messages, stream=True)):
+            token = token_from_sse_line(line)
+            if token:
+                yield token
+    except Exception:
+        current_app.logger.exception('Error streaming from OpenAI')
+
+def token_from_sse_line(line: str):
+    """Answer token of one line of the upstream SSE stream (None for other lines)."""
+    line = line.strip()
+    if not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        # keep reading to the end so the connection can be reused
+        return None
+    delta = json.loads(data)['choices'][0].get('delta') or {}
+    return delta.get('content')
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ''
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@bp.app_context_processor
 def inject_git_info():
     """Inject git info into all templates."""
-    commit_id, git_tag = get_git_info()
-    return {
-        'version': git_tag or (commit_id[:7] if commit_id else 'dev'),
-        'git_tag': git_tag,
-        'git_commit': commit_id,
-    }
+    return load_build_info()
 
-@app.before_request
+@bp.route('/cache/stats')
+def cache_stats():
+    """Treffer/Fehlschläge des Antwort-Caches (nur Admin)."""
+    user = g.get('user')
+    if not user or user.username != 'admin':
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return jsonify({"ok": True, "entries": response_cache.size(), **response_cache.stats.as_dict()})
+
+@bp.route('/version')
+def version():
+    return jsonify(load_build_info())
+
+@bp.cli.command('write-version')
+def write_version_command():
+    """Write the git version into the version file (for image builds)."""
+    info = write_version_file()
+    print(f"Version: {info['version']}")
+
+chatbots_cli = AppGroup('chatbots', help='Export and import chatbots with their files.')
+bp.cli.add_command(chatbots_cli)
+
+@chatbots_cli.command('export')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--user', 'username', help='Only the chatbots of this user.')
+def export_command(output, username):
+    """Write all chatbots as a gzip-compressed NDJSON archive to OUTPUT (default: stdout)."""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'Unknown user: {username}')
+        user_id = user.id
+    for chunk in gzip_stream(export_records(user_id)):
+        output.write(chunk)
+
+@chatbots_cli.command('import')
+@click.argument('archive', type=click.File('rb'))
+@click.option('--owner', default='admin', show_default=True, help='Owner of chatbots whose user does not exist here.')
+@click.option('--keep-owners/--no-keep-owners', default=True, show_default=True,
+              help='Assign chatbots to the user with the exported username.')
+@click.option('--batch', default=IMPORT_BATCH, show_default=True, help='Chatbots per transaction.')
+@click.option('--no-index', is_flag=True, help='Build the retrieval index on first use instead of now.')
+def import_command(archive, owner, keep_owners, batch, no_index):
+    """Import chatbots from an archive written by `flask chatbots export` (- for stdin)."""
+    user = User.query.filter_by(username=owner).first()
+    if user is None:
+        raise click.ClickException(f'Unknown user: {owner}')
+    try:
+        result = import_archive(archive, user.id, keep_owners=keep_owners, batch=batch, index=not no_index)
+    except TransferError as e:
+        raise click.ClickException(str(e))
+    for user_id in result.owner_ids:
+        catalog_changed(user_id)
+    db.session.commit()
+    print(f"{result.chatbots} Chatbots, {result.text_files} Textdateien importiert")
+
+@bp.app_errorhandler(413)
+def request_too_large(e):
+    limit = request.max_content_length // (1024 * 1024)
+    flash(f'Upload zu groß (max. {limit} MB pro Anfrage).', 'error')
+    return redirect(request.referrer or url_for('main.catalog'))
+
+@bp.before_app_request
 def load_logged_in_user():
     """Load user object into `g.user` if logged in via session."""
     g.user = None
+    if request.endpoint in STATIC_ENDPOINTS:
+        # static files don't need the user, skip the query
+        return
     user_id = session.get('user_id')
     if user_id and User is not None:
         try:
@@ -113,12 +431,10 @@ def load_logged_in_user():
         except Exception:
             g.user = None
 
-@app.route('/')
+@bp.route('/')
+@login_required()
 def home():
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
+    user = g.user
 
     return render_template(
         'index.html',
@@ -127,128 +443,306 @@ def home():
     )
 
 
-@app.route('/cb/<string:chatbot_id>')
+@bp.route('/cb/<string:chatbot_id>')
+@chatbot_required()
 def cb(chatbot_id):
     """Zeigt die Chat-Seite für einen spezifischen Chatbot"""
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
-
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot:
-        flash('Chatbot nicht gefunden.', 'error')
-        return redirect(url_for('catalog'))
-
-    # Berechtigung: Admin darf alle, sonst nur eigene
-    if user.username != 'admin' and chatbot.user_id != user.id:
-        flash('Keine Berechtigung für diesen Chatbot.', 'error')
-        return redirect(url_for('catalog'))
-
-    history = get_chat_history(chatbot_id)
+    user, chatbot = g.user, g.chatbot
+    # only the last messages, older ones are loaded on scroll (see cb_history)
+    history, has_more = get_chat_history(chatbot_id)
 
     return render_template(
         'chat.html',
         title=chatbot.name or 'Chat',
         username=user.username,
         chatbot=chatbot,
-        history=history
+        css_url=chatbot_css_url(chatbot),
+        history=history,
+        has_more=has_more,
     )
 
-@app.route('/cb/<string:chatbot_id>/send_json', methods=['POST'])
+def chatbot_css_url(chatbot):
+    """Fingerprinted URL of the chatbot's CSS (None without CSS file)."""
+    css_file = chatbot.css_file
+    if not css_file:
+        return None
+    if not css_file.content_hash:
+        # uploaded before hashes were stored: compute once
+        css_file.content_hash = content_hash(css_file.content)
+        css_file.minified = minify_css(css_file.content)
+        db.session.commit()
+    return url_for('main.cb_style', chatbot_id=chatbot.id, css_hash=fingerprint(css_file.content_hash))
+
+@bp.route('/cb/<string:chatbot_id>/style-<string:css_hash>.css')
+def cb_style(chatbot_id, css_hash):
+    """Minifiziertes CSS eines Chatbots; die URL ändert sich mit dem Inhalt, daher dauerhaft cachebar."""
+    css_file = (
+        ChatBotCssFile.query
+        .options(undefer(ChatBotCssFile.minified))
+        .filter_by(chatbot_id=chatbot_id)
+        .first()
+    )
+    if not css_file or not css_file.content_hash:
+        return Response('', status=404, mimetype='text/css')
+    if not css_file.content_hash.startswith(css_hash):
+        # outdated URL (CSS was replaced), the current one may be cached
+        return redirect(chatbot_css_url(css_file.chatbot))
+
+    response = Response(css_file.minified or minify_css(css_file.content), mimetype='text/css')
+    response.set_etag(css_file.content_hash)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@bp.route('/cb/<string:chatbot_id>/send_json', methods=['POST'])
+@chatbot_required(api=True, config=True)
 def cb_send_json(chatbot_id):
-    user = g.get('user')
-    if not user:
-        return jsonify({"ok": False, "error": "not_logged_in"}), 401
-
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot:
-        return jsonify({"ok": False, "error": "not_found"}), 404
-
-    if user.username != 'admin' and chatbot.user_id != user.id:
-        return jsonify({"ok": False, "error": "forbidden"}), 403
-
+    chatbot = g.chatbot
     data = request.get_json(silent=True) or {}
     msg = (data.get('message') or '').strip()
     if not msg:
         return jsonify({"ok": False, "error": "empty_message"}), 400
 
-    # save user message (session)
-    append_chat(chatbot_id, "user", msg)
+    # save user message
+    user_message_id = append_chat(chatbot_id, "user", msg)
 
-    history = get_chat_history(chatbot_id)
+    prompt = build_prompt(chatbot)
 
-    # ask OpenAI; if it fails, keep simple fallback
-    bot_answer = call_openai(chatbot, history)
+    # ask OpenAI (or the cache); if it fails, keep simple fallback
+    bot_answer = cached_answer(chatbot_id, prompt)
     if not bot_answer:
-        bot_answer = f"Antwort: Ich habe verstanden: {msg}"
+        bot_answer = fallback_answer(msg)
 
-    append_chat(chatbot_id, "assistant", bot_answer)
+    bot_message_id = append_chat(chatbot_id, "assistant", bot_answer)
 
     return jsonify({
         "ok": True,
-        "user": {"role": "user", "text": msg},
-        "bot": {"role": "assistant", "text": bot_answer}
+        "user": {"id": user_message_id, "role": "user", "text": msg},
+        "bot": {"id": bot_message_id, "role": "assistant", "text": bot_answer},
+        "prompt_usage": prompt.usage,
     })
 
-@app.route('/cb/<string:chatbot_id>/reset', methods=['POST'])
-def cb_reset(chatbot_id):
-    user = g.get('user')
-    if not user:
-        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+@bp.route('/cb/<string:chatbot_id>/stream', methods=['POST'])
+@chatbot_required(api=True, config=True)
+def cb_stream(chatbot_id):
+    """Streamt die Antwort des Chatbots per Server-Sent Events."""
+    chatbot = g.chatbot
+    data = request.get_json(silent=True) or {}
+    msg = (data.get('message') or '').strip()
+    if not msg:
+        return jsonify({"ok": False, "error": "empty_message"}), 400
 
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot:
-        return jsonify({"ok": False, "error": "not_found"}), 404
+    # save user message (creates the conversation before the headers are sent)
+    user_message_id = append_chat(chatbot_id, "user", msg)
 
-    if user.username != 'admin' and chatbot.user_id != user.id:
-        return jsonify({"ok": False, "error": "forbidden"}), 403
+    # build the prompt before the response starts streaming
+    prompt = build_prompt(chatbot)
 
-    # delete ONLY this chatbot session history
-    session.pop(_chat_key(chatbot_id), None)
-    session.modified = True
+    def generate():
+        parts = []
+        cached = response_cache.get(prompt.cache_key)
+        if cached:
+            parts.append(cached)
+            yield _sse({"token": cached})
+        else:
+            for token in stream_openai(prompt.messages):
+                parts.append(token)
+                yield _sse({"token": token})
+
+        bot_answer = ''.join(parts).strip()
+        if bot_answer and not cached:
+            response_cache.set(prompt.cache_key, chatbot_id, bot_answer)
+        if not bot_answer:
+            bot_answer = fallback_answer(msg)
+            yield _sse({"token": bot_answer})
+
+        bot_message_id = append_chat(chatbot_id, "assistant", bot_answer)
+        yield _sse({
+            "id": bot_message_id,
+            "user_id": user_message_id,
+            "text": bot_answer,
+            "prompt_usage": prompt.usage,
+        }, event='done')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@bp.route('/cb/<string:chatbot_id>/history')
+@chatbot_required(api=True, config=True)
+def cb_history(chatbot_id):
+    """Ältere Nachrichten (`?before=<id>`) oder alle neueren (`?after=<id>`) als JSON."""
+    limit = min(request.args.get('limit', CHAT_HISTORY_PAGE_SIZE, type=int), CHAT_HISTORY_PAGE_SIZE)
+    messages, has_more = get_chat_history(
+        chatbot_id,
+        before=request.args.get('before', type=int),
+        after=request.args.get('after', type=int),
+        limit=max(limit, 1),
+    )
+    return jsonify({"ok": True, "messages": messages, "has_more": has_more})
+
+@bp.route('/cb/<string:chatbot_id>/reset', methods=['POST'])
+@chatbot_required(api=True, config=True)
+def cb_reset(chatbot_id):
+    # delete ONLY this chatbot conversation
+    conversation_id = session.pop(_conversation_key(chatbot_id), None)
+    if conversation_id:
+        conversation = Conversation.query.get(conversation_id)
+        if conversation:
+            db.session.delete(conversation)
+            db.session.commit()
 
     return jsonify({"ok": True})
 
 
-@app.route('/catalog')
+def _encode_cursor(chatbot) -> str:
+    return f"{chatbot.created.isoformat()}~{chatbot.id}"
+
+def _decode_cursor(cursor: str | None):
+    try:
+        created, chatbot_id = cursor.split('~', 1)
+        return datetime.fromisoformat(created), chatbot_id
+    except (AttributeError, ValueError):
+        return None
+
+def catalog_page(user, is_admin: bool, cursor: str | None = None, page_size: int = CATALOG_PAGE_SIZE,
+                 owner_id: str | None = None, created_from: datetime | None = None, created_to: datetime | None = None):
+    """One page of the catalog, newest first (keyset pagination on created, id).
+
+    Returns the chatbots and the cursor of the next page (None on the last page).
+    The admin can restrict it to the chatbots of `owner_id`; `created_to` is exclusive.
+    """
+    # the catalog only shows the precomputed prompt preview
+    query = ChatBot.query.options(defer(ChatBot.systemprompt))
+    if is_admin:
+        # creator name is shown for every row: load the users in the same query
+        query = query.options(joinedload(ChatBot.user))
+        if owner_id is not None:
+            query = query.filter(ChatBot.user_id == owner_id)
+    else:
+        query = query.filter(ChatBot.user_id == user.id)
+    if created_from is not None:
+        query = query.filter(ChatBot.created >= created_from)
+    if created_to is not None:
+        query = query.filter(ChatBot.created < created_to)
+
+    position = _decode_cursor(cursor)
+    if position:
+        query = query.filter(tuple_(ChatBot.created, ChatBot.id) < position)
+
+    chatbots = query.order_by(ChatBot.created.desc(), ChatBot.id.desc()).limit(page_size + 1).all()
+    next_cursor = _encode_cursor(chatbots[page_size - 1]) if len(chatbots) > page_size else None
+    return chatbots[:page_size], next_cursor
+
+def catalog_rows(user, is_admin: bool, cursor: str | None):
+    """Rendered table rows of one catalog page and the next cursor, from `catalog_cache` if possible."""
+    # the user's catalog version changes with every write to the listed chatbots, see `catalog_changed`
+    key = f"{user.id}|{cursor or ''}|{user.catalog_version or 0}"
+    cached = catalog_cache.get(key) if CATALOG_CACHE_SIZE else None
+    if cached:
+        return cached
+
+    chatbots, next_cursor = catalog_page(user, is_admin, cursor)
+    rows = Markup(render_template('catalog_rows.html', chatbots=chatbots, is_admin=is_admin).strip())
+    catalog_cache.set(key, CATALOG_ADMIN_GROUP if is_admin else user.id, (rows, next_cursor))
+    return rows, next_cursor
+
+CATALOG_SEARCH_ARGS = ('q', 'owner', 'created_from', 'created_to')
+
+def catalog_search_args() -> dict:
+    """The search and filter arguments of the request that are set."""
+    return {name: request.args[name].strip() for name in CATALOG_SEARCH_ARGS if request.args.get(name, '').strip()}
+
+def search_page(user, is_admin: bool, args: dict, cursor: str | None, page_size: int = CATALOG_PAGE_SIZE):
+    """Catalog page for a search: (chatbot, rank) pairs by relevance, or newest first if only filters are set.
+
+    Owner filter only for the admin, other users always search their own chatbots (SearchError if a value is invalid).
+    """
+    created_from, created_to = date_range(args.get('created_from'), args.get('created_to'))
+    owner_id = None if is_admin else user.id
+    if is_admin and args.get('owner'):
+        owner = User.query.filter_by(username=args['owner']).first()
+        if owner is None:
+            raise SearchError('unknown_owner')
+        owner_id = owner.id
+
+    if args.get('q'):
+        return search_chatbots(args['q'], owner_id, created_from, created_to, cursor, page_size)
+    chatbots, next_cursor = catalog_page(user, is_admin, cursor, page_size, owner_id, created_from, created_to)
+    return [(chatbot, None) for chatbot in chatbots], next_cursor
+
+@bp.route('/catalog')
+@login_required()
 def catalog():
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
+    user = g.user
 
+    # Admin sieht ALLE Chatbots, normale User nur ihre eigenen
+    is_admin = user.username == 'admin'
+    search = catalog_search_args()
     try:
-        if user.username == 'admin':
-            # Admin sieht ALLE Chatbots
-            chatbots = ChatBot.query.order_by(ChatBot.created.desc()).all()
-            is_admin = True
+        if search:
+            # search results are not cached, every query is different
+            results, next_cursor = search_page(user, is_admin, search, request.args.get('after'))
+            rows = Markup(render_template(
+                'catalog_rows.html', chatbots=[chatbot for chatbot, _ in results], is_admin=is_admin
+            ).strip())
         else:
-            # Normale User sehen NUR ihre eigenen
-            chatbots = user.chatbots
-            is_admin = False
-    except Exception:
-        chatbots = []
-        is_admin = False
+            rows, next_cursor = catalog_rows(user, is_admin, request.args.get('after'))
+    except SearchError as e:
+        flash('Unbekannter Benutzer.' if str(e) == 'unknown_owner' else 'Ungültiges Datum.', 'error')
+        rows, next_cursor = '', None
 
     return render_template(
         'catalog.html',
         title='Katalog',
         username=user.username,
-        chatbots=chatbots,
-        is_admin=is_admin
+        rows=rows,
+        is_admin=is_admin,
+        search=search,
+        next_cursor=next_cursor,
+        first_page=not request.args.get('after'),
     )
+
+@bp.route('/catalog/search')
+@login_required(api=True)
+def catalog_search():
+    """Katalogsuche als JSON (Parameter wie /catalog, dazu `after` und `limit`)."""
+    user = g.user
+    is_admin = user.username == 'admin'
+    try:
+        limit = min(max(int(request.args.get('limit', CATALOG_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid_limit"}), 400
+    try:
+        results, next_cursor = search_page(user, is_admin, catalog_search_args(), request.args.get('after'), limit)
+    except SearchError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    return jsonify({
+        "ok": True,
+        "results": [{
+            "id": chatbot.id,
+            "name": chatbot.name,
+            "owner": chatbot.user.username if chatbot.user else None,
+            "prompt_preview": chatbot.prompt_preview,
+            "welcomemessage": chatbot.welcomemessage,
+            "created": chatbot.created.isoformat(),
+            "rank": rank,
+        } for chatbot, rank in results],
+        "next_cursor": next_cursor,
+    })
 # eigene Profile-Seite
-@app.route('/profile')
+@bp.route('/profile')
+@login_required()
 def profile():
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
+    user = g.user
 
-    # Anzahl der eigenen Chatbots
+    # Anzahl der eigenen Chatbots (COUNT statt alle Chatbots zu laden)
     try:
-        bot_count = len(user.chatbots)
+        bot_count = db.session.query(func.count(ChatBot.id)).filter(ChatBot.user_id == user.id).scalar()
     except Exception:
         bot_count = 0
 
@@ -261,12 +755,72 @@ def profile():
     )
 
 
-@app.route('/chatbot/new', methods=['GET', 'POST'])
+@job_queue.handler('index_text_file')
+def index_text_file_job(payload):
+    """Add an uploaded text file to the retrieval index; answers cached without it are dropped."""
+    text_file = db.session.get(ChatBotTextFile, payload['textfile_id'])
+    if text_file is None:
+        # deleted in the meantime
+        return
+    remove_file(text_file.id)  # a retry starts from scratch
+    index_file(text_file)
+    chatbot_changed(text_file.chatbot)
+
+
+@job_queue.handler(RELEASE_JOB)
+def release_blobs_job(payload):
+    """Delete the blob files of deleted or rolled back text files once their grace period is over."""
+    delete_unused_blobs(payload['blob_hashes'], current_app.config['BLOB_GRACE_PERIOD'])
+
+def _add_text_files(chatbot, stored_blobs):
+    """Stream the uploaded text files into the blob store and queue their indexing.
+
+    Hashes of stored blobs are collected in `stored_blobs` so they can be released on rollback.
+    """
+    for text_file in request.files.getlist('text_files'):
+        if not (text_file and text_file.filename):
+            continue
+        blob = store_upload(text_file)
+        stored_blobs.append(blob.hash)
+        check_bot_quota(chatbot.id, blob.size)
+
+        text_file_obj = ChatBotTextFile(
+            chatbot_id=chatbot.id,
+            filename=text_file.filename,
+            content='',
+            blob_hash=blob.hash,
+            size=blob.size,
+            encoding=blob.encoding,
+        )
+        add_unique(text_file_obj)  # flushed: the text file ID is needed for the job
+        queue_indexing(text_file_obj.id, chatbot.id)
+
+def queue_indexing(textfile_id: str, chatbot_id: str):
+    """Add the indexing job of a text file to the current transaction (call `job_queue.notify()` after the commit)."""
+    job_queue.enqueue(
+        'index_text_file',
+        {'textfile_id': textfile_id},
+        key=f'index:{textfile_id}',
+        chatbot_id=chatbot_id,
+        target_id=textfile_id,
+    )
+
+def _css_file(chatbot, css_file):
+    """CSS upload as a new ChatBotCssFile; hash and minified version are computed once here."""
+    content = read_upload_text(css_file, current_app.config['MAX_CSS_FILE_SIZE'])
+    return ChatBotCssFile(
+        chatbot_id=chatbot.id,
+        filename=css_file.filename,
+        content=content,
+        minified=minify_css(content),
+        content_hash=content_hash(content),
+        size=len(content.encode('utf-8')),
+    )
+
+@bp.route('/chatbot/new', methods=['GET', 'POST'])
+@login_required()
 def chatbot_new():
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
+    user = g.user
 
     if request.method == 'GET':
         return render_template('chatbot_form.html', title='Neuen Chatbot erstellen', username=user.username, chatbot=None)
@@ -275,178 +829,215 @@ def chatbot_new():
     name = (request.form.get('name') or '').strip()
     systemprompt = request.form.get('systemprompt') or ''
     welcomemessage = request.form.get('welcomemessage') or ''
+    token_budget = parse_token_budget(request.form.get('token_budget'))
 
-    chatbot = ChatBot(user_id=user.id, name=name, systemprompt=systemprompt, welcomemessage=welcomemessage)
+    chatbot = ChatBot(user_id=user.id, name=name, systemprompt=systemprompt, welcomemessage=welcomemessage, token_budget=token_budget)
+    stored_blobs = []
     try:
-        db.session.add(chatbot)
-        db.session.flush()  # flush to get the chatbot ID
+        add_unique(chatbot)  # flushed to get the chatbot ID
         
         # Handle text file uploads
-        text_files = request.files.getlist('text_files')
-        for text_file in text_files:
-            if text_file and text_file.filename:
-                content = text_file.read().decode('utf-8', errors='replace')
-                text_file_obj = ChatBotTextFile(
-                    chatbot_id=chatbot.id,
-                    filename=text_file.filename,
-                    content=content
-                )
-                db.session.add(text_file_obj)
+        _add_text_files(chatbot, stored_blobs)
         
         # Handle CSS file upload
         css_file = request.files.get('css_file')
         if css_file and css_file.filename:
-            content = css_file.read().decode('utf-8', errors='replace')
-            css_file_obj = ChatBotCssFile(
-                chatbot_id=chatbot.id,
-                filename=css_file.filename,
-                content=content
-            )
-            db.session.add(css_file_obj)
+            db.session.add(_css_file(chatbot, css_file))
         
+        catalog_changed(user.id)
         db.session.commit()
+        job_queue.notify()
         flash('Chatbot erstellt.', 'success')
     except Exception as e:
         db.session.rollback()
+        release_blobs(stored_blobs)
         flash(f'Fehler beim Erstellen des Chatbots: {str(e)}', 'error')
 
-    return redirect(url_for('catalog'))
+    return redirect(url_for('main.catalog'))
+
+@bp.route('/chatbots/export')
+@login_required()
+def chatbots_export():
+    """Streamed archive of the own chatbots (admin: all chatbots)."""
+    user = g.user
+    user_id = None if user.username == 'admin' else user.id
+    filename = f"chatbots-{datetime.now().strftime('%Y%m%d-%H%M')}.ndjson.gz"
+    return Response(
+        stream_with_context(gzip_stream(export_records(user_id))),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
-@app.route('/chatbot/<string:chatbot_id>/edit', methods=['GET', 'POST'])
+@bp.route('/chatbots/import', methods=['POST'])
+@login_required()
+def chatbots_import():
+    user = g.user
+    # archives may be much larger than a normal form
+    request.max_content_length = current_app.config['MAX_IMPORT_SIZE']
+    archive = request.files.get('archive')
+    if not (archive and archive.filename):
+        flash('Bitte eine Export-Datei auswählen.', 'error')
+        return redirect(url_for('main.catalog'))
+
+    is_admin = user.username == 'admin'
+    try:
+        # the admin keeps the owners of the archive, everyone else imports into the own account with the upload limits
+        result = import_archive(
+            archive.stream,
+            user.id,
+            keep_owners=is_admin,
+            max_file_size=None if is_admin else current_app.config['MAX_UPLOAD_FILE_SIZE'],
+            max_bot_size=None if is_admin else current_app.config['MAX_BOT_UPLOAD_SIZE'],
+            # indexed in the background, like uploaded files
+            index=False,
+            on_text_file=lambda row: queue_indexing(row['id'], row['chatbot_id']),
+        )
+    except (TransferError, UploadError) as e:
+        # chatbots of completed transactions stay
+        catalog_changed(user.id)
+        db.session.commit()
+        job_queue.notify()
+        flash(f'Fehler beim Import: {str(e)}', 'error')
+        return redirect(url_for('main.catalog'))
+
+    for user_id in result.owner_ids:
+        catalog_changed(user_id)
+    db.session.commit()
+    job_queue.notify()
+    flash(f'{result.chatbots} Chatbots importiert.', 'success')
+    return redirect(url_for('main.catalog'))
+
+@bp.route('/chatbot/<string:chatbot_id>/edit', methods=['GET', 'POST'])
+@chatbot_required(owner_only=True)
 def chatbot_edit(chatbot_id):
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
-
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot or chatbot.user_id != user.id:
-        flash('Chatbot nicht gefunden oder keine Berechtigung.', 'error')
-        return redirect(url_for('catalog'))
+    user, chatbot = g.user, g.chatbot
 
     if request.method == 'GET':
-        return render_template('chatbot_form.html', title='Chatbot bearbeiten', username=user.username, chatbot=chatbot)
+        return render_template(
+            'chatbot_form.html',
+            title='Chatbot bearbeiten',
+            username=user.username,
+            chatbot=chatbot,
+            jobs=pending_jobs(chatbot.id),
+        )
 
     # POST: update chatbot
     chatbot.name = (request.form.get('name') or '').strip()
     chatbot.systemprompt = request.form.get('systemprompt') or ''
     chatbot.welcomemessage = request.form.get('welcomemessage') or ''
-    
+    chatbot.token_budget = parse_token_budget(request.form.get('token_budget'))
+    chatbot_changed(chatbot)
+
+    stored_blobs = []
     try:
         # Handle text file uploads
-        text_files = request.files.getlist('text_files')
-        for text_file in text_files:
-            if text_file and text_file.filename:
-                content = text_file.read().decode('utf-8', errors='replace')
-                text_file_obj = ChatBotTextFile(
-                    chatbot_id=chatbot.id,
-                    filename=text_file.filename,
-                    content=content
-                )
-                db.session.add(text_file_obj)
+        _add_text_files(chatbot, stored_blobs)
         
         # Handle CSS file upload (replace existing if present)
         css_file = request.files.get('css_file')
         if css_file and css_file.filename:
-            content = css_file.read().decode('utf-8', errors='replace')
+            css_file_obj = _css_file(chatbot, css_file)
             # Delete existing CSS file if present
             if chatbot.css_file:
                 db.session.delete(chatbot.css_file)
                 db.session.flush()  # flush to delete old css file
-            # Create new CSS file
-            css_file_obj = ChatBotCssFile(
-                chatbot_id=chatbot.id,
-                filename=css_file.filename,
-                content=content
-            )
             db.session.add(css_file_obj)
         
         db.session.commit()
+        job_queue.notify()
         flash('Änderungen gespeichert.', 'success')
     except Exception as e:
         db.session.rollback()
+        release_blobs(stored_blobs)
         flash(f'Fehler beim Speichern der Änderungen: {str(e)}', 'error')
 
-    return redirect(url_for('catalog'))
+    return redirect(url_for('main.catalog'))
 
-@app.route('/chatbot/<string:chatbot_id>/textfile/<string:textfile_id>/delete', methods=['POST'])
+@bp.route('/chatbot/<string:chatbot_id>/textfile/<string:textfile_id>/delete', methods=['POST'])
+@chatbot_required(owner_only=True)
 def textfile_delete(chatbot_id, textfile_id):
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
-
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot or chatbot.user_id != user.id:
-        flash('Chatbot nicht gefunden oder keine Berechtigung.', 'error')
-        return redirect(url_for('catalog'))
+    chatbot = g.chatbot
 
     text_file = ChatBotTextFile.query.get(textfile_id)
     if not text_file or text_file.chatbot_id != chatbot_id:
         flash('Text Datei nicht gefunden oder keine Berechtigung.', 'error')
-        return redirect(url_for('chatbot_edit', chatbot_id=chatbot_id))
+        return redirect(url_for('main.chatbot_edit', chatbot_id=chatbot_id))
 
     try:
+        remove_file(text_file.id)
+        blob_hash = text_file.blob_hash
         db.session.delete(text_file)
+        chatbot_changed(chatbot)
         db.session.commit()
+        release_blobs([blob_hash])
         flash('Text Datei gelöscht.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Fehler beim Löschen der Datei: {str(e)}', 'error')
 
-    return redirect(url_for('chatbot_edit', chatbot_id=chatbot_id))
+    return redirect(url_for('main.chatbot_edit', chatbot_id=chatbot_id))
 
-@app.route('/chatbot/<string:chatbot_id>/cssfile/delete', methods=['POST'])
-def cssfile_delete(chatbot_id):
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
+@bp.route('/chatbot/<string:chatbot_id>/textfile/<string:textfile_id>/download')
+@chatbot_required(owner_only=True)
+def textfile_download(chatbot_id, textfile_id):
+    chatbot = g.chatbot
 
-    chatbot = ChatBot.query.get(chatbot_id)
-    if not chatbot or chatbot.user_id != user.id:
-        flash('Chatbot nicht gefunden oder keine Berechtigung.', 'error')
-        return redirect(url_for('catalog'))
+    text_file = ChatBotTextFile.query.get(textfile_id)
+    if not text_file or text_file.chatbot_id != chatbot_id:
+        flash('Text Datei nicht gefunden oder keine Berechtigung.', 'error')
+        return redirect(url_for('main.chatbot_edit', chatbot_id=chatbot_id))
+
+    # stream the body, it is never loaded as a whole
+    body = (piece.encode('utf-8') for piece in iter_file_text(text_file))
+    return Response(
+        stream_with_context(body),
+        mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename="{text_file.filename}"'},
+    )
+
+@bp.route('/chatbot/<string:chatbot_id>/cssfile/delete', methods=['POST'])
+@chatbot_required(owner_only=True)
+def cssfile_delete(chatbot_id):
+    chatbot = g.chatbot
 
     if not chatbot.css_file:
         flash('CSS-Datei nicht gefunden.', 'error')
-        return redirect(url_for('chatbot_edit', chatbot_id=chatbot_id))
+        return redirect(url_for('main.chatbot_edit', chatbot_id=chatbot_id))
 
     try:
         db.session.delete(chatbot.css_file)
+        chatbot_changed(chatbot)
         db.session.commit()
         flash('CSS-Datei gelöscht.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Fehler beim Löschen der Datei: {str(e)}', 'error')
 
-    return redirect(url_for('chatbot_edit', chatbot_id=chatbot_id))
+    return redirect(url_for('main.chatbot_edit', chatbot_id=chatbot_id))
 
-@app.route('/chatbot/<string:chatbot_id>/delete', methods=['POST'])
+@bp.route('/chatbot/<string:chatbot_id>/delete', methods=['POST'])
+@chatbot_required(owner_only=True)
 def chatbot_delete(chatbot_id):
-    # require authentication
-    user = g.get('user')
-    if not user:
-        return redirect(url_for('login'))
-
-    chatbot = ChatBot.query.get(chatbot_id)
-    # Basic validation
-    if not chatbot or chatbot.user_id != user.id:
-        flash('Chatbot nicht gefunden oder keine Berechtigung.', 'error')
-        return redirect(url_for('catalog'))
+    chatbot = g.chatbot
 
     try:
+        blob_hashes = [tf.blob_hash for tf in chatbot.text_files]
+        response_cache.invalidate(chatbot.id)
+        invalidate_chatbot_config(chatbot.id)
+        catalog_changed(chatbot.user_id)
+        remove_chatbot(chatbot.id)
         db.session.delete(chatbot)
         db.session.commit()
+        release_blobs(blob_hashes)
         flash('Chatbot gelöscht.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Fehler beim Löschen des Chatbots: {str(e)}', 'error')
 
-    return redirect(url_for('catalog'))
+    return redirect(url_for('main.catalog'))
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'GET':
         return render_template('register.html', title='Registrieren')
@@ -472,13 +1063,17 @@ def register():
         flash('Benutzername existiert bereits. Bitte wähle einen anderen.', 'error')
         return render_template('register.html', title='Registrieren', username='')
 
-    # Hash the password (generates a new salt)
-    password_hash, salt = hash_password(password)
+    # Hash the password (generates a new salt) in the password pool
+    try:
+        password_hash = password_pool.hash(password)
+    except PasswordBusy:
+        flash('Server ausgelastet, bitte gleich noch einmal versuchen.', 'error')
+        return render_template('register.html', title='Registrieren', username=username), 503
 
     # Create and save the user
-    new_user = User(username=username, password=password_hash, salt=salt)
+    new_user = User(username=username, password=password_hash)
     try:
-        db.session.add(new_user)
+        add_unique(new_user)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -488,9 +1083,9 @@ def register():
     # log the user in immediately after registering
     session['user_id'] = new_user.id
     session.permanent = True
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'GET':
         return render_template('login.html', title='Login')
@@ -504,21 +1099,47 @@ def login():
         flash('Benutzername und Passwort sind erforderlich.', 'error')
         return render_template('login.html', title='Login', username=username)
 
+    # refuse early (before hashing) if there were too many failed attempts
+    ip = request.remote_addr or ''
+    if login_throttle.blocked(ip, username):
+        flash('Zu viele fehlgeschlagene Anmeldungen. Bitte später erneut versuchen.', 'error')
+        return render_template('login.html', title='Login'), 429
+
     # Check if user exists and password is correct
     user = User.query.filter_by(username=username).first()
-    if not user or not verify_password(user.password, user.salt or '', password):
+    try:
+        valid = bool(user) and password_pool.verify(user.password, user.salt or '', password)
+    except PasswordBusy:
+        flash('Server ausgelastet, bitte gleich noch einmal versuchen.', 'error')
+        return render_template('login.html', title='Login', username=username), 503
+    if not valid:
+        login_throttle.failed(ip, username)
         flash('Ungültiger Benutzername oder Passwort.', 'error')
         return render_template('login.html', title='Login')
 
+    login_throttle.succeeded(username)
+    if needs_rehash(user.password):
+        # hash in the old format or with old cost: store it with the current settings
+        try:
+            user.password = password_pool.hash(password)
+            user.salt = None
+            db.session.commit()
+        except PasswordBusy:
+            pass
+
     session['user_id'] = user.id
     session.permanent = True
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
 if __name__ == '__main__':
+    app = create_app()
+    # development server: create the database on first start (production: `flask db init`)
+    with app.app_context():
+        create_database()
     app.run(debug=True, port=5050)
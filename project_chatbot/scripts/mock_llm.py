@@ -0,0 +1,83 @@
+"""Lokaler Fake-Upstream im Format der OpenAI Chat Completions API.
+
+Start: `python scripts/mock_llm.py --port 8099`, danach die App mit
+`OPEN_AI_BASE_URL=http://127.0.0.1:8099/v1` und einem beliebigen `OPEN_AI_API_SECRET` starten.
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # set by `make_server`
+    token_delay = 0.0
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer_tokens(self, messages):
+        last = next((m.get('content') for m in reversed(messages) if m.get('role') == 'user'), '')
+        words = f"Mock-Antwort auf: {last}".split(' ')
+        return [w if i == 0 else ' ' + w for i, w in enumerate(words)]
+
+    def do_POST(self):
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        tokens = self._answer_tokens(payload.get('messages') or [])
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if not payload.get('stream'):
+            body = json.dumps({
+                'choices': [{'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for token in tokens:
+            chunk = {'choices': [{'delta': {'content': token}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if self.token_delay:
+                time.sleep(self.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8099, token_delay: float = 0.0, latency: float = 0.0):
+    handler = type('ConfiguredMockLLMHandler', (MockLLMHandler,), {
+        'token_delay': token_delay,
+        'latency': latency,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--token-delay', type=float, default=0.05, help='Sekunden zwischen zwei Tokens')
+    parser.add_argument('--latency', type=float, default=0.0, help='Sekunden bis zur ersten Antwort')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.token_delay, args.latency)
+    print(f"Mock LLM auf http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,73 @@
+"""Passwort-Hashing außerhalb der Request-Threads.
+
+Hashen und Prüfen sind absichtlich teuer (CPU bzw. Speicher). Damit eine Welle von
+Logins nicht die Worker für Chats blockiert, laufen sie in einem begrenzten
+Prozess-Pool. Ist der Pool voll, wird die Anfrage sofort abgelehnt statt in eine
+lange Warteschlange zu laufen.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import hash_password, verify_password
+
+
+class PasswordBusy(Exception):
+    """Too many hash operations in flight."""
+
+
+class PasswordPool:
+    """Runs hash/verify in up to `workers` processes, with at most `max_pending` operations in flight.
+
+    `workers=0` runs them inline in the calling thread (e.g. for scripts).
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float = 10):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # not fork: the server has threads (requests, job workers) whose locks a forked child would
+                # inherit; the workers only need `utils`, hash_password/verify_password pickle by reference
+                # (as with any spawn, a script run as __main__ is imported again and must be import-safe)
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordBusy()
+        try:
+            return self._pool().submit(fn, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(hash_password, password)
+
+    def verify(self, stored_hash: str, salt: str, password: str) -> bool:
+        return self._run(verify_password, stored_hash, salt, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def make_pool() -> PasswordPool:
+    workers = int(os.environ.get('PASSWORD_WORKERS', min(2, os.cpu_count() or 1)))
+    return PasswordPool(
+        workers=workers,
+        max_pending=int(os.environ.get('PASSWORD_MAX_PENDING', max(workers, 1) * 8)),
+        timeout=float(os.environ.get('PASSWORD_TIMEOUT', '10')),
+    )
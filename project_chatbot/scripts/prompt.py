@@ -0,0 +1,183 @@
+"""Baut den Prompt für das LLM innerhalb eines Token-Budgets pro Chatbot.
+
+Die Token werden lokal geschätzt (kein Tokenizer als Abhängigkeit). Die letzten
+Nachrichten gehen vollständig in den Prompt, ältere werden inkrementell in eine
+laufende Zusammenfassung übernommen, die in der Conversation gespeichert wird.
+"""
+import re
+from functools import lru_cache
+
+# Words, numbers and single punctuation characters
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Extra tokens the chat format adds per message (role, separators)
+MESSAGE_OVERHEAD = 4
+
+# Maximum length of a single message inside the running summary
+SUMMARY_LINE_CHARS = 200
+
+# Tokens reserved for the answer; a chatbot's token budget must be larger
+MAX_ANSWER_TOKENS = 300
+
+
+def _piece_tokens(piece: str) -> int:
+    # long words are split into several BPE tokens
+    return 1 + len(piece) // 6
+
+
+@lru_cache(maxsize=256)
+def count_tokens(text: str) -> int:
+    """Estimate the number of model tokens for `text`."""
+    if not text:
+        return 0
+    return sum(_piece_tokens(m.group()) for m in _TOKEN_RE.finditer(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` after roughly `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ''
+    used = 0
+    for m in _TOKEN_RE.finditer(text):
+        used += _piece_tokens(m.group())
+        if used > max_tokens:
+            return text[:m.start()].rstrip()
+    return text
+
+
+def message_tokens(content: str) -> int:
+    return count_tokens(content) + MESSAGE_OVERHEAD
+
+
+def parse_token_budget(value):
+    """Token budget of a chatbot from a form or an archive; empty or invalid means the default budget."""
+    try:
+        budget = int(value)
+    except (TypeError, ValueError):
+        return None
+    return budget if budget > MAX_ANSWER_TOKENS else None
+
+
+class BuiltPrompt:
+    """Result of `PromptBuilder.build`: the messages plus how much budget each part used."""
+
+    def __init__(self, messages, usage, summary, summary_upto):
+        self.messages = messages
+        self.usage = usage
+        self.summary = summary
+        self.summary_upto = summary_upto
+        self.cache_key = None  # set by the caller, see main.build_prompt
+
+    def __repr__(self):
+        return f"<BuiltPrompt messages={len(self.messages)} usage={self.usage}>"
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        budget: int = 3000,
+        reserve: int = 300,
+        system_share: float = 0.4,
+        history_share: float = 0.5,
+        summary_share: float = 0.15,
+    ):
+        self.budget = budget
+        self.reserve = reserve
+        self.system_share = system_share
+        self.history_share = history_share
+        self.summary_share = summary_share
+
+    def _fold(self, summary: str, messages, budget: int) -> str:
+        """Append `messages` to the running summary and drop the oldest lines beyond `budget`."""
+        lines = summary.splitlines() if summary else []
+        for item in messages:
+            text = ' '.join((item.get('text') or '').split())
+            if len(text) > SUMMARY_LINE_CHARS:
+                text = text[:SUMMARY_LINE_CHARS].rstrip() + ' …'
+            lines.append(f"{item.get('role')}: {text}")
+        while lines and count_tokens('\n'.join(lines)) > budget:
+            lines.pop(0)
+        return '\n'.join(lines)
+
+    def system_part(self, system_prompt, budget: int | None = None):
+        """The system prompt cut to its share of the budget, with its token count.
+
+        Only depends on the chatbot config, so callers can compute it once per chatbot version.
+        """
+        available = max((budget or self.budget) - self.reserve, 0)
+        system_prompt = truncate_tokens(system_prompt or '', int(available * self.system_share))
+        return system_prompt, message_tokens(system_prompt) if system_prompt else 0
+
+    def build(self, system_prompt, files, history, summary: str = '', summary_upto: int = 0,
+              budget: int | None = None, system_part=None):
+        """Assemble the messages.
+
+        `files` are `(filename, content)` pairs in priority order, `history` is a list of
+        `{"id", "role", "text"}` dicts (oldest first, the last one is the current question).
+        `summary`/`summary_upto` are the cached running summary and the id of the last
+        message it covers. `system_part` is a precomputed result of `system_part()`.
+        """
+        budget = budget or self.budget
+        available = max(budget - self.reserve, 0)
+        usage = {'budget': budget, 'reserve': self.reserve}
+
+        # 1) system prompt
+        system_prompt, usage['system'] = system_part or self.system_part(system_prompt, budget)
+        rest = available - usage['system']
+
+        # 2) recent history window, newest first (the current question is always kept)
+        history_budget = int(rest * self.history_share)
+        window = []
+        used = 0
+        for item in reversed(history):
+            tokens = message_tokens(item.get('text') or '')
+            if window and used + tokens > history_budget:
+                break
+            window.append(item)
+            used += tokens
+        window.reverse()
+        usage['history'] = used
+        usage['history_messages'] = len(window)
+
+        # 3) fold messages that left the window into the running summary (only new ones)
+        older = history[:len(history) - len(window)]
+        summary_budget = int(rest * self.summary_share)
+        new_older = [m for m in older if (m.get('id') or 0) > summary_upto]
+        if new_older:
+            summary = self._fold(summary, new_older, summary_budget)
+            summary_upto = new_older[-1].get('id') or summary_upto
+        # the summary stays in the prompt: callers pass only the messages after `summary_upto`
+        summary_content = f"Summary of the earlier conversation:\n{summary}" if summary else ''
+        usage['summary'] = message_tokens(summary_content) if summary_content else 0
+
+        # 4) reference files fill what is left
+        files_budget = max(rest - usage['history'] - usage['summary'], 0)
+        file_messages = []
+        files_used = 0
+        for filename, content in files:
+            if not content:
+                continue
+            header = f"Reference file: {filename}\n" if filename else "Reference file:\n"
+            remaining = files_budget - files_used - message_tokens(header)
+            if remaining <= 0:
+                break
+            content = truncate_tokens(content, remaining)
+            file_messages.append({'role': 'system', 'content': header + content})
+            files_used += message_tokens(header + content)
+        usage['files'] = files_used
+        usage['files_included'] = len(file_messages)
+
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.extend(file_messages)
+        if summary_content:
+            messages.append({'role': 'system', 'content': summary_content})
+        for item in window:
+            role = item.get('role')
+            content = item.get('text')
+            if role and content is not None:
+                messages.append({'role': role, 'content': content})
+
+        usage['total'] = usage['system'] + usage['files'] + usage['summary'] + usage['history']
+        return BuiltPrompt(messages, usage, summary, summary_upto)
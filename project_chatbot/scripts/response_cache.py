@@ -0,0 +1,166 @@
+"""Cache für LLM-Antworten auf identische Anfragen pro Chatbot.
+
+Der Schlüssel ist ein Hash über Chatbot-ID, Chatbot-Version (wird bei jeder
+Änderung erhöht), die normalisierten Prompt-Nachrichten und die Modellparameter.
+Zwei Backends: `MemoryCache` (pro Prozess) und `SQLiteCache` (von allen Workern
+geteilt). Beide mit TTL und LRU-Begrenzung.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize(text: str) -> str:
+    return ' '.join((text or '').split())
+
+
+def cache_key(chatbot_id: str, version: int | None, payload: dict) -> str:
+    """Hash of the fully assembled request."""
+    data = {
+        'chatbot_id': chatbot_id,
+        'version': version or 0,
+        'messages': [(m['role'], normalize(m['content'])) for m in payload.get('messages', [])],
+        'params': {k: v for k, v in payload.items() if k not in ('messages', 'stream')},
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class _Stats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class MemoryCache:
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = _Stats()
+        self._entries = OrderedDict()  # key -> (chatbot_id, expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+        self.stats.record(entry is not None)
+        return entry[2] if entry else None
+
+    def set(self, key: str, chatbot_id: str, value: str):
+        with self._lock:
+            self._entries[key] = (chatbot_id, time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, chatbot_id: str):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[0] == chatbot_id]:
+                del self._entries[key]
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Shared between worker processes through one SQLite file."""
+
+    def __init__(self, path: str, ttl: float = 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = _Stats()
+        self._local = threading.local()  # one connection per thread, opened on first use
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                ' key TEXT PRIMARY KEY, chatbot_id TEXT NOT NULL, value TEXT NOT NULL,'
+                ' expires REAL NOT NULL, last_used REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_response_cache_chatbot ON response_cache (chatbot_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM response_cache WHERE key = ? AND expires >= ?', (key, now)).fetchone()
+        if row:
+            conn.execute('UPDATE response_cache SET last_used = ? WHERE key = ?', (now, key))
+        self.stats.record(row is not None)
+        return row[0] if row else None
+
+    def set(self, key: str, chatbot_id: str, value: str):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, chatbot_id, value, expires, last_used) VALUES (?, ?, ?, ?, ?)',
+            (key, chatbot_id, value, now + self.ttl, now),
+        )
+        # expired entries first, then the least recently used beyond the limit
+        conn.execute('DELETE FROM response_cache WHERE expires < ?', (now,))
+        conn.execute(
+            'DELETE FROM response_cache WHERE key IN ('
+            ' SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,),
+        )
+
+    def invalidate(self, chatbot_id: str):
+        self._connect().execute('DELETE FROM response_cache WHERE chatbot_id = ?', (chatbot_id,))
+
+    def size(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class NullCache:
+    def __init__(self):
+        self.stats = _Stats()
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, chatbot_id: str, value: str):
+        pass
+
+    def invalidate(self, chatbot_id: str):
+        pass
+
+    def size(self) -> int:
+        return 0
+
+
+def make_cache(backend: str, ttl: float, max_entries: int, path: str | None = None):
+    if backend == 'sqlite':
+        return SQLiteCache(path, ttl=ttl, max_entries=max_entries)
+    if backend == 'memory':
+        return MemoryCache(ttl=ttl, max_entries=max_entries)
+    return NullCache()
@@ -0,0 +1,154 @@
+"""BM25-Suche über die Text-Dateien eines Chatbots.
+
+Beim Hochladen wird jede Datei in Abschnitte (Chunks) zerlegt und in einen
+invertierten Index (`chatbot_terms`) geschrieben. Im Chat werden dann nur die
+relevantesten Abschnitte zur Nutzerfrage in den Prompt übernommen.
+Der Index wird pro Datei aktualisiert, nie für den ganzen Chatbot neu gebaut.
+"""
+import math
+import re
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select
+
+from db import ChatBotTerm, ChatBotTextChunk, ChatBotTextFile, Job, db
+from uploads import iter_file_text
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+CHUNK_WORDS = 150
+CHUNK_OVERLAP = 30
+MAX_TERM_LENGTH = 64
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str):
+    return [w.lower() for w in _WORD_RE.findall(text or '') if 1 < len(w) <= MAX_TERM_LENGTH]
+
+
+def iter_chunks(pieces, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    """Split streamed text `pieces` into overlapping sections of about `size` words."""
+    step = max(size - overlap, 1)
+    words = []
+    fresh = 0  # words not yet part of an emitted chunk
+    carry = ''
+    for piece in pieces:
+        text = carry + piece
+        parts = text.split()
+        # a word cut at the end of the piece continues in the next one
+        carry = parts.pop() if parts and not text[-1].isspace() else ''
+        for word in parts:
+            words.append(word)
+            fresh += 1
+            if len(words) == size:
+                yield ' '.join(words)
+                words = words[step:]
+                fresh = 0
+    if carry:
+        words.append(carry)
+        fresh += 1
+    if fresh:
+        yield ' '.join(words)
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    return list(iter_chunks([text or ''], size, overlap))
+
+
+def index_file(text_file):
+    """Add the chunks and postings of one (flushed) text file to the index."""
+    for position, content in enumerate(iter_chunks(iter_file_text(text_file))):
+        counts = Counter(tokenize(content))
+        chunk_id = db.session.execute(
+            insert(ChatBotTextChunk).values(
+                textfile_id=text_file.id,
+                chatbot_id=text_file.chatbot_id,
+                position=position,
+                content=content,
+                length=sum(counts.values()),
+            )
+        ).inserted_primary_key[0]
+        if counts:
+            db.session.execute(insert(ChatBotTerm), [
+                {'chatbot_id': text_file.chatbot_id, 'term': term, 'chunk_id': chunk_id, 'tf': tf}
+                for term, tf in counts.items()
+            ])
+
+
+def remove_file(textfile_id: str):
+    """Remove the chunks and postings of one text file from the index."""
+    chunk_ids = select(ChatBotTextChunk.id).where(ChatBotTextChunk.textfile_id == textfile_id)
+    db.session.execute(delete(ChatBotTerm).where(ChatBotTerm.chunk_id.in_(chunk_ids)))
+    db.session.execute(delete(ChatBotTextChunk).where(ChatBotTextChunk.textfile_id == textfile_id))
+
+
+def remove_chatbot(chatbot_id: str):
+    """Remove the whole index of a chatbot (before deleting it, the ORM would load every posting)."""
+    db.session.execute(delete(ChatBotTerm).where(ChatBotTerm.chatbot_id == chatbot_id))
+    db.session.execute(delete(ChatBotTextChunk).where(ChatBotTextChunk.chatbot_id == chatbot_id))
+
+
+def ensure_indexed(chatbot_id: str) -> int:
+    """Index text files uploaded before the index existed. Returns the number of files indexed.
+
+    Files whose indexing job is still queued or running are left to the job.
+    """
+    indexed = select(ChatBotTextChunk.textfile_id).where(ChatBotTextChunk.chatbot_id == chatbot_id)
+    queued = select(Job.target_id).where(
+        Job.chatbot_id == chatbot_id,
+        Job.kind == 'index_text_file',
+        Job.status.in_(('queued', 'running')),
+        Job.target_id.is_not(None),
+    )
+    missing = ChatBotTextFile.query.filter(
+        ChatBotTextFile.chatbot_id == chatbot_id,
+        ChatBotTextFile.id.not_in(indexed),
+        ChatBotTextFile.id.not_in(queued),
+    ).all()
+    for text_file in missing:
+        index_file(text_file)
+    if missing:
+        db.session.commit()
+    return len(missing)
+
+
+def search(chatbot_id: str, query: str, top_k: int = 4):
+    """Return the `top_k` best matching chunks as `(filename, content)` pairs."""
+    terms = set(tokenize(query))
+    if not terms or top_k <= 0:
+        return []
+
+    chunk_count, avg_length = db.session.execute(
+        select(func.count(ChatBotTextChunk.id), func.avg(ChatBotTextChunk.length))
+        .where(ChatBotTextChunk.chatbot_id == chatbot_id)
+    ).one()
+    if not chunk_count:
+        return []
+    avg_length = float(avg_length or 1) or 1.0
+
+    postings = db.session.execute(
+        select(ChatBotTerm.term, ChatBotTerm.chunk_id, ChatBotTerm.tf, ChatBotTextChunk.length)
+        .join(ChatBotTextChunk, ChatBotTextChunk.id == ChatBotTerm.chunk_id)
+        .where(ChatBotTerm.chatbot_id == chatbot_id, ChatBotTerm.term.in_(terms))
+    ).all()
+
+    doc_freq = Counter(term for term, _, _, _ in postings)
+    scores = Counter()
+    for term, chunk_id, tf, length in postings:
+        idf = math.log(1 + (chunk_count - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+        scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+    best = [chunk_id for chunk_id, _ in scores.most_common(top_k)]
+    if not best:
+        return []
+
+    rows = db.session.execute(
+        select(ChatBotTextChunk.id, ChatBotTextFile.filename, ChatBotTextChunk.content)
+        .join(ChatBotTextFile, ChatBotTextFile.id == ChatBotTextChunk.textfile_id)
+        .where(ChatBotTextChunk.id.in_(best))
+    ).all()
+    by_id = {chunk_id: (filename, content) for chunk_id, filename, content in rows}
+    return [by_id[chunk_id] for chunk_id in best if chunk_id in by_id]
@@ -0,0 +1,350 @@
+"""Export und Import von Chatbots mit ihren Dateien als gestreamtes Archiv.
+
+Das Archiv ist gzip-komprimiertes NDJSON, eine JSON-Zeile pro Datensatz:
+
+    {"type": "header", "format": "chatbots", "version": 1}
+    {"type": "chatbot", "id": ..., "owner": "<username>", "name": ..., ...}
+    {"type": "css", "chatbot": <id>, "filename": ..., "content": ...}
+    {"type": "textfile", "id": ..., "chatbot": <id>, "filename": ..., "encoding": ...}
+    {"type": "data", "textfile": <id>, "data": "<base64>"}     (Rohbytes, blockweise)
+    {"type": "end", "chatbots": <Anzahl>}
+
+CSS und Textdateien folgen direkt auf ihren Chatbot, die `data`-Zeilen direkt auf
+ihre Textdatei. Der Export liest die Chatbots seitenweise (`yield_per`) und lädt die
+Dateien einer Seite mit je einer Abfrage; Textdateien werden blockweise aus dem
+Blob-Store gelesen. Der Import schreibt Textdateien direkt in den Blob-Store und
+fügt die Zeilen mit Bulk-INSERTs in Transaktionen zu je `batch` Chatbots ein.
+Der Speicherbedarf hängt so weder von der Anzahl der Chatbots noch von der Größe
+der Dateien ab.
+
+Importierte Chatbots und Dateien bekommen neue IDs, Unterhaltungen werden nicht
+exportiert. Bricht ein Import ab, bleiben die bereits abgeschlossenen Transaktionen
+erhalten.
+"""
+import base64
+import gzip
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import undefer
+
+from assets import minify_css
+from db import ChatBot, ChatBotCssFile, ChatBotTextFile, User, db, display_fields
+from prompt import parse_token_budget
+from retrieval import index_file
+from uploads import BlobWriter, UploadError, content_hash, iter_blob_bytes, release_blobs
+from utils import generate_ids
+
+FORMAT = 'chatbots'
+FORMAT_VERSION = 1
+# chatbots per export query page / per import transaction
+EXPORT_BATCH = 500
+IMPORT_BATCH = 500
+# also commit an import transaction once this many bytes of text files are pending
+IMPORT_BATCH_BYTES = 64 * 1024 * 1024
+
+
+class TransferError(Exception):
+    """The archive is not a chatbot export or is damaged."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.chatbots = 0
+        self.text_files = 0
+        self.owner_ids = set()
+
+    def __repr__(self):
+        return f"<ImportResult chatbots={self.chatbots} text_files={self.text_files}>"
+
+
+def _line(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+# -- export ------------------------------------------------------------
+
+def _iter_text_file_bytes(text_file):
+    """Raw bytes of a text file and their encoding (older uploads live in the database as text)."""
+    if text_file.blob_hash:
+        return iter_blob_bytes(text_file.blob_hash), text_file.encoding or 'utf-8'
+    return iter([(text_file.content or '').encode('utf-8')]), 'utf-8'
+
+
+def export_records(user_id: str | None = None, batch: int = EXPORT_BATCH):
+    """Yield the NDJSON lines of all chatbots (only those of `user_id`, if given)."""
+    yield _line({'type': 'header', 'format': FORMAT, 'version': FORMAT_VERSION})
+
+    query = (
+        select(ChatBot, User.username)
+        .outerjoin(User, ChatBot.user_id == User.id)
+        .order_by(ChatBot.created, ChatBot.id)
+        .execution_options(yield_per=batch)
+    )
+    if user_id is not None:
+        query = query.where(ChatBot.user_id == user_id)
+
+    count = 0
+    for page in db.session.execute(query).partitions():
+        ids = [chatbot.id for chatbot, _ in page]
+        css_files = {
+            css_file.chatbot_id: css_file
+            for css_file in ChatBotCssFile.query.options(undefer(ChatBotCssFile.content))
+            .filter(ChatBotCssFile.chatbot_id.in_(ids))
+        }
+        text_files = defaultdict(list)
+        for text_file in (ChatBotTextFile.query.filter(ChatBotTextFile.chatbot_id.in_(ids))
+                          .order_by(ChatBotTextFile.created, ChatBotTextFile.id)):
+            text_files[text_file.chatbot_id].append(text_file)
+
+        for chatbot, owner in page:
+            count += 1
+            yield _line({
+                'type': 'chatbot',
+                'id': chatbot.id,
+                'owner': owner,
+                'name': chatbot.name,
+                'systemprompt': chatbot.systemprompt,
+                'welcomemessage': chatbot.welcomemessage,
+                'token_budget': chatbot.token_budget,
+                'created': chatbot.created.isoformat(),
+            })
+            css_file = css_files.get(chatbot.id)
+            if css_file is not None:
+                yield _line({
+                    'type': 'css', 'chatbot': chatbot.id, 'filename': css_file.filename, 'content': css_file.content,
+                })
+            for text_file in text_files[chatbot.id]:
+                blocks, encoding = _iter_text_file_bytes(text_file)
+                yield _line({
+                    'type': 'textfile',
+                    'id': text_file.id,
+                    'chatbot': chatbot.id,
+                    'filename': text_file.filename,
+                    'encoding': encoding,
+                    'created': text_file.created.isoformat(),
+                })
+                for block in blocks:
+                    yield _line({'type': 'data', 'textfile': text_file.id, 'data': base64.b64encode(block).decode()})
+
+    yield _line({'type': 'end', 'chatbots': count})
+
+
+def gzip_stream(chunks, level: int = 6):
+    """Compress a stream of byte strings on the fly (gzip format)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+# -- import ------------------------------------------------------------
+
+def _records(fileobj):
+    try:
+        for number, raw in enumerate(gzip.GzipFile(fileobj=fileobj, mode='rb'), start=1):
+            if raw.strip():
+                try:
+                    yield json.loads(raw)
+                except ValueError:
+                    raise TransferError(f'Zeile {number} ist kein gültiges JSON.') from None
+    except (OSError, EOFError, zlib.error):
+        raise TransferError('Das Archiv ist nicht gzip-komprimiert oder beschädigt.') from None
+
+
+def _created(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise TransferError(f'Ungültiges Datum: {value!r}') from None
+
+
+class _Importer:
+    """Collects the rows of one transaction and writes them with bulk INSERTs."""
+
+    def __init__(self, owner_id, keep_owners, max_file_size, max_bot_size, batch, index, on_text_file):
+        self.owner_id = owner_id
+        self.keep_owners = keep_owners
+        self.max_file_size = max_file_size
+        self.max_bot_size = max_bot_size
+        self.batch = batch
+        self.index = index
+        self.on_text_file = on_text_file
+        self.result = ImportResult()
+        self._owners = {}
+        self._chatbots, self._css_files, self._text_files = [], [], []
+        self._pending_bytes = 0
+        self._stored_blobs = []
+        # chatbot and text file the following records belong to (exported id -> new row)
+        self._chatbot = None
+        self._text_file = None
+        self._writer = None
+        self._ids = []
+
+    def _new_id(self):
+        # drawn a batch at a time, like the rows they are inserted with
+        if not self._ids:
+            self._ids = generate_ids(self.batch)[::-1]
+        return self._ids.pop()
+
+    def _resolve_owner(self, username):
+        if not (self.keep_owners and username):
+            return self.owner_id
+        if username not in self._owners:
+            user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+            self._owners[username] = user_id or self.owner_id
+        return self._owners[username]
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind == 'data':
+            self._add_data(record)
+            return
+        self._finish_text_file()
+        if kind == 'chatbot':
+            self._maybe_commit()
+            self._add_chatbot(record)
+        elif kind == 'css':
+            self._add_css(record)
+        elif kind == 'textfile':
+            self._maybe_commit()
+            self._add_text_file(record)
+        elif kind == 'end':
+            pass
+        else:
+            raise TransferError(f'Unbekannter Datensatz: {kind!r}')
+
+    def _belongs_to_chatbot(self, record):
+        if self._chatbot is None or record.get('chatbot') != self._chatbot['exported_id']:
+            raise TransferError('Datei ohne vorangehenden Chatbot im Archiv.')
+        return self._chatbot['row']['id']
+
+    def _add_chatbot(self, record):
+        created = _created(record.get('created'))
+        row = {
+            'id': self._new_id(),
+            'user_id': self._resolve_owner(record.get('owner')),
+            'name': record.get('name'),
+            'systemprompt': record.get('systemprompt'),
+            'welcomemessage': record.get('welcomemessage'),
+            'token_budget': parse_token_budget(record.get('token_budget')),
+            'created': created,
+            **display_fields(record.get('systemprompt'), created),
+        }
+        self._chatbots.append(row)
+        self._chatbot = {'exported_id': record.get('id'), 'row': row, 'size': 0}
+        self.result.chatbots += 1
+        self.result.owner_ids.add(row['user_id'])
+
+    def _add_css(self, record):
+        chatbot_id = self._belongs_to_chatbot(record)
+        content = record.get('content') or ''
+        self._css_files.append({
+            'id': self._new_id(),
+            'chatbot_id': chatbot_id,
+            'filename': record.get('filename') or 'style.css',
+            'content': content,
+            'minified': minify_css(content),
+            'content_hash': content_hash(content),
+            'size': len(content.encode('utf-8')),
+        })
+
+    def _add_text_file(self, record):
+        chatbot_id = self._belongs_to_chatbot(record)
+        self._text_file = {
+            'exported_id': record.get('id'),
+            'row': {
+                'id': self._new_id(),
+                'chatbot_id': chatbot_id,
+                'filename': record.get('filename') or 'text.txt',
+                'content': '',
+                'created': _created(record.get('created')),
+            },
+        }
+        self._writer = BlobWriter(self._text_file['row']['filename'], self.max_file_size)
+
+    def _add_data(self, record):
+        if self._text_file is None or record.get('textfile') != self._text_file['exported_id']:
+            raise TransferError('Dateiinhalt ohne vorangehende Textdatei im Archiv.')
+        try:
+            block = base64.b64decode(record.get('data') or '', validate=True)
+        except ValueError:
+            raise TransferError('Ungültiger Dateiinhalt im Archiv.') from None
+        self._writer.write(block)
+
+    def _finish_text_file(self):
+        if self._text_file is None:
+            return
+        blob = self._writer.close()
+        self._writer = None
+        self._stored_blobs.append(blob.hash)
+        row = self._text_file['row']
+        row.update(blob_hash=blob.hash, size=blob.size, encoding=blob.encoding)
+        self._text_file = None
+
+        self._chatbot['size'] += blob.size
+        if self.max_bot_size is not None and self._chatbot['size'] > self.max_bot_size:
+            raise UploadError(f'Speicherplatz für diesen Chatbot erschöpft (max. {self.max_bot_size // (1024 * 1024)} MB).')
+        self._text_files.append(row)
+        self._pending_bytes += blob.size
+        self.result.text_files += 1
+
+    def _maybe_commit(self):
+        if len(self._chatbots) >= self.batch or self._pending_bytes >= IMPORT_BATCH_BYTES:
+            self.commit()
+
+    def commit(self):
+        """Insert the collected rows in one transaction."""
+        self._finish_text_file()
+        if self._chatbots:
+            db.session.execute(insert(ChatBot), self._chatbots)
+        if self._css_files:
+            db.session.execute(insert(ChatBotCssFile), self._css_files)
+        if self._text_files:
+            db.session.execute(insert(ChatBotTextFile), self._text_files)
+            for row in self._text_files:
+                if self.index:
+                    index_file(ChatBotTextFile(**row))
+                if self.on_text_file is not None:
+                    self.on_text_file(row)
+        db.session.commit()
+        self._chatbots, self._css_files, self._text_files = [], [], []
+        self._pending_bytes = 0
+        self._stored_blobs = []
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+        db.session.rollback()
+        release_blobs(self._stored_blobs)
+
+
+def import_archive(fileobj, owner_id: str, keep_owners: bool = False, max_file_size: int | None = None,
+                   max_bot_size: int | None = None, batch: int = IMPORT_BATCH, index: bool = True,
+                   on_text_file=None) -> ImportResult:
+    """Import a gzip-compressed export read from `fileobj`.
+
+    The chatbots belong to `owner_id`; with `keep_owners` to the user with the exported username, if there is one.
+    With `index=False` the retrieval index is built on first use (see `retrieval.ensure_indexed`) or by whatever
+    `on_text_file` does: it is called with each inserted text file row inside its transaction (e.g. to queue a job).
+    """
+    importer = _Importer(owner_id, keep_owners, max_file_size, max_bot_size, batch, index, on_text_file)
+    records = _records(fileobj)
+    try:
+        header = next(records, None)
+        if not header or header.get('type') != 'header' or header.get('format') != FORMAT:
+            raise TransferError('Die Datei ist kein Chatbot-Export.')
+        if header.get('version') != FORMAT_VERSION:
+            raise TransferError(f"Export-Version {header.get('version')} wird nicht unterstützt.")
+        for record in records:
+            importer.add(record)
+        importer.commit()
+    except BaseException:
+        importer.abort()
+        raise
+    return importer.result
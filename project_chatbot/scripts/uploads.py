@@ -0,0 +1,228 @@
+"""Upload-Pipeline für Text- und CSS-Dateien.
+
+Uploads werden blockweise gelesen, dabei gehasht und gzip-komprimiert als
+inhaltsadressierte Blobs (`<BLOB_DIR>/<hash[:2]>/<hash>.gz`) abgelegt. Gleiche
+Dateien werden über alle Chatbots hinweg nur einmal gespeichert. Der
+Speicherbedarf bleibt dabei unabhängig von der Dateigröße.
+
+Nicht mehr benutzte Blobs werden nicht sofort gelöscht: ein paralleler Upload
+desselben Inhalts kann den Blob schon geschrieben oder wiederverwendet, seine
+Zeile aber noch nicht committet haben. Ein Job löscht sie frühestens nach
+`BLOB_GRACE_PERIOD` Sekunden, und nur, wenn sie seitdem niemand geschrieben hat.
+"""
+import codecs
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from db import ChatBotTextFile, Job, add_unique, db
+from utils import utcnow
+
+READ_BLOCK = 64 * 1024
+
+# Job kind of `release_blobs`, run by `delete_unused_blobs`
+RELEASE_JOB = 'release_blobs'
+
+# Byte order marks that decide the encoding on the first block
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Used when a file turns out not to be valid UTF-8
+FALLBACK_ENCODING = 'cp1252'
+
+
+class UploadError(Exception):
+    """An upload was rejected (too large, quota exceeded)."""
+
+
+class StoredBlob:
+    def __init__(self, hash, size, encoding):
+        self.hash = hash
+        self.size = size
+        self.encoding = encoding
+
+    def __repr__(self):
+        return f"<StoredBlob hash={self.hash[:12]} size={self.size} encoding={self.encoding}>"
+
+
+class EncodingDetector:
+    """Detects the text encoding while the upload is read block by block."""
+
+    def __init__(self):
+        self.encoding = None
+        self._decoder = None
+
+    def feed(self, block: bytes, final: bool = False):
+        if self.encoding is None:
+            self.encoding = next((enc for bom, enc in _BOMS if block.startswith(bom)), 'utf-8')
+            self._decoder = codecs.getincrementaldecoder(self.encoding)('strict')
+        if self.encoding == FALLBACK_ENCODING:
+            return
+        try:
+            self._decoder.decode(block, final=final)
+        except UnicodeDecodeError:
+            self.encoding = FALLBACK_ENCODING
+
+
+def blob_dir() -> str:
+    return current_app.config.get('BLOB_DIR') or os.path.join(current_app.instance_path, 'blobs')
+
+
+def blob_path(blob_hash: str) -> str:
+    return os.path.join(blob_dir(), blob_hash[:2], f'{blob_hash}.gz')
+
+
+class BlobWriter:
+    """Writes one blob block by block: hashes, detects the encoding and compresses on the way."""
+
+    def __init__(self, name: str = '', max_size: int | None = None):
+        self.name = name
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._detector = EncodingDetector()
+        os.makedirs(blob_dir(), exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=blob_dir(), suffix='.tmp')
+        self._raw = os.fdopen(fd, 'wb')
+        self._out = gzip.GzipFile(fileobj=self._raw, mode='wb', mtime=0)
+
+    def write(self, block: bytes):
+        self.size += len(block)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadError(f'Datei {self.name} ist zu groß (max. {self.max_size // 1024} KB).')
+        self._digest.update(block)
+        self._detector.feed(block)
+        self._out.write(block)
+
+    def close(self) -> StoredBlob:
+        """Finish the blob and move it into the store (or drop it if the content is already stored)."""
+        try:
+            self._detector.feed(b'', final=True)
+            self._out.close()
+            self._raw.close()
+            blob_hash = self._digest.hexdigest()
+            path = blob_path(blob_hash)
+            if os.path.exists(path):
+                # same content already stored (possibly by another chatbot); touching it starts a new grace
+                # period, a release job queued before must not delete it while this upload commits
+                os.utime(path)
+                os.remove(self._tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self._tmp_path, path)
+        except BaseException:
+            self.abort()
+            raise
+        return StoredBlob(blob_hash, self.size, self._detector.encoding or 'utf-8')
+
+    def abort(self):
+        self._out.close()
+        self._raw.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def store_upload(file_storage, max_size: int | None = None) -> StoredBlob:
+    """Stream an uploaded file into the blob store and return hash, size and encoding."""
+    writer = BlobWriter(file_storage.filename, max_size or current_app.config['MAX_UPLOAD_FILE_SIZE'])
+    try:
+        while True:
+            block = file_storage.stream.read(READ_BLOCK)
+            if not block:
+                break
+            writer.write(block)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def iter_blob_bytes(blob_hash: str):
+    """Yield the raw (uncompressed) bytes of a blob block by block."""
+    with gzip.open(blob_path(blob_hash), 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            yield block
+
+
+def read_upload_text(file_storage, max_size: int) -> str:
+    """Read a small upload (e.g. CSS) into a string, rejecting it beyond `max_size` bytes."""
+    data = file_storage.stream.read(max_size + 1)
+    if len(data) > max_size:
+        raise UploadError(f'Datei {file_storage.filename} ist zu groß (max. {max_size // 1024} KB).')
+    return data.decode('utf-8', errors='replace')
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def iter_blob_text(blob_hash: str, encoding: str):
+    """Yield the decoded text of a blob block by block."""
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    for block in iter_blob_bytes(blob_hash):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_file_text(text_file):
+    """Text of a `ChatBotTextFile`, from the blob store or (older uploads) the database."""
+    if text_file.blob_hash:
+        yield from iter_blob_text(text_file.blob_hash, text_file.encoding or 'utf-8')
+    elif text_file.content:
+        yield text_file.content
+
+
+def check_bot_quota(chatbot_id: str, additional: int):
+    """Raise if the text files of a chatbot would exceed `MAX_BOT_UPLOAD_SIZE`."""
+    quota = current_app.config['MAX_BOT_UPLOAD_SIZE']
+    used = db.session.query(func.coalesce(func.sum(ChatBotTextFile.size), 0)).filter(
+        ChatBotTextFile.chatbot_id == chatbot_id
+    ).scalar()
+    if used + additional > quota:
+        raise UploadError(f'Speicherplatz für diesen Chatbot erschöpft (max. {quota // (1024 * 1024)} MB).')
+
+
+def release_blobs(blob_hashes):
+    """Queue the deletion of blobs that may have lost their last text file (call after the commit or rollback).
+
+    The job runs after `BLOB_GRACE_PERIOD` seconds, see `delete_unused_blobs`.
+    """
+    blob_hashes = sorted(set(h for h in blob_hashes if h))
+    if not blob_hashes:
+        return
+    grace = current_app.config['BLOB_GRACE_PERIOD']
+    add_unique(Job(kind=RELEASE_JOB, payload=json.dumps({'blob_hashes': blob_hashes}),
+                   run_after=utcnow() + timedelta(seconds=grace)))
+    db.session.commit()
+
+
+def delete_unused_blobs(blob_hashes, grace: float):
+    """Delete the blob files no text file refers to and nobody wrote or reused in the last `grace` seconds."""
+    referenced = {h for (h,) in db.session.query(ChatBotTextFile.blob_hash).filter(
+        ChatBotTextFile.blob_hash.in_(blob_hashes)
+    ).distinct()}
+    cutoff = time.time() - grace
+    for blob_hash in set(blob_hashes) - referenced:
+        path = blob_path(blob_hash)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,492 @@
+"""HTTP-Client für den LLM-Upstream (OpenAI-kompatibel).
+
+Hält Keep-Alive-Verbindungen in einem Pool, wiederholt 429/5xx-Antworten mit
+exponentiellem Backoff (unter Beachtung von `Retry-After`) und öffnet einen
+Circuit Breaker, wenn der Upstream dauerhaft gestört ist. `AsyncUpstreamClient`
+ist die asyncio-Variante für den asynchronen Chat-Pfad (`asgi.py`). Über `observer`
+bekommen beide die Zeiten jedes Aufrufs (`UpstreamTiming`, z.B. für Metriken).
+"""
+import asyncio
+import http.client
+import json
+import random
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """The upstream could not deliver an answer (after all retries)."""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open, the upstream is not called at all."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` failed calls in a row and lets one
+    trial call through (half-open) once `reset_timeout` seconds have passed."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait according to a `Retry-After` header (seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class UpstreamTiming:
+    """Timing of one call in seconds.
+
+    `connect` and `ttfb` (request sent -> response headers) are those of the attempt that got the
+    response, `total` covers all attempts until the body was read. `outcome`: ok, error or circuit_open.
+    """
+
+    def __init__(self, client: str, stream: bool):
+        self.client = client
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.connect = 0.0
+        self.ttfb = None
+        self.total = None
+        self.outcome = None
+
+    def __repr__(self):
+        return f"<UpstreamTiming {self.client} {self.outcome} connect={self.connect} ttfb={self.ttfb} total={self.total}>"
+
+
+class _BaseClient:
+    """Settings and retry policy shared by the sync and the async client."""
+
+    kind = None
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = '',
+        pool_size: int = 4,
+        timeout: float = 15.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        breaker: CircuitBreaker | None = None,
+        observer=None,
+    ):
+        parts = urlsplit(base_url.rstrip('/'))
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == 'https' else 80)
+        self.base_path = parts.path
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.observer = observer  # called with the `UpstreamTiming` of every call
+
+    def _finish(self, timing: UpstreamTiming, outcome: str):
+        timing.total = time.perf_counter() - timing.started
+        timing.outcome = outcome
+        if self.observer is not None:
+            self.observer(timing)
+
+    def _headers(self, stream: bool) -> dict:
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream' if stream else 'application/json',
+        }
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def _delay(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay * (0.5 + random.random() / 2)
+
+
+class UpstreamClient(_BaseClient):
+    kind = 'sync'
+
+    def __init__(self, base_url: str, api_key: str = '', pool_size: int = 4, **kwargs):
+        super().__init__(base_url, api_key, pool_size, **kwargs)
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    # -- connection pool -------------------------------------------------
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise UpstreamError('connection pool exhausted')
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._new_connection()
+
+    def _release(self, conn, reuse: bool):
+        if reuse:
+            with self._idle_lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    # -- requests ----------------------------------------------------------
+
+    def _send(self, path: str, payload: dict, stream: bool):
+        """Send the request with retries; returns (conn, response, timing) with status 2xx."""
+        timing = UpstreamTiming(self.kind, stream)
+        if not self.breaker.allow():
+            self._finish(timing, 'circuit_open')
+            raise CircuitOpenError('upstream circuit is open')
+
+        body = json.dumps(payload).encode('utf-8')
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            timing.attempts += 1
+            try:
+                # pool exhausted: counts as a failed attempt, so a half-open breaker gets its result
+                conn = self._acquire()
+            except UpstreamError as e:
+                last_error = e
+            else:
+                try:
+                    timing.connect = 0.0
+                    if conn.sock is None:
+                        started = time.perf_counter()
+                        conn.connect()
+                        timing.connect = time.perf_counter() - started
+                    sent = time.perf_counter()
+                    conn.request('POST', self.base_path + path, body=body, headers=self._headers(stream))
+                    resp = conn.getresponse()
+                    timing.ttfb = time.perf_counter() - sent
+                except (OSError, http.client.HTTPException) as e:
+                    # stale keep-alive connection or network error: retry with a fresh one
+                    self._release(conn, reuse=False)
+                    last_error = e
+                else:
+                    if 200 <= resp.status < 300:
+                        return conn, resp, timing
+                    resp.read()
+                    self._release(conn, reuse=not resp.will_close)
+                    last_error = UpstreamError(f'upstream returned HTTP {resp.status}')
+                    if resp.status not in RETRY_STATUS:
+                        # the upstream is reachable, the request itself is wrong (e.g. 401)
+                        self.breaker.record_success()
+                        self._finish(timing, 'error')
+                        raise last_error
+                    retry_after = parse_retry_after(resp.getheader('Retry-After'))
+
+            if attempt < self.max_retries:
+                time.sleep(self._delay(attempt, retry_after))
+
+        self.breaker.record_failure()
+        self._finish(timing, 'error')
+        raise UpstreamError(str(last_error)) from last_error
+
+    def post_json(self, path: str, payload: dict) -> dict:
+        conn, resp, timing = self._send(path, payload, stream=False)
+        try:
+            data = json.loads(resp.read().decode('utf-8'))
+        except Exception as e:
+            self._release(conn, reuse=False)
+            self.breaker.record_failure()
+            self._finish(timing, 'error')
+            raise UpstreamError(f'invalid upstream response: {e}') from e
+        self._release(conn, reuse=not resp.will_close)
+        self.breaker.record_success()
+        self._finish(timing, 'ok')
+        return data
+
+    def stream_lines(self, path: str, payload: dict):
+        """Yield the decoded lines of a streaming (SSE) response.
+
+        The connection only goes back to the pool if the caller reads the stream to the end.
+        """
+        conn, resp, timing = self._send(path, payload, stream=True)
+        self.breaker.record_success()
+        complete = False
+        try:
+            for raw in resp:
+                yield raw.decode('utf-8')
+            complete = True
+        except (OSError, http.client.HTTPException) as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f'upstream stream interrupted: {e}') from e
+        finally:
+            self._release(conn, reuse=complete and not resp.will_close)
+            self._finish(timing, 'ok' if complete else 'error')
+
+
+class _AsyncConnection:
+    def __init__(self, reader, writer, connect_time: float = 0.0):
+        self.reader = reader
+        self.writer = writer
+        self.connect_time = connect_time  # setup time, reported with the first request only
+
+    def close(self):
+        self.writer.close()
+
+
+class _AsyncResponse:
+    def __init__(self, status: int, headers: dict, reader):
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self._chunked = chunked
+        self._remaining = None if chunked else (
+            int(headers['content-length']) if 'content-length' in headers else None
+        )
+        self.will_close = headers.get('connection', '').lower() == 'close' or (
+            not chunked and self._remaining is None
+        )
+
+    async def iter_body(self):
+        """Yield the body in blocks (handles chunked, content-length and read-until-close)."""
+        reader = self._reader
+        if self._chunked:
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # trailers until the empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readline()
+        elif self._remaining is not None:
+            while self._remaining > 0:
+                block = await reader.read(min(self._remaining, 64 * 1024))
+                if not block:
+                    raise ConnectionError('connection closed before the body was complete')
+                self._remaining -= len(block)
+                yield block
+        else:
+            while True:
+                block = await reader.read(64 * 1024)
+                if not block:
+                    return
+                yield block
+
+    async def read(self) -> bytes:
+        return b''.join([block async for block in self.iter_body()])
+
+
+class AsyncUpstreamClient(_BaseClient):
+    """asyncio variant of `UpstreamClient` (stdlib only): many in-flight calls share one thread.
+
+    Must always be used from the same event loop.
+    """
+
+    kind = 'async'
+
+    def __init__(self, base_url: str, api_key: str = '', pool_size: int = 16, **kwargs):
+        super().__init__(base_url, api_key, pool_size, **kwargs)
+        self._idle = []
+        self._slots = asyncio.Semaphore(pool_size)
+        self._ssl = ssl.create_default_context() if self.scheme == 'https' else None
+
+    # -- connection pool -------------------------------------------------
+
+    async def _acquire(self):
+        await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        if self._idle:
+            return self._idle.pop()
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self._ssl), self.timeout
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        return _AsyncConnection(reader, writer, time.perf_counter() - started)
+
+    def _release(self, conn, reuse: bool):
+        if reuse:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    # -- requests ----------------------------------------------------------
+
+    async def _roundtrip(self, conn, path: str, body: bytes, stream: bool) -> _AsyncResponse:
+        headers = self._headers(stream)
+        headers.update({'Host': self.host, 'Content-Length': str(len(body)), 'Connection': 'keep-alive'})
+        head = f'POST {self.base_path + path} HTTP/1.1\r\n'
+        head += ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n'
+        conn.writer.write(head.encode('latin-1') + body)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by upstream')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return _AsyncResponse(status, response_headers, conn.reader)
+
+    async def _send(self, path: str, payload: dict, stream: bool):
+        """Send the request with retries; returns (conn, response, timing) with status 2xx."""
+        timing = UpstreamTiming(self.kind, stream)
+        if not self.breaker.allow():
+            self._finish(timing, 'circuit_open')
+            raise CircuitOpenError('upstream circuit is open')
+
+        body = json.dumps(payload).encode('utf-8')
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            timing.attempts += 1
+            try:
+                conn = await self._acquire()
+            except (OSError, asyncio.TimeoutError) as e:
+                last_error = e
+            else:
+                timing.connect, conn.connect_time = conn.connect_time, 0.0
+                try:
+                    sent = time.perf_counter()
+                    resp = await asyncio.wait_for(self._roundtrip(conn, path, body, stream), self.timeout)
+                    timing.ttfb = time.perf_counter() - sent
+                except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    # stale keep-alive connection or network error: retry with a fresh one
+                    self._release(conn, reuse=False)
+                    last_error = e
+                else:
+                    if 200 <= resp.status < 300:
+                        return conn, resp, timing
+                    await resp.read()
+                    self._release(conn, reuse=not resp.will_close)
+                    last_error = UpstreamError(f'upstream returned HTTP {resp.status}')
+                    if resp.status not in RETRY_STATUS:
+                        # the upstream is reachable, the request itself is wrong (e.g. 401)
+                        self.breaker.record_success()
+                        self._finish(timing, 'error')
+                        raise last_error
+                    retry_after = parse_retry_after(resp.headers.get('retry-after'))
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._delay(attempt, retry_after))
+
+        self.breaker.record_failure()
+        self._finish(timing, 'error')
+        raise UpstreamError(str(last_error)) from last_error
+
+    async def post_json(self, path: str, payload: dict) -> dict:
+        conn, resp, timing = await self._send(path, payload, stream=False)
+        try:
+            data = json.loads((await asyncio.wait_for(resp.read(), self.timeout)).decode('utf-8'))
+        except Exception as e:
+            self._release(conn, reuse=False)
+            self.breaker.record_failure()
+            self._finish(timing, 'error')
+            raise UpstreamError(f'invalid upstream response: {e}') from e
+        self._release(conn, reuse=not resp.will_close)
+        self.breaker.record_success()
+        self._finish(timing, 'ok')
+        return data
+
+    async def stream_lines(self, path: str, payload: dict):
+        """Yield the decoded lines of a streaming (SSE) response."""
+        conn, resp, timing = await self._send(path, payload, stream=True)
+        self.breaker.record_success()
+        complete = False
+        buffer = b''
+        try:
+            async for block in resp.iter_body():
+                buffer += block
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    yield line.decode('utf-8') + '\n'
+            if buffer:
+                yield buffer.decode('utf-8')
+            complete = True
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f'upstream stream interrupted: {e}') from e
+        finally:
+            self._release(conn, reuse=complete and not resp.will_close)
+            self._finish(timing, 'ok' if complete else 'error')
@@ -1,34 +1,120 @@
-import secrets
 import hashlib
-import uuid
+import hmac
+import os
+import secrets
 import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+# Password hashes are stored as "$<scheme>$<params>$<salt>$<hash>", so the algorithm
+# and its cost can change without breaking existing accounts (see `needs_rehash`).
+# Hashes without a "$" prefix are the old format: PBKDF2-SHA256, 100k iterations, salt in `User.salt`.
+PASSWORD_SCHEME = os.environ.get('PASSWORD_SCHEME', 'scrypt')
+PASSWORD_PARAMS = {
+    'scrypt': {'n': int(os.environ.get('SCRYPT_N', 2 ** 14)), 'r': 8, 'p': 1},
+    'pbkdf2-sha256': {'i': int(os.environ.get('PBKDF2_ITERATIONS', 600_000))},
+}
+LEGACY_PBKDF2_ITERATIONS = 100_000
+
+def _derive(scheme: str, params: dict, password: str, salt: str) -> str:
+    if scheme == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(
+            password.encode('utf-8'), salt=salt.encode('utf-8'), n=n, r=r, p=p, maxmem=256 * n * r, dklen=32
+        ).hex()
+    if scheme == 'pbkdf2-sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), params['i']).hex()
+    raise ValueError(f'unknown password scheme: {scheme}')
+
+def _parse(stored: str):
+    """(scheme, params, salt, hash) of a stored password hash."""
+    _, scheme, params, salt, hash_hex = stored.split('$')
+    params = {k: int(v) for k, v in (item.split('=') for item in params.split(','))}
+    return scheme, params, salt, hash_hex
+
+def hash_password(password: str, scheme: str | None = None) -> str:
+    scheme = scheme or PASSWORD_SCHEME
+    params = PASSWORD_PARAMS[scheme]
+    salt = secrets.token_hex(16)
+    encoded_params = ','.join(f'{k}={v}' for k, v in params.items())
+    return f'${scheme}${encoded_params}${salt}${_derive(scheme, params, password, salt)}'
+
+def verify_password(stored_hash: str, salt: str, password: str) -> bool:
+    """Check `password`; `salt` is only used for hashes in the old format."""
+    if stored_hash.startswith('$'):
+        scheme, params, salt, hash_hex = _parse(stored_hash)
+    else:
+        scheme, params, hash_hex = 'pbkdf2-sha256', {'i': LEGACY_PBKDF2_ITERATIONS}, stored_hash
+    return hmac.compare_digest(_derive(scheme, params, password, salt), hash_hex)
+
+def needs_rehash(stored_hash: str) -> bool:
+    """True if the hash doesn't use the configured scheme and cost (rehash after a successful login)."""
+    if not stored_hash.startswith('$'):
+        return True
+    scheme, params, _, _ = _parse(stored_hash)
+    return scheme != PASSWORD_SCHEME or params != PASSWORD_PARAMS[scheme]
+
+# Ids are sortable by creation time: 10 characters milliseconds + 6 characters random (base32).
+# Within a process ids are strictly increasing, so inserts append to the end of the primary key index.
+ID_LENGTH = 16
+_ID_ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+_ID_RANDOM_BITS = 30
+
+def _base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(_ID_ALPHABET[index])
+    return ''.join(reversed(chars))
+
+class _IdGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def take(self, count: int) -> list[str]:
+        ids = []
+        with self._lock:
+            for _ in range(count):
+                ms = time.time_ns() // 1_000_000
+                if ms > self._last_ms:
+                    # headroom for the increments of further ids in the same millisecond
+                    random_part = secrets.randbits(_ID_RANDOM_BITS - 1)
+                else:
+                    ms, random_part = self._last_ms, self._last_random + 1
+                    if random_part >= 1 << _ID_RANDOM_BITS:
+                        ms, random_part = ms + 1, secrets.randbits(_ID_RANDOM_BITS - 1)
+                self._last_ms, self._last_random = ms, random_part
+                ids.append(_base32(ms, 10) + _base32(random_part, 6))
+        return ids
+
+_ids = _IdGenerator()
+
+def generate_id() -> str:
+    return _ids.take(1)[0]
+
+def generate_ids(count: int) -> list[str]:
+    """`count` increasing ids in one go (bulk inserts)."""
+    return _ids.take(count)
+
+def utcnow() -> datetime:
+    """Column default, evaluated for every row."""
+    return datetime.now(timezone.utc)
+
+def get_git_info(cwd: str | None = None):
+    def _git(*args):
+        try:
+            return subprocess.check_output(
+                ['git', *args], cwd=cwd, stderr=subprocess.DEVNULL
+            ).strip().decode('utf-8')
+        except (subprocess.CalledProcessError, OSError):
+            # Falls keine Tags existieren oder Git nicht verfügbar ist (z.B. im Container)
+            return None
 
-def hash_password(password: str, salt: str | None = None) -> tuple[str, str]:
-    if salt is None:
-        salt = secrets.token_hex(16)
-    hash_bytes = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100_000)
-    return hash_bytes.hex(), salt
-
-def verify_password(stored_hash_hex: str, salt: str, password: str) -> bool:
-    computed_hash, _ = hash_password(password, salt=salt)
-    return computed_hash == stored_hash_hex
-
-def generate_id6():
-    return str(uuid.uuid4())[:6]
-
-def generate_id8():
-    return str(uuid.uuid4())[:8]
-
-def get_git_info():
-    try:
-        commit_id = subprocess.check_output(
-            ['git', 'rev-parse', 'HEAD']
-        ).strip().decode('utf-8')
-        git_tag = subprocess.check_output(
-            ['git', 'describe', '--tags']
-        ).strip().decode('utf-8')
+    commit_id = _git('rev-parse', 'HEAD')
+    git_tag = _git('describe', '--tags') if commit_id else None
+    if git_tag:
         git_tag = git_tag.split('-')[0]   # nur der erste Teil = Sprint_2
-        return commit_id, git_tag
-    except subprocess.CalledProcessError:
-        # Falls keine Tags existieren oder Git nicht verfügbar ist
-        return None, None
+    return commit_id, git_tag
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+# read by main at import: no background threads or processes in tests
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('PASSWORD_WORKERS', '0')
+os.environ.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+os.environ.setdefault('CATALOG_CACHE_SIZE', '0')
+
+import main  # noqa: E402
+from db import User, create_database, db  # noqa: E402
+from utils import hash_password  # noqa: E402
+
+
+def make_app(tmp_path):
+    """An app on an SQLite database in `tmp_path` (the tables are not created)."""
+    return main.create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'BLOB_DIR': str(tmp_path / 'blobs'),
+        'JINJA_CACHE_DIR': str(tmp_path / 'jinja_cache'),
+    })
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        create_database()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_user(app, username: str) -> str:
+    with app.app_context():
+        user = User(username=username, password=hash_password('secret'))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login(client, app, username: str = 'admin') -> str:
+    """Log `client` in as `username` (created if missing), returns the user id."""
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        user_id = user.id if user else None
+    user_id = user_id or add_user(app, username)
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return user_id
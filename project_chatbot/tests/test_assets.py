@@ -0,0 +1,15 @@
+import pytest
+
+from assets import minify_css
+
+
+@pytest.mark.parametrize('css, expected', [
+    ('body { color : red }', 'body{color:red}'),
+    ('body {\n  color: red;\n  margin :0 ;\n}\n', 'body{color:red;margin:0}'),
+    # in a selector the space before the colon matters
+    ('div :hover { color : red }', 'div :hover{color:red}'),
+    ('a:hover { color: red }', 'a:hover{color:red}'),
+    ('p { content : " : " } /* Kommentar */', 'p{content:" : "}'),
+])
+def test_minify_css(css, expected):
+    assert minify_css(css) == expected
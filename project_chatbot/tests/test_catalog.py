@@ -0,0 +1,17 @@
+import pytest
+
+import main
+from conftest import login
+
+
+def test_catalog_error_is_not_hidden(app, client, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('database gone')
+
+    login(client, app)
+    monkeypatch.setattr(main, 'catalog_page', broken)
+    # an empty catalog would hide the error, it ends up in the log and as a 500
+    with pytest.raises(RuntimeError):
+        client.get('/catalog')
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    assert client.get('/catalog').status_code == 500
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+from conftest import login
+from db import ChatBot, User, db
+from instrumentation import assert_max_queries, count_queries
+from response_cache import MemoryCache
+
+
+@pytest.fixture
+def catalog_cache(monkeypatch):
+    cache = MemoryCache(ttl=600, max_entries=100)
+    monkeypatch.setattr(main, 'CATALOG_CACHE_SIZE', 100)
+    monkeypatch.setattr(main, 'catalog_cache', cache)
+    return cache
+
+
+def _add_chatbot(app, username: str, name: str):
+    with app.app_context():
+        user = User.query.filter_by(username=username).one()
+        db.session.add(ChatBot(user_id=user.id, name=name, systemprompt='Du bist hilfreich.'))
+        main.catalog_changed(user.id)
+        db.session.commit()
+
+
+def test_cached_page_needs_no_chatbot_query(app, client, catalog_cache):
+    login(client, app, 'user1')
+    _add_chatbot(app, 'user1', 'Bot A')
+    assert b'Bot A' in client.get('/catalog').data
+
+    with app.app_context(), count_queries(db.engine) as counter:
+        assert b'Bot A' in client.get('/catalog').data
+    assert catalog_cache.stats.hits == 1
+    assert not any('chatbots' in statement for statement in counter.statements)
+
+
+def test_write_of_another_process_is_seen(app, client, catalog_cache, monkeypatch):
+    login(client, app, 'user1')
+    login(app.test_client(), app, 'admin')
+    _add_chatbot(app, 'user1', 'Bot A')
+    assert b'Bot A' in client.get('/catalog').data
+
+    # another worker process: this process' cache is not invalidated, only the catalog version counts up
+    monkeypatch.setattr(catalog_cache, 'invalidate', lambda group: None)
+    _add_chatbot(app, 'user1', 'Bot B')
+    assert b'Bot B' in client.get('/catalog').data
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        assert admin.catalog_version == 2
+
+
+def test_disabled_cache_writes_no_version(app, client):
+    login(client, app, 'user1')
+    with app.app_context(), assert_max_queries(db.engine, 0):
+        main.catalog_changed(None)
+    _add_chatbot(app, 'user1', 'Bot A')
+    with app.app_context():
+        assert User.query.filter_by(username='user1').one().catalog_version is None
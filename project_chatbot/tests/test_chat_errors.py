@@ -0,0 +1,27 @@
+import logging
+
+import main
+from conftest import login
+from db import ChatBot, db
+from upstream import UpstreamError
+
+
+def test_upstream_error_is_logged(app, client, monkeypatch, caplog):
+    user_id = login(client, app)
+    with app.app_context():
+        chatbot = ChatBot(user_id=user_id, name='Bot', systemprompt='Du bist hilfreich.')
+        db.session.add(chatbot)
+        db.session.commit()
+        chatbot_id = chatbot.id
+
+    def fail(path, payload):
+        raise UpstreamError('upstream returned HTTP 503')
+
+    monkeypatch.setattr(main, 'open_ai_api_secret', 'key')
+    monkeypatch.setattr(main.llm_client, 'post_json', fail)
+    with caplog.at_level(logging.ERROR, logger=app.logger.name):
+        response = client.post(f'/cb/{chatbot_id}/send_json', json={'message': 'Hallo'})
+    assert response.status_code == 200
+    assert response.get_json()['bot']['text'] == main.fallback_answer('Hallo')
+    [record] = [r for r in caplog.records if r.getMessage() == 'Error calling OpenAI']
+    assert record.exc_info[0] is UpstreamError
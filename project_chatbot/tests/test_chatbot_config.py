@@ -0,0 +1,21 @@
+import auth
+from auth import get_chatbot_config
+from db import ChatBot, User, db
+
+
+def test_config_cache_is_bounded(app, monkeypatch):
+    monkeypatch.setattr(auth, 'CONFIG_CACHE_SIZE', 2)
+    monkeypatch.setattr(auth, '_configs', type(auth._configs)())
+    with app.app_context():
+        user = User.query.filter_by(username='admin').one()
+        chatbots = [ChatBot(user_id=user.id, name=f'Bot {i}', systemprompt='Du bist hilfreich.') for i in range(3)]
+        db.session.add_all(chatbots)
+        db.session.commit()
+        a, b, c = (chatbot.id for chatbot in chatbots)
+
+        get_chatbot_config(a)
+        get_chatbot_config(b)
+        get_chatbot_config(a)  # b is now the least recently used
+        get_chatbot_config(c)
+        assert list(auth._configs) == [a, c]
+        assert get_chatbot_config(b).name == 'Bot 1'
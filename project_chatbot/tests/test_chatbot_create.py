@@ -0,0 +1,37 @@
+import io
+
+from conftest import login
+from db import ChatBot, ChatBotTextFile, Job, db
+
+
+def test_failed_create_leaves_no_rows(app, client):
+    login(client, app)
+    app.config['MAX_UPLOAD_FILE_SIZE'] = 100
+    response = client.post('/chatbot/new', data={
+        'name': 'Bot',
+        'systemprompt': 'Du bist hilfreich.',
+        'text_files': [
+            (io.BytesIO(b'kurz'), 'a.txt'),
+            (io.BytesIO(b'x' * 1000), 'b.txt'),  # over MAX_UPLOAD_FILE_SIZE
+        ],
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert db.session.query(ChatBot).count() == 0
+        assert db.session.query(ChatBotTextFile).count() == 0
+        assert db.session.query(Job).filter_by(kind='index_text_file').count() == 0
+
+
+def test_create_with_text_file(app, client):
+    login(client, app)
+    client.post('/chatbot/new', data={
+        'name': 'Bot',
+        'systemprompt': 'Du bist hilfreich.',
+        'text_files': [(io.BytesIO(b'kurz'), 'a.txt')],
+    }, content_type='multipart/form-data')
+
+    with app.app_context():
+        assert db.session.query(ChatBot).count() == 1
+        assert db.session.query(ChatBotTextFile).count() == 1
+        assert db.session.query(Job).filter_by(kind='index_text_file').count() == 1
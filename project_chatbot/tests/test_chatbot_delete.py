@@ -0,0 +1,30 @@
+import io
+
+import main
+from conftest import login
+from db import ChatBot, ChatBotTerm, ChatBotTextChunk, ChatBotTextFile, db
+from instrumentation import assert_max_queries
+
+
+def test_delete_removes_index_in_bulk(app, client):
+    login(client, app)
+    text = ' '.join(f'wort{i % 3000} satz{i % 17}' for i in range(20000)).encode()
+    client.post('/chatbot/new', data={
+        'name': 'Bot',
+        'text_files': [(io.BytesIO(text), 'a.txt'), (io.BytesIO(text[:5000]), 'b.txt')],
+    }, content_type='multipart/form-data')
+    with app.app_context():
+        while main.job_queue.run_next():
+            pass
+        chatbot_id = db.session.query(ChatBot.id).scalar()
+        assert db.session.query(ChatBotTextChunk).count() > 20
+        assert db.session.query(ChatBotTerm).count() > 1000
+
+    # independent of the size of the index: no query per chunk
+    with app.app_context(), assert_max_queries(db.engine, 20):
+        response = client.post(f'/chatbot/{chatbot_id}/delete')
+    assert response.status_code == 302
+
+    with app.app_context():
+        for model in (ChatBot, ChatBotTextFile, ChatBotTextChunk, ChatBotTerm):
+            assert db.session.query(model).count() == 0
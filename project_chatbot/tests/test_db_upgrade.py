@@ -0,0 +1,83 @@
+import sqlite3
+
+import click
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import mssql, mysql, postgresql, sqlite
+
+from catalog_search import search_chatbots
+from conftest import make_app
+from db import ChatBot, db, widen_columns
+
+# schema of the first version: only users, chatbots and their files
+OLD_SCHEMA = """
+CREATE TABLE users (id VARCHAR(6) PRIMARY KEY, username VARCHAR(150) NOT NULL UNIQUE,
+                    password VARCHAR(255) NOT NULL, salt VARCHAR(255), created DATETIME NOT NULL);
+CREATE TABLE chatbots (id VARCHAR(8) PRIMARY KEY, user_id VARCHAR(6) REFERENCES users (id), name VARCHAR(255),
+                       systemprompt TEXT, welcomemessage TEXT, created DATETIME NOT NULL);
+CREATE TABLE chatbot_textfiles (id VARCHAR(8) PRIMARY KEY, chatbot_id VARCHAR(8) NOT NULL REFERENCES chatbots (id),
+                                filename VARCHAR(255) NOT NULL, content TEXT NOT NULL, created DATETIME NOT NULL);
+CREATE TABLE chatbot_cssfiles (id VARCHAR(8) PRIMARY KEY, chatbot_id VARCHAR(8) NOT NULL UNIQUE REFERENCES chatbots (id),
+                               filename VARCHAR(255) NOT NULL, content TEXT NOT NULL, created DATETIME NOT NULL);
+INSERT INTO users VALUES ('u00001', 'anna', 'x', 's', '2024-01-01 00:00:00');
+INSERT INTO chatbots VALUES ('b0000001', 'u00001', 'Kochbot', 'Du kochst.', 'Hallo', '2024-01-02 00:00:00');
+"""
+
+
+def test_migrate_old_database(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'test.db')
+    connection.executescript(OLD_SCHEMA)
+    connection.close()
+
+    app = make_app(tmp_path)
+    result = app.test_cli_runner().invoke(args=['db', 'migrate'])
+    assert result.exit_code == 0, result.output
+    assert 'Datenbank aktualisiert' in result.output
+
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        assert {'conversations', 'messages', 'jobs', 'chatbot_textchunks', 'chatbot_search'} <= tables
+        assert db.session.get(ChatBot, 'b0000001').prompt_preview == 'Du kochst.'
+        rows, _ = search_chatbots('koch')
+        assert [chatbot.name for chatbot, _ in rows] == ['Kochbot']
+        db.engine.dispose()
+
+
+def old_columns(tmp_path) -> dict:
+    connection = sqlite3.connect(tmp_path / 'old.db')
+    connection.executescript(OLD_SCHEMA)
+    connection.close()
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    inspector = inspect(engine)
+    columns = {name: {c['name']: c for c in inspector.get_columns(name)} for name in inspector.get_table_names()}
+    engine.dispose()
+    return columns
+
+
+def widen_all(columns: dict, dialect) -> list:
+    return [statement for table in db.metadata.sorted_tables if table.name in columns
+            for statement in widen_columns(table, columns[table.name], dialect)]
+
+
+def test_widen_old_ids_on_postgresql(tmp_path):
+    statements = widen_all(old_columns(tmp_path), postgresql.dialect())
+    assert 'ALTER TABLE users ALTER COLUMN id TYPE VARCHAR(16)' in statements
+    assert 'ALTER TABLE chatbots ALTER COLUMN id TYPE VARCHAR(16)' in statements
+    assert 'ALTER TABLE chatbots ALTER COLUMN user_id TYPE VARCHAR(16)' in statements
+    assert 'ALTER TABLE chatbot_textfiles ALTER COLUMN chatbot_id TYPE VARCHAR(16)' in statements
+    assert not [s for s in statements if 'username' in s or 'filename' in s]  # already long enough
+
+
+def test_widen_old_ids_on_mysql(tmp_path):
+    statements = widen_all(old_columns(tmp_path), mysql.dialect())
+    assert 'ALTER TABLE chatbot_cssfiles MODIFY chatbot_id VARCHAR(16) NOT NULL' in statements
+    assert 'ALTER TABLE chatbots MODIFY user_id VARCHAR(16) NULL' in statements
+
+
+def test_widen_nothing_on_sqlite(tmp_path):
+    assert widen_all(old_columns(tmp_path), sqlite.dialect()) == []
+
+
+def test_widen_refuses_other_databases(tmp_path):
+    with pytest.raises(click.ClickException, match='users.id'):
+        widen_all(old_columns(tmp_path), mssql.dialect())
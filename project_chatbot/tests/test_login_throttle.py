@@ -0,0 +1,45 @@
+from auth import LoginThrottle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_blocks_after_limit(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('auth.time.monotonic', clock)
+    throttle = LoginThrottle(per_ip=20, per_username=3, window=60)
+    for _ in range(3):
+        assert not throttle.blocked('1.2.3.4', 'Anna')
+        throttle.failed('1.2.3.4', 'Anna')
+    assert throttle.blocked('5.6.7.8', 'anna')
+    clock.now += 61
+    assert not throttle.blocked('5.6.7.8', 'anna')
+
+
+def test_expired_keys_are_dropped(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('auth.time.monotonic', clock)
+    throttle = LoginThrottle(per_ip=20, per_username=5, window=60)
+    for i in range(1000):
+        throttle.failed(f'10.0.{i // 256}.{i % 256}', f'user{i}')
+    assert len(throttle._failures) == 2000
+
+    clock.now += 61
+    throttle.failed('1.2.3.4', 'anna')
+    assert len(throttle._failures) == 2
+
+
+def test_key_count_is_capped(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('auth.time.monotonic', clock)
+    throttle = LoginThrottle(per_ip=20, per_username=5, window=60, max_keys=100)
+    for i in range(1000):
+        throttle.failed('1.2.3.4', f'user{i}')
+    assert len(throttle._failures) == 100
+    # the attacking IP failed last, it is kept and stays blocked
+    assert throttle.blocked('1.2.3.4', 'someone')
@@ -0,0 +1,12 @@
+def test_metrics_closed_without_token(app, client):
+    assert app.config['METRICS_TOKEN'] == ''
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_with_token(app, client):
+    app.config['METRICS_TOKEN'] = 'geheim'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer falsch'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer geheim'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
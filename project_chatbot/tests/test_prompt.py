@@ -0,0 +1,37 @@
+from prompt import PromptBuilder
+
+
+def turn(builder, messages, summary, summary_upto):
+    """One chat turn like main.build_prompt: only messages after `summary_upto` are loaded."""
+    history = [m for m in messages if m['id'] > summary_upto]
+    return builder.build('Du bist hilfreich.', [], history, summary=summary, summary_upto=summary_upto)
+
+
+def test_summary_kept_on_consecutive_turns():
+    builder = PromptBuilder(budget=400, reserve=0)
+    messages = [
+        {'id': i, 'role': 'user' if i % 2 else 'assistant', 'text': f'Nachricht {i} ' + 'wort ' * 20}
+        for i in range(1, 21)
+    ]
+
+    first = turn(builder, messages, '', 0)
+    assert first.summary and first.summary_upto > 0
+    assert any(m['content'].startswith('Summary of') for m in first.messages)
+
+    # short follow-ups: the summary stays in the prompt, also on turns where nothing leaves the window
+    built, unchanged = first, 0
+    for i in range(22, 32):
+        messages.append({'id': i, 'role': 'user' if i % 2 else 'assistant', 'text': 'Und weiter?'})
+        previous, built = built, turn(builder, messages, built.summary, built.summary_upto)
+        unchanged += built.summary_upto == previous.summary_upto
+        summaries = [m['content'] for m in built.messages if m['content'].startswith('Summary of')]
+        assert summaries == [f"Summary of the earlier conversation:\n{built.summary}"]
+        assert built.messages[-1]['content'] == 'Und weiter?'
+    assert unchanged
+
+
+def test_no_summary_for_short_conversation():
+    builder = PromptBuilder(budget=3000, reserve=300)
+    built = turn(builder, [{'id': 1, 'role': 'user', 'text': 'Hallo'}], '', 0)
+    assert built.summary == ''
+    assert [m['role'] for m in built.messages] == ['system', 'user']
@@ -0,0 +1,38 @@
+"""Query budgets of the list pages: the count must not grow with the number of chatbots (N+1)."""
+import pytest
+
+from conftest import login
+from db import ChatBot, ChatBotCssFile, ChatBotTextFile, User, db
+from instrumentation import assert_max_queries
+
+
+@pytest.fixture
+def chatbots(app):
+    with app.app_context():
+        for i in range(3):
+            user = User(username=f'user{i}', password='x')
+            db.session.add(user)
+            db.session.flush()
+            for j in range(10):
+                chatbot = ChatBot(user_id=user.id, name=f'Bot {i}-{j}', systemprompt='Du bist hilfreich.')
+                db.session.add(chatbot)
+                db.session.flush()
+                db.session.add(ChatBotTextFile(chatbot_id=chatbot.id, filename='a.txt', content='Text'))
+                db.session.add(ChatBotCssFile(chatbot_id=chatbot.id, filename='a.css', content='body{}'))
+        db.session.commit()
+
+
+def test_admin_catalog(app, client, chatbots):
+    login(client, app, 'admin')
+    with app.app_context(), assert_max_queries(db.engine, 2):
+        response = client.get('/catalog')
+    assert response.status_code == 200
+    assert b'Bot 2-9' in response.data
+
+
+def test_profile(app, client, chatbots):
+    login(client, app, 'user1')
+    with app.app_context(), assert_max_queries(db.engine, 2):
+        response = client.get('/profile')
+    assert response.status_code == 200
+    assert '<strong>Anzahl Chatbots:</strong> 10' in response.get_data(as_text=True)
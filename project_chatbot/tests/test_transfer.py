@@ -0,0 +1,75 @@
+import base64
+import gzip
+import io
+import json
+
+import main
+import transfer
+from conftest import login
+from db import ChatBot, ChatBotTextChunk, ChatBotTextFile, Job, User, db
+
+
+def archive(chatbots: int = 3, token_budget=None) -> bytes:
+    records = [{'type': 'header', 'format': 'chatbots', 'version': 1}]
+    for i in range(chatbots):
+        records.append({'type': 'chatbot', 'id': f'old{i}', 'owner': 'admin', 'name': f'Bot {i}',
+                        'systemprompt': 'Du bist hilfreich.', 'created': '2024-01-02T00:00:00',
+                        'token_budget': token_budget})
+        records.append({'type': 'textfile', 'id': f'file{i}', 'chatbot': f'old{i}', 'filename': 'a.txt',
+                        'created': '2024-01-02T00:00:00'})
+        records.append({'type': 'data', 'textfile': f'file{i}',
+                        'data': base64.b64encode(f'Inhalt der Datei {i} über Pilze'.encode()).decode()})
+    records.append({'type': 'end', 'chatbots': chatbots})
+    return gzip.compress(''.join(json.dumps(r) + '\n' for r in records).encode())
+
+
+def test_web_import_queues_indexing(app, client):
+    login(client, app)
+    response = client.post('/chatbots/import', data={'archive': (io.BytesIO(archive()), 'export.ndjson.gz')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        text_files = db.session.query(ChatBotTextFile).all()
+        assert len(text_files) == 3
+        # nothing indexed in the request, one job per file
+        assert db.session.query(ChatBotTextChunk).count() == 0
+        jobs = db.session.query(Job).filter_by(kind='index_text_file', status='queued').all()
+        assert sorted(job.target_id for job in jobs) == sorted(f.id for f in text_files)
+
+        while main.job_queue.run_next():
+            pass
+        assert db.session.query(Job).filter_by(status='done').count() == 3
+        assert db.session.query(ChatBotTextChunk).count() >= 3
+
+
+def test_import_draws_ids_per_batch(app, monkeypatch):
+    calls = []
+
+    def generate_ids(count):
+        calls.append(count)
+        return original(count)
+
+    original = transfer.generate_ids
+    monkeypatch.setattr(transfer, 'generate_ids', generate_ids)
+    with app.app_context():
+        admin_id = db.session.query(User.id).filter_by(username='admin').scalar()
+        result = transfer.import_archive(io.BytesIO(archive(4)), admin_id, batch=5, index=False)
+        assert result.chatbots == 4 and result.text_files == 4
+        ids = [row.id for row in db.session.query(ChatBot.id).order_by(ChatBot.name)]
+        assert len(set(ids)) == 4 and ids == sorted(ids)
+    assert calls == [5, 5]  # 4 chatbots + 4 text files
+
+
+def test_import_ignores_invalid_token_budget(app, client):
+    login(client, app, 'anna')
+    for token_budget in ('abc', 100, [1], 2000):
+        client.post('/chatbots/import', data={'archive': (io.BytesIO(archive(1, token_budget)), 'export.ndjson.gz')},
+                    content_type='multipart/form-data')
+
+    with app.app_context():
+        chatbots = db.session.query(ChatBot).order_by(ChatBot.id).all()
+        assert [chatbot.token_budget for chatbot in chatbots] == [None, None, None, 2000]
+        chatbot_id = chatbots[0].id
+    response = client.post(f'/cb/{chatbot_id}/send_json', json={'message': 'Hallo'})
+    assert response.status_code == 200
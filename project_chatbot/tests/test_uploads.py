@@ -0,0 +1,56 @@
+import io
+import os
+import time
+
+import main
+from conftest import login
+from db import Job, db
+from uploads import BlobWriter, blob_path, content_hash, delete_unused_blobs
+
+
+def _store(data: bytes) -> str:
+    writer = BlobWriter('a.txt')
+    writer.write(data)
+    return writer.close().hash
+
+
+def _age(path: str, seconds: float):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_rolled_back_blob_is_deleted_after_grace_period(app, client):
+    login(client, app)
+    app.config['MAX_UPLOAD_FILE_SIZE'] = 100
+    client.post('/chatbot/new', data={
+        'name': 'Bot',
+        'text_files': [(io.BytesIO(b'kurz'), 'a.txt'), (io.BytesIO(b'x' * 1000), 'b.txt')],
+    }, content_type='multipart/form-data')
+
+    with app.app_context():
+        path = blob_path(content_hash('kurz'))
+        # not deleted on rollback, a concurrent upload of the same content could be using it
+        assert os.path.exists(path)
+        assert not main.job_queue.run_next()
+
+        job = db.session.query(Job).filter_by(kind='release_blobs').one()
+        job.run_after = job.created
+        db.session.commit()
+        _age(path, app.config['BLOB_GRACE_PERIOD'] + 1)
+        assert main.job_queue.run_next()
+        assert not os.path.exists(path)
+
+
+def test_reused_blob_outlives_release(app):
+    with app.app_context():
+        blob_hash = _store(b'gleicher Inhalt')
+        path = blob_path(blob_hash)
+        _age(path, 120)
+        # another upload of the same content, its row is not committed yet
+        assert _store(b'gleicher Inhalt') == blob_hash
+        delete_unused_blobs([blob_hash], 60)
+        assert os.path.exists(path)
+
+        _age(path, 120)
+        delete_unused_blobs([blob_hash], 60)
+        assert not os.path.exists(path)
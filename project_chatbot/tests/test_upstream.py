@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+import mock_llm
+from upstream import CircuitBreaker, UpstreamClient, UpstreamError
+
+PAYLOAD = {'model': 'gpt-3.5-turbo', 'messages': [{'role': 'user', 'content': 'Hallo'}]}
+
+
+@pytest.fixture
+def server():
+    server = mock_llm.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/v1'
+    server.shutdown()
+    server.server_close()
+
+
+def test_pool_exhausted_in_half_open_state(server):
+    timings = []
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client = UpstreamClient(server, pool_size=1, timeout=0.05, max_retries=1, backoff=0,
+                            breaker=breaker, observer=timings.append)
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+
+    client._slots.acquire()  # all connections busy
+    with pytest.raises(UpstreamError, match='pool exhausted'):
+        client.post_json('/chat/completions', PAYLOAD)
+    assert [t.outcome for t in timings] == ['error']
+    assert timings[0].attempts == 2
+
+    # the trial call was recorded: the next call is let through and closes the breaker
+    client._slots.release()
+    assert client.post_json('/chat/completions', PAYLOAD)['choices']
+    assert breaker.state == 'closed'
+    assert [t.outcome for t in timings] == ['error', 'ok']
+    client.close()